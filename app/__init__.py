@@ -23,6 +23,104 @@ def keep_db_alive():
         print("✅ Ping a BD ejecutado - Neon activa")
     except Exception as e:
         print(f"⚠️ Error en ping a BD: {e}")
+
+def limpiar_carritos_job(app):
+    """Borra carritos cerrados y abandonados según la retención configurada"""
+    from app.services.carrito import limpiar_carritos
+    with app.app_context():
+        try:
+            reporte = limpiar_carritos(
+                app.config['CARRITO_RETENCION_INACTIVOS_DIAS'],
+                app.config['CARRITO_RETENCION_ABANDONADOS_DIAS'],
+                lote=app.config['CARRITO_LIMPIEZA_LOTE']
+            )
+            print(f"🧹 Limpieza de carritos: {reporte['carritos_inactivos']} cerrados, "
+                  f"{reporte['carritos_abandonados']} abandonados, {reporte['items']} items "
+                  f"({reporte['lotes']} lotes)")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Error limpiando carritos: {e}")
+        finally:
+            db.session.remove()
+
+def liberar_reservas_job(app):
+    """Borra las reservas de stock vencidas para que el catálogo vuelva a mostrar esas unidades"""
+    from app.services.inventario import limpiar_reservas_vencidas
+    with app.app_context():
+        try:
+            borradas = limpiar_reservas_vencidas()
+            if borradas:
+                print(f"🧹 Reservas de stock vencidas liberadas: {borradas}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Error liberando reservas de stock: {e}")
+        finally:
+            db.session.remove()
+
+def snapshot_inventario_job(app):
+    """Materializa el stock por producto desde el registro de movimientos"""
+    from app.services.movimientos import compactar_inventario
+    with app.app_context():
+        try:
+            escritos = compactar_inventario(app.config['INVENTARIO_SNAPSHOT_MARGEN_SEGUNDOS'])
+            if escritos:
+                print(f"📸 Snapshot de inventario: {escritos} productos")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Error generando snapshot de inventario: {e}")
+        finally:
+            db.session.remove()
+
+def limpiar_idempotencia_job(app):
+    """Borra las claves Idempotency-Key vencidas"""
+    from app.services.idempotencia import limpiar_claves
+    with app.app_context():
+        try:
+            borradas = limpiar_claves(app.config['IDEMPOTENCIA_TTL_HORAS'])
+            if borradas:
+                print(f"🧹 Claves de idempotencia vencidas borradas: {borradas}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Error limpiando claves de idempotencia: {e}")
+        finally:
+            db.session.remove()
+
+def limpiar_webhooks_job(app):
+    """Borra los trabajos de webhooks ya terminados según la retención configurada"""
+    from app.services.webhooks_mp import limpiar_trabajos
+    with app.app_context():
+        try:
+            borrados = limpiar_trabajos(app.config['MP_WEBHOOK_RETENCION_DIAS'])
+            if borrados:
+                print(f"🧹 Trabajos de webhooks MP borrados: {borrados}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Error limpiando trabajos de webhooks: {e}")
+        finally:
+            db.session.remove()
+
+def limpiar_preferencias_job(app):
+    """Borra las preferences de Mercado Pago vencidas"""
+    from app.services.preferencias_mp import limpiar_preferencias
+    with app.app_context():
+        try:
+            borradas = limpiar_preferencias()
+            if borradas:
+                print(f"🧹 Preferences de Mercado Pago vencidas borradas: {borradas}")
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Error limpiando preferences: {e}")
+        finally:
+            db.session.remove()
+
+def crear_indices_faltantes():
+    """db.create_all() no agrega índices nuevos a tablas que ya existen; crearlos aquí"""
+    for tabla in db.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            try:
+                indice.create(bind=db.engine, checkfirst=True)
+            except Exception as e:
+                print(f"⚠️ No se pudo crear el índice {indice.name}: {e}")
 ###-------------------------------------------------------
 def create_app():
     app = Flask(__name__)
@@ -56,6 +154,19 @@ def create_app():
     migrate.init_app(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'web.login'
+
+    from app.services.cache_catalogo import catalogo_cache
+    from app.services import favoritos as favoritos_service
+    from app.services import busqueda as busqueda_service
+    from app.services import assets as assets_service
+    from app.services import eventos as eventos_service
+    from app.services import movimientos as movimientos_service
+    catalogo_cache.init_app(app)
+    favoritos_service.init_app(app)
+    busqueda_service.init_app(app)
+    assets_service.init_app(app)
+    eventos_service.init_app(app)
+    movimientos_service.init_app(app)
     
     # Registrar blueprints
     from app.routes.web import web_bp
@@ -87,10 +198,20 @@ def create_app():
     with app.app_context():
         try:
             db.create_all()
+            from app.services.carrito import normalizar_carritos
+            normalizar_carritos()
+            crear_indices_faltantes()
+            movimientos_service.sembrar_saldos_iniciales()
+            busqueda_service.preparar_indice()
             print(" Tablas de base de datos verificadas")
 
+            # Fila única con la versión del catálogo (usada por el cache en memoria)
+            from app.models.models import Categoria, CatalogoVersion
+            if CatalogoVersion.query.get(1) is None:
+                db.session.add(CatalogoVersion(id=1, version=0))
+                db.session.commit()
+
             # Seed de categorías por defecto si no existen
-            from app.models.models import Categoria
             if Categoria.query.count() == 0:
                 categorias_default = [
                     ("Consolas", "Consolas y hardware"),
@@ -117,11 +238,77 @@ def create_app():
                 name='Mantener BD Neon activa',
                 replace_existing=True
             )
+            if app.config.get('CARRITO_LIMPIEZA_ENABLED', True):
+                scheduler.add_job(
+                    func=limpiar_carritos_job,
+                    args=[app],
+                    trigger="interval",
+                    hours=app.config['CARRITO_LIMPIEZA_HORAS'],
+                    id='limpiar_carritos',
+                    name='Limpiar carritos cerrados y abandonados',
+                    replace_existing=True
+                )
+            if app.config.get('RESERVA_LIMPIEZA_ENABLED', True):
+                scheduler.add_job(
+                    func=liberar_reservas_job,
+                    args=[app],
+                    trigger="interval",
+                    minutes=app.config['RESERVA_LIMPIEZA_MINUTOS'],
+                    id='liberar_reservas',
+                    name='Liberar reservas de stock vencidas',
+                    replace_existing=True
+                )
+            if app.config.get('INVENTARIO_SNAPSHOT_ENABLED', True):
+                scheduler.add_job(
+                    func=snapshot_inventario_job,
+                    args=[app],
+                    trigger="interval",
+                    minutes=app.config['INVENTARIO_SNAPSHOT_MINUTOS'],
+                    id='snapshot_inventario',
+                    name='Snapshot de stock desde el registro de movimientos',
+                    replace_existing=True
+                )
+            scheduler.add_job(
+                func=limpiar_idempotencia_job,
+                args=[app],
+                trigger="interval",
+                hours=app.config['IDEMPOTENCIA_LIMPIEZA_HORAS'],
+                id='limpiar_idempotencia',
+                name='Limpiar claves de idempotencia vencidas',
+                replace_existing=True
+            )
+            scheduler.add_job(
+                func=limpiar_webhooks_job,
+                args=[app],
+                trigger="interval",
+                hours=24,
+                id='limpiar_webhooks',
+                name='Limpiar trabajos de webhooks terminados',
+                replace_existing=True
+            )
+            scheduler.add_job(
+                func=limpiar_preferencias_job,
+                args=[app],
+                trigger="interval",
+                hours=6,
+                id='limpiar_preferencias',
+                name='Limpiar preferences de Mercado Pago vencidas',
+                replace_existing=True
+            )
             scheduler.start()
             print("✅ Scheduler iniciado - BD Neon se mantendrá activa")
             
             # Asegurar que el scheduler se detenga cuando la app se cierre
             atexit.register(lambda: scheduler.shutdown())
+
+    # Hilo que guarda en lotes el registro de pagos (ver app/services/pagos.py)
+    from app.services.pagos import buffer_pagos
+    buffer_pagos.iniciar(app)
+
+    # Pool que procesa los webhooks de Mercado Pago encolados (ver app/services/webhooks_mp.py)
+    if app.config.get('MP_WEBHOOK_WORKERS', 0) > 0:
+        from app.services.webhooks_mp import pool_webhooks
+        pool_webhooks.iniciar(app, app.config['MP_WEBHOOK_WORKERS'])
     
     return app
 
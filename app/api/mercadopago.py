@@ -1,14 +1,12 @@
+import requests
 from flask import Blueprint, request, jsonify, current_app
-import mercadopago
-
-bp = Blueprint('mercadopago_api', __name__)
 
+from app.services.mercadopago_cliente import ProveedorNoDisponible, get_mp_client
+from app.services.preferencias_mp import guardar_preferencia, huella_preferencia, preferencia_guardada
+from app.services.pagos import registrar_pago
+from app.services.webhooks_mp import encolar_pago, extraer_payment_id, pool_webhooks
 
-def get_mp_client():
-    token = current_app.config.get('MERCADOPAGO_ACCESS_TOKEN')
-    if not token:
-        raise RuntimeError('MERCADOPAGO_ACCESS_TOKEN no configurado en la aplicacion')
-    return mercadopago.SDK(token)
+bp = Blueprint('mercadopago_api', __name__)
 
 
 @bp.route('/api/mercadopago/config', methods=['GET'])
@@ -28,6 +26,7 @@ def create_preference():
 
     Espera JSON con clave `items`: lista de objetos {title, quantity, unit_price}
     Opcional: `back_urls` dict con success/failure/pending.
+    Con `pedido_id`, la misma petición repetida devuelve la preference ya creada.
     """
     try:
         payload = request.get_json(force=True)
@@ -55,6 +54,17 @@ def create_preference():
         if pedido_id:
             preference_data['external_reference'] = str(pedido_id)
 
+        # Reutilizar la preference si ya se creó para este pedido con los mismos datos
+        try:
+            pedido_id = int(pedido_id) if pedido_id else None
+        except (TypeError, ValueError):
+            pedido_id = None
+        if pedido_id:
+            huella = huella_preferencia(preference_data)
+            guardada = preferencia_guardada(pedido_id, huella)
+            if guardada is not None:
+                return jsonify(guardada)
+
         mp = get_mp_client()
         preference_response = mp.preference().create(preference_data)
 
@@ -62,8 +72,22 @@ def create_preference():
         resp = preference_response
         # Mantener logging y formato similar al resto del proyecto
         print(f"✅ Preference creada: status={resp.get('status')}")
-        return jsonify(resp.get('response', {}))
-
+        datos = resp.get('response') or {}
+        if pedido_id and resp.get('status') in (200, 201) and datos.get('init_point'):
+            # Intento de pago iniciado: queda en el registro con la preference como referencia
+            monto = sum(float(i.get('unit_price') or 0) * int(i.get('quantity') or 0)
+                        for i in items if isinstance(i, dict))
+            registrar_pago(pedido_id, 'mercadopago', 'pendiente', monto, referencia=datos.get('id'), payload=datos)
+            datos = guardar_preferencia(pedido_id, huella, datos,
+                                        current_app.config['MERCADOPAGO_PREFERENCIA_TTL_HORAS'])
+        return jsonify(datos)
+
+    except ProveedorNoDisponible as e:
+        print(f"⚠️ Preference no creada, Mercado Pago no disponible: {e}")
+        return jsonify({'error': str(e)}), 503, {'Retry-After': str(int(current_app.config['MERCADOPAGO_DISYUNTOR_ESPERA_SEGUNDOS']))}
+    except requests.RequestException as e:
+        print(f"⚠️ Error de red con Mercado Pago creando preference: {e}")
+        return jsonify({'error': 'Mercado Pago no respondió, intenta de nuevo'}), 504
     except RuntimeError as e:
         print(f"Error en Mercado Pago config: {e}")
         return jsonify({'error': str(e)}), 500
@@ -76,97 +100,26 @@ def create_preference():
 
 @bp.route('/api/mercadopago/webhook', methods=['POST'])
 def webhook():
-    """Endpoint simple para recibir notificaciones de Mercado Pago.
+    """Recibir notificaciones de Mercado Pago.
 
-    Se recomienda verificar la firma o consultar la API de Mercado Pago para validar el evento.
+    Solo se guarda la notificación y se responde 200 de inmediato; la consulta a
+    la API y la actualización del pedido las hace la cola de app/services/webhooks_mp.py.
     """
     try:
-        data = request.get_json(force=True)
+        data = request.get_json(force=True, silent=True)
         print('MP Webhook recibido:', data)
 
-        # Obtener el id del pago según el formato de notificación
-        payment_id = None
-        # Algunos webhooks vienen como {"data": {"id": ...}, "type": "payment"}
-        if isinstance(data, dict):
-            if 'data' in data and isinstance(data['data'], dict):
-                payment_id = data['data'].get('id')
-            if not payment_id:
-                # Otros formatos pueden usar 'id' directamente
-                payment_id = data.get('id')
-
+        payment_id = extraer_payment_id(data, request.args)
         if not payment_id:
             print('MP Webhook: no se encontró payment id en el payload')
             return jsonify({'status': 'ignored', 'reason': 'no payment id'}), 200
 
-        # Consultar la API de Mercado Pago para validar el pago
-        try:
-            mp = get_mp_client()
-            payment_resp = mp.payment().get(payment_id)
-            payment_data = payment_resp.get('response') if isinstance(payment_resp, dict) else None
-        except Exception as e:
-            print(f"Error consultando API de Mercado Pago para payment {payment_id}: {e}")
-            payment_data = None
-
-        status = None
-        if payment_data:
-            status = payment_data.get('status') or payment_data.get('collection_status')
-            print(f"MP Payment {payment_id} status: {status}")
-
-        # Si el pago está aprobado, actualizar el pedido correspondiente
-        if status and status.lower() in ('approved', 'approved_by_merchant'):
-            from app.models.pedido import Pedido, PedidoItem
-            from app.models.models import Producto, Carrito, CarritoItem
-            from app import db
-
-            pedido = Pedido.query.filter_by(id_transaccion_mercadopago=str(payment_id)).first()
-
-            # Si no lo encontramos por id_transaccion, intentar por external_reference
-            external_ref = None
-            if payment_data:
-                external_ref = payment_data.get('external_reference') or (
-                    payment_data.get('order', {}) or {}).get('external_reference')
-
-            if not pedido and external_ref:
-                try:
-                    # external_reference fue seteado como el id del pedido (string)
-                    pedido = Pedido.query.get(int(external_ref))
-                except Exception:
-                    pedido = Pedido.query.filter_by(id_pedido=external_ref).first()
-
-            if pedido:
-                if pedido.estado != 'completado':
-                    # Guardar id_transaccion_mercadopago si no existe
-                    if not pedido.id_transaccion_mercadopago:
-                        pedido.id_transaccion_mercadopago = str(payment_id)
-
-                    # Reducir stock de los productos del pedido
-                    try:
-                        for item in pedido.items:
-                            producto = Producto.query.get(item.producto_id)
-                            if producto:
-                                producto.stock = (producto.stock or 0) - (item.cantidad or 0)
-                                if producto.stock <= 0:
-                                    producto.activo = False
-
-                        # Limpiar carrito activo del usuario (si existe)
-                        carrito = Carrito.query.filter_by(usuario_id=pedido.usuario_id, activo=True).first()
-                        if carrito:
-                            for ci in list(carrito.items):
-                                db.session.delete(ci)
-                            carrito.activo = False
-
-                        pedido.estado = 'completado'
-                        db.session.commit()
-                        print(f"Pedido {pedido.id_pedido} marcado como completado por webhook MP y stock actualizado")
-                    except Exception as e:
-                        print(f"Error finalizando pedido {pedido.id_pedido}: {e}")
-                        db.session.rollback()
-            else:
-                print(f"No se encontró pedido con id_transaccion_mercadopago={payment_id} ni por external_reference={external_ref}")
-
+        encolar_pago(payment_id, data)
+        pool_webhooks.despertar()
         return jsonify({'status': 'received'}), 200
 
     except Exception as e:
+        # Sin guardar la notificación se responde 500 para que Mercado Pago la reenvíe
         print(f"Error en webhook Mercado Pago: {e}")
         import traceback
         traceback.print_exc()
@@ -1,44 +1,58 @@
 from flask import Blueprint, request, jsonify
-from app.models.models import Producto, Categoria
-from app import db
+from app.services.catalogo import listar_productos, leer_parametros_paginacion, CursorInvalido
+from app.services.cache_catalogo import catalogo_cache
+from app.services.busqueda import buscar_productos, normalizar_paginacion
 
 bp = Blueprint('productos_api', __name__)
 
+def categoria_id_por_nombre(nombre):
+    if not nombre or nombre == 'Todos':
+        return None
+    # -1 = categoría inexistente: la búsqueda no devuelve resultados
+    return catalogo_cache.obtener().categorias_por_nombre.get(nombre, -1)
+
 @bp.route('/api/productos', methods=['GET'])
 def obtener_productos():
     try:
         categoria_nombre = request.args.get('categoria', 'Todos')
         buscar = request.args.get('buscar', '')
         
-        # Consulta base con join
-        query = db.session.query(Producto, Categoria).join(Categoria)
-        
-        if categoria_nombre != 'Todos':
-            query = query.filter(Categoria.nombre == categoria_nombre)
-        
         if buscar:
-            query = query.filter(Producto.nombre.ilike(f'%{buscar}%'))
-        
-        # Filtrar solo productos activos
-        query = query.filter(Producto.activo == True)
-        
-        resultados = query.all()
+            # Con término de búsqueda los resultados van por relevancia (índice de texto completo)
+            pagina = buscar_productos(
+                buscar,
+                *normalizar_paginacion(request.args.get('pagina'), request.args.get('limite')),
+                categoria_id=categoria_id_por_nombre(categoria_nombre)
+            )
+            pagina['next_cursor'] = None
+        else:
+            pagina = listar_productos(
+                categoria=categoria_nombre if categoria_nombre != 'Todos' else None,
+                solo_con_stock=False,
+                **leer_parametros_paginacion(request.args)
+            )
         
         productos_data = []
-        for producto, categoria in resultados:
+        for producto in pagina['productos']:
             productos_data.append({
-                'id_producto': producto.id_producto,
-                'nombre': producto.nombre,
-                'descripcion': producto.descripcion,
-                'precio': float(producto.precio),
-                'stock': producto.stock,
-                'imagen': producto.imagen,
-                'categoria_id': producto.categoria_id,
-                'nombre_categoria': categoria.nombre
+                'id_producto': producto['id'],
+                'nombre': producto['nombre'],
+                'descripcion': producto['descripcion'],
+                'precio': producto['precio'],
+                'stock': producto['stock'],
+                'imagen': producto['imagen'],
+                'categoria_id': producto['categoria_id'],
+                'nombre_categoria': producto['categoria']
             })
         
-        return jsonify(productos_data)
+        # La respuesta sigue siendo una lista; el cursor de la siguiente página va en un header
+        response = jsonify(productos_data)
+        if pagina['next_cursor']:
+            response.headers['X-Next-Cursor'] = pagina['next_cursor']
+        return response
         
+    except CursorInvalido as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error en obtener_productos: {e}")
-        return jsonify({'error': 'Error interno del servidor'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Error interno del servidor'}), 500
@@ -1,7 +1,10 @@
 from flask import Blueprint, jsonify, request, render_template
 from flask_login import login_required, current_user
 from app import db
-from app.models.models import Producto, Carrito, CarritoItem
+from app.services.carrito import (
+    agregar_producto, cargar_carrito, resumen_carrito, actualizar_cantidad, eliminar_item, ErrorCarrito
+)
+from app.services.catalogo import listar_productos, leer_parametros_paginacion, CursorInvalido
 
 carrito_bp = Blueprint('carrito', __name__)
 
@@ -19,39 +22,7 @@ def agregar_al_carrito():
         
         print(f"🔍 Intentando agregar producto {producto_id}, cantidad {cantidad}")
         
-        # Verificar que el producto existe
-        producto = Producto.query.get(producto_id)
-        if not producto:
-            return jsonify({'success': False, 'message': 'Producto no encontrado'}), 404
-        
-        # Obtener o crear carrito del usuario
-        carrito = Carrito.query.filter_by(
-            usuario_id=current_user.id_usuario, 
-            activo=True
-        ).first()
-        
-        if not carrito:
-            carrito = Carrito(usuario_id=current_user.id_usuario)
-            db.session.add(carrito)
-            db.session.flush()
-        
-        # Verificar si el producto ya está en el carrito
-        item_existente = CarritoItem.query.filter_by(
-            carrito_id=carrito.id_carrito,
-            producto_id=producto_id
-        ).first()
-        
-        if item_existente:
-            item_existente.cantidad += cantidad
-        else:
-            nuevo_item = CarritoItem(
-                carrito_id=carrito.id_carrito,
-                producto_id=producto_id,
-                cantidad=cantidad,
-                precio_unitario=producto.precio
-            )
-            db.session.add(nuevo_item)
-        
+        agregar_producto(current_user.id_usuario, producto_id, int(cantidad))
         db.session.commit()
         
         return jsonify({
@@ -59,6 +30,9 @@ def agregar_al_carrito():
             'message': 'Producto agregado al carrito'
         })
         
+    except ErrorCarrito as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"❌ Error en agregar_al_carrito: {str(e)}")
@@ -71,39 +45,23 @@ def agregar_al_carrito():
 @login_required
 def obtener_carrito():
     try:
-        carrito = Carrito.query.filter_by(
-            usuario_id=current_user.id_usuario, 
-            activo=True
-        ).first()
-        
-        if not carrito:
-            return jsonify({'items': [], 'total': 0, 'count': 0})
-        
-        items_data = []
-        total = 0
-        count = 0
-        
-        for item in carrito.items:
-            producto = item.producto
-            subtotal = item.cantidad * float(item.precio_unitario)
-            total += subtotal
-            count += item.cantidad
-            
-            items_data.append({
-                'id': item.id_item,
-                'producto_id': producto.id_producto,
-                'nombre': producto.nombre,
-                'precio': float(item.precio_unitario),
-                'cantidad': item.cantidad,
-                'imagen': producto.imagen,
-                'categoria': producto.categoria.nombre,
-                'subtotal': float(subtotal)
-            })
+        resumen = resumen_carrito(cargar_carrito(current_user.id_usuario))
+        
+        items_data = [{
+            'id': item['id'],
+            'producto_id': item['producto_id'],
+            'nombre': item['nombre'],
+            'precio': item['precio_unitario'],
+            'cantidad': item['cantidad'],
+            'imagen': item['imagen'],
+            'categoria': item['categoria'],
+            'subtotal': item['subtotal']
+        } for item in resumen['items']]
         
         return jsonify({
             'items': items_data,
-            'total': float(total),
-            'count': count
+            'total': resumen['total'],
+            'count': resumen['unidades']
         })
         
     except Exception as e:
@@ -118,25 +76,17 @@ def obtener_carrito():
 def actualizar_carrito(item_id):
     try:
         data = request.get_json()
-        nueva_cantidad = data.get('cantidad')
         
-        item = CarritoItem.query.get_or_404(item_id)
-        
-        # Verificar que el item pertenezca al usuario
-        if item.carrito.usuario_id != current_user.id_usuario:
-            return jsonify({'success': False, 'message': 'No autorizado'}), 403
-        
-        if nueva_cantidad <= 0:
-            db.session.delete(item)
-            message = 'Producto eliminado del carrito'
-        else:
-            item.cantidad = nueva_cantidad
-            message = 'Cantidad actualizada'
+        cantidad = actualizar_cantidad(current_user.id_usuario, item_id, data.get('cantidad'))
+        message = 'Cantidad actualizada' if cantidad else 'Producto eliminado del carrito'
         
         db.session.commit()
         
         return jsonify({'success': True, 'message': message})
         
+    except ErrorCarrito as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -148,13 +98,7 @@ def actualizar_carrito(item_id):
 @login_required
 def eliminar_del_carrito(item_id):
     try:
-        item = CarritoItem.query.get_or_404(item_id)
-        
-        # Verificar que el item pertenezca al usuario
-        if item.carrito.usuario_id != current_user.id_usuario:
-            return jsonify({'success': False, 'message': 'No autorizado'}), 403
-        
-        db.session.delete(item)
+        eliminar_item(current_user.id_usuario, item_id)
         db.session.commit()
         
         return jsonify({
@@ -162,6 +106,9 @@ def eliminar_del_carrito(item_id):
             'message': 'Producto eliminado del carrito'
         })
         
+    except ErrorCarrito as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         return jsonify({
@@ -172,23 +119,18 @@ def eliminar_del_carrito(item_id):
 @carrito_bp.route('/api/productos', methods=['GET'])
 def obtener_productos():
     try:
-        productos = Producto.query.filter_by(activo=True).all()
-        productos_data = []
-        
-        for producto in productos:
-            productos_data.append({
-                'id': producto.id_producto,
-                'nombre': producto.nombre,
-                'descripcion': producto.descripcion,
-                'precio': float(producto.precio),
-                'stock': producto.stock,
-                'imagen': producto.imagen,
-                'categoria': producto.categoria.nombre,
-                'categoria_id': producto.categoria_id
-            })
-        
-        return jsonify(productos_data)
-        
+        pagina = listar_productos(
+            solo_con_stock=False,
+            **leer_parametros_paginacion(request.args)
+        )
+        
+        response = jsonify(pagina['productos'])
+        if pagina['next_cursor']:
+            response.headers['X-Next-Cursor'] = pagina['next_cursor']
+        return response
+        
+    except CursorInvalido as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -22,6 +22,70 @@ class BaseConfig:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     MERCADOPAGO_ACCESS_TOKEN = os.environ.get("MERCADOPAGO_ACCESS_TOKEN")
     MERCADOPAGO_PUBLIC_KEY = os.environ.get("MERCADOPAGO_PUBLIC_KEY")
+    # Otra URL base para la API (p. ej. app/scripts/fake_mercadopago.py en pruebas locales)
+    MERCADOPAGO_API_URL = os.environ.get("MERCADOPAGO_API_URL")
+    # Cliente HTTP compartido de Mercado Pago: timeouts, pool keep-alive y disyuntor
+    MERCADOPAGO_TIMEOUT_CONEXION = float(os.environ.get("MERCADOPAGO_TIMEOUT_CONEXION", 3.05))
+    MERCADOPAGO_TIMEOUT_LECTURA = float(os.environ.get("MERCADOPAGO_TIMEOUT_LECTURA", 10))
+    MERCADOPAGO_POOL_CONEXIONES = int(os.environ.get("MERCADOPAGO_POOL_CONEXIONES", 10))
+    MERCADOPAGO_REINTENTOS = int(os.environ.get("MERCADOPAGO_REINTENTOS", 1))
+    MERCADOPAGO_DISYUNTOR_FALLOS = int(os.environ.get("MERCADOPAGO_DISYUNTOR_FALLOS", 5))
+    MERCADOPAGO_DISYUNTOR_ESPERA_SEGUNDOS = float(os.environ.get("MERCADOPAGO_DISYUNTOR_ESPERA_SEGUNDOS", 30))
+    # Vigencia de las preferences reutilizadas por pedido (ver app/services/preferencias_mp.py)
+    MERCADOPAGO_PREFERENCIA_TTL_HORAS = float(os.environ.get("MERCADOPAGO_PREFERENCIA_TTL_HORAS", 24))
+    CATALOGO_PAGE_SIZE = int(os.environ.get("CATALOGO_PAGE_SIZE", 24))
+    CATALOGO_PAGE_SIZE_MAX = int(os.environ.get("CATALOGO_PAGE_SIZE_MAX", 100))
+    CATALOGO_CACHE_ENABLED = os.environ.get("CATALOGO_CACHE_ENABLED", "1") != "0"
+    # Cada cuánto se compara la versión en memoria con la de la BD (cambios de otros workers)
+    CATALOGO_CACHE_VERIFICAR_SEGUNDOS = float(os.environ.get("CATALOGO_CACHE_VERIFICAR_SEGUNDOS", 5))
+    # Límites superiores de las bandas de precio para las facetas del catálogo
+    CATALOGO_BANDAS_PRECIO = tuple(
+        int(limite) for limite in os.environ.get("CATALOGO_BANDAS_PRECIO", "500,1000,5000,10000").split(",")
+    )
+    # Derivados de imágenes de producto (miniaturas WebP con nombre por hash de contenido)
+    IMAGENES_DERIVADOS_ENABLED = os.environ.get("IMAGENES_DERIVADOS_ENABLED", "1") != "0"
+    IMAGENES_DERIVADOS_DIR = os.environ.get(
+        "IMAGENES_DERIVADOS_DIR", os.path.join(BASE_DIR, "static", "img", "derivados")
+    )
+    IMAGENES_DERIVADOS_WORKERS = int(os.environ.get("IMAGENES_DERIVADOS_WORKERS", 2))
+    # Bundles JS/CSS con hash (ver app/services/assets.py); en modo debug se usan los originales
+    ASSETS_BUNDLES_ENABLED = os.environ.get("ASSETS_BUNDLES_ENABLED", "1") != "0"
+    ASSETS_DIR = os.environ.get("ASSETS_DIR", os.path.join(BASE_DIR, "static", "dist"))
+    # Limpieza de carritos: cerrados en checkout y abandonados sin actividad
+    CARRITO_LIMPIEZA_ENABLED = os.environ.get("CARRITO_LIMPIEZA_ENABLED", "1") != "0"
+    CARRITO_LIMPIEZA_HORAS = float(os.environ.get("CARRITO_LIMPIEZA_HORAS", 6))
+    CARRITO_RETENCION_INACTIVOS_DIAS = int(os.environ.get("CARRITO_RETENCION_INACTIVOS_DIAS", 30))
+    CARRITO_RETENCION_ABANDONADOS_DIAS = int(os.environ.get("CARRITO_RETENCION_ABANDONADOS_DIAS", 90))
+    CARRITO_LIMPIEZA_LOTE = int(os.environ.get("CARRITO_LIMPIEZA_LOTE", 500))
+    # Canal SSE /api/eventos (ver app/services/eventos.py); cada conexión ocupa un hilo del worker
+    EVENTOS_SSE_ENABLED = os.environ.get("EVENTOS_SSE_ENABLED", "1") != "0"
+    EVENTOS_MAX_CONEXIONES = int(os.environ.get("EVENTOS_MAX_CONEXIONES", 24))
+    EVENTOS_LATIDO_SEGUNDOS = float(os.environ.get("EVENTOS_LATIDO_SEGUNDOS", 20))
+    EVENTOS_DURACION_MAX_SEGUNDOS = float(os.environ.get("EVENTOS_DURACION_MAX_SEGUNDOS", 300))
+    # Reservas de stock de pedidos Mercado Pago pendientes (ver app/services/inventario.py)
+    RESERVA_STOCK_MINUTOS = float(os.environ.get("RESERVA_STOCK_MINUTOS", 30))
+    RESERVA_LIMPIEZA_ENABLED = os.environ.get("RESERVA_LIMPIEZA_ENABLED", "1") != "0"
+    RESERVA_LIMPIEZA_MINUTOS = float(os.environ.get("RESERVA_LIMPIEZA_MINUTOS", 5))
+    # Registro de movimientos de inventario y snapshots de stock (ver app/services/movimientos.py)
+    INVENTARIO_SNAPSHOT_ENABLED = os.environ.get("INVENTARIO_SNAPSHOT_ENABLED", "1") != "0"
+    INVENTARIO_SNAPSHOT_MINUTOS = float(os.environ.get("INVENTARIO_SNAPSHOT_MINUTOS", 60))
+    INVENTARIO_SNAPSHOT_MARGEN_SEGUNDOS = float(os.environ.get("INVENTARIO_SNAPSHOT_MARGEN_SEGUNDOS", 120))
+    # Idempotency-Key en la creación de pedidos (ver app/services/idempotencia.py)
+    IDEMPOTENCIA_TTL_HORAS = float(os.environ.get("IDEMPOTENCIA_TTL_HORAS", 24))
+    # Mínimo para tomar una reserva abandonada; nunca menos que 4 veces la peor llamada a Mercado Pago
+    IDEMPOTENCIA_BLOQUEO_SEGUNDOS = int(os.environ.get("IDEMPOTENCIA_BLOQUEO_SEGUNDOS", 300))
+    IDEMPOTENCIA_LIMPIEZA_HORAS = float(os.environ.get("IDEMPOTENCIA_LIMPIEZA_HORAS", 1))
+    # Registro de pagos con escritura diferida (ver app/services/pagos.py)
+    PAGOS_FLUSH_SEGUNDOS = float(os.environ.get("PAGOS_FLUSH_SEGUNDOS", 2))
+    PAGOS_LOTE = int(os.environ.get("PAGOS_LOTE", 200))
+    # Cola de webhooks de Mercado Pago (ver app/services/webhooks_mp.py)
+    MP_WEBHOOK_WORKERS = int(os.environ.get("MP_WEBHOOK_WORKERS", 2))
+    MP_WEBHOOK_SONDEO_SEGUNDOS = float(os.environ.get("MP_WEBHOOK_SONDEO_SEGUNDOS", 5))
+    MP_WEBHOOK_MAX_INTENTOS = int(os.environ.get("MP_WEBHOOK_MAX_INTENTOS", 8))
+    MP_WEBHOOK_BACKOFF_BASE_SEGUNDOS = float(os.environ.get("MP_WEBHOOK_BACKOFF_BASE_SEGUNDOS", 5))
+    MP_WEBHOOK_BACKOFF_MAX_SEGUNDOS = float(os.environ.get("MP_WEBHOOK_BACKOFF_MAX_SEGUNDOS", 3600))
+    MP_WEBHOOK_BLOQUEO_SEGUNDOS = int(os.environ.get("MP_WEBHOOK_BLOQUEO_SEGUNDOS", 120))
+    MP_WEBHOOK_RETENCION_DIAS = int(os.environ.get("MP_WEBHOOK_RETENCION_DIAS", 7))
 
 
 class DevelopmentConfig(BaseConfig):
@@ -1,18 +1,29 @@
-from .models import Categoria, Producto, Carrito, CarritoItem
+from .models import Categoria, Producto, ProductoImagen, CatalogoVersion, Carrito, CarritoItem
 from .role import Role
 from .usuario import Usuario
-from .analytics import AdminActivity, InventarioMovimiento, Pago, Reporte, ReporteItem
+from .analytics import AdminActivity, InventarioMovimiento, InventarioSnapshot, Pago, Reporte, ReporteItem
+from .idempotencia import IdempotenciaClave
+from .webhook import WebhookTrabajo
+from .preferencia import PreferenciaMercadoPago
+from .reserva import ReservaStock
 
 __all__ = [
 	'Role',
 	'Usuario',
 	'Categoria',
 	'Producto',
+	'ProductoImagen',
+	'CatalogoVersion',
 	'Carrito',
 	'CarritoItem',
 	'AdminActivity',
 	'InventarioMovimiento',
+	'InventarioSnapshot',
 	'Pago',
 	'Reporte',
 	'ReporteItem',
+	'IdempotenciaClave',
+	'WebhookTrabajo',
+	'PreferenciaMercadoPago',
+	'ReservaStock',
 ]
\ No newline at end of file
@@ -15,19 +15,47 @@ class AdminActivity(db.Model):
 
 
 class InventarioMovimiento(db.Model):
+    """Registro append-only de cambios de stock (ver services/inventario.py)"""
     __tablename__ = 'inventario_movimientos'
+    __table_args__ = (
+        # Stock de un producto en una fecha: snapshot + movimientos posteriores
+        db.Index('ix_inv_mov_producto_fecha', 'producto_id', 'creado_en'),
+        # Compactación: movimientos de todos los productos desde el último corte
+        db.Index('ix_inv_mov_fecha', 'creado_en'),
+        # Un solo saldo inicial por producto aunque varios workers lo siembren a la vez
+        db.Index('uq_inv_mov_saldo_inicial', 'producto_id', unique=True,
+                 postgresql_where=db.text("motivo = 'saldo inicial'"),
+                 sqlite_where=db.text("motivo = 'saldo inicial'")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     producto_id = db.Column(db.Integer, db.ForeignKey('productos.id_producto'), nullable=False)
     tipo = db.Column(db.String(20), nullable=False)  # entrada | salida | ajuste
-    cantidad = db.Column(db.Integer, nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)  # con signo: + entrada, - salida
     motivo = db.Column(db.String(200))
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario'), nullable=True)
     creado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
 
+class InventarioSnapshot(db.Model):
+    """Stock de un producto materializado desde el registro de movimientos hasta `corte`"""
+    __tablename__ = 'inventario_snapshots'
+    __table_args__ = (
+        db.UniqueConstraint('producto_id', 'corte', name='uq_inv_snapshot_producto_corte'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id_producto'), nullable=False)
+    stock = db.Column(db.Integer, nullable=False)
+    corte = db.Column(db.DateTime, nullable=False, index=True)
+    creado_en = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+
 class Pago(db.Model):
     __tablename__ = 'pagos'
+    __table_args__ = (
+        db.Index('ix_pagos_pedido_id', 'pedido_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id_pedido'), nullable=False)
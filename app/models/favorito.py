@@ -16,4 +16,11 @@ class Favorito(db.Model):
     producto = db.relationship('Producto', backref='favoritos')
     
     def __repr__(self):
-        return f'<Favorito usuario_id:{self.usuario_id} producto_id:{self.producto_id}>'
\ No newline at end of file
+        return f'<Favorito usuario_id:{self.usuario_id} producto_id:{self.producto_id}>'
+
+class FavoritoVersion(db.Model):
+    """Versión de la lista de favoritos de cada usuario; cambia al agregar o quitar uno"""
+    __tablename__ = 'favoritos_version'
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario'), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
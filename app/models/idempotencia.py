@@ -0,0 +1,20 @@
+from datetime import datetime
+from app import db
+
+
+class IdempotenciaClave(db.Model):
+    """Resultado de una petición con cabecera Idempotency-Key (ver services/idempotencia.py)"""
+    __tablename__ = 'idempotencia_claves'
+    __table_args__ = (
+        db.UniqueConstraint('usuario_id', 'endpoint', 'clave', name='uq_idempotencia_usuario_endpoint_clave'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario'), nullable=False)
+    endpoint = db.Column(db.String(100), nullable=False)
+    clave = db.Column(db.String(100), nullable=False)
+    huella = db.Column(db.String(64), nullable=False)  # sha256 del método, ruta y cuerpo
+    estado = db.Column(db.String(20), nullable=False, default='procesando')  # procesando | completado
+    status_code = db.Column(db.Integer)
+    respuesta = db.Column(db.JSON)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
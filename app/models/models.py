@@ -11,6 +11,13 @@ class Categoria(db.Model):
 
 class Producto(db.Model):
     __tablename__ = 'productos'
+    __table_args__ = (
+        # Índices para la paginación por cursor del catálogo (orden + id_producto)
+        db.Index('ix_productos_activo_fecha', 'activo', 'fecha_creacion', 'id_producto'),
+        db.Index('ix_productos_categoria_fecha', 'categoria_id', 'activo', 'fecha_creacion', 'id_producto'),
+        db.Index('ix_productos_activo_precio', 'activo', 'precio', 'id_producto'),
+        db.Index('ix_productos_activo_nombre', 'activo', 'nombre', 'id_producto'),
+    )
     id_producto = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(200), nullable=False)
     descripcion = db.Column(db.Text)
@@ -21,8 +28,46 @@ class Producto(db.Model):
     activo = db.Column(db.Boolean, default=True)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
 
+    imagenes_derivadas = db.relationship('ProductoImagen', backref='producto', lazy=True,
+                                         cascade='all, delete-orphan')
+
+class ProductoImagen(db.Model):
+    """Derivado redimensionado de la imagen de un producto (WebP + formato de respaldo).
+
+    Los archivos se nombran con el hash del contenido original, así su URL cambia
+    cuando cambia la imagen y se pueden cachear para siempre.
+    """
+    __tablename__ = 'producto_imagenes'
+    __table_args__ = (
+        db.UniqueConstraint('producto_id', 'variante', name='uq_producto_imagenes_variante'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id_producto', ondelete='CASCADE'),
+                            nullable=False, index=True)
+    variante = db.Column(db.String(20), nullable=False)  # thumb / card / detail
+    ancho = db.Column(db.Integer, nullable=False)
+    alto = db.Column(db.Integer, nullable=False)
+    archivo_webp = db.Column(db.String(200), nullable=False)
+    archivo_respaldo = db.Column(db.String(200), nullable=False)  # jpg, o png si tiene transparencia
+    hash_contenido = db.Column(db.String(64), nullable=False)
+    origen = db.Column(db.String(500), nullable=False)  # valor de Producto.imagen al generarlo
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+
+class CatalogoVersion(db.Model):
+    """Fila única con la versión del catálogo; se incrementa en cada cambio de productos/categorías"""
+    __tablename__ = 'catalogo_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
 class Carrito(db.Model):
     __tablename__ = 'carrito'
+    __table_args__ = (
+        # Un solo carrito activo por usuario (índice parcial; los inactivos quedan como historial)
+        db.Index('uq_carrito_usuario_activo', 'usuario_id', unique=True,
+                 postgresql_where=db.text('activo'), sqlite_where=db.text('activo')),
+        # Limpieza periódica de carritos cerrados/abandonados (ver services/carrito.limpiar_carritos)
+        db.Index('ix_carrito_activo_fecha', 'activo', 'fecha_creacion'),
+    )
     id_carrito = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id_usuario'))
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
@@ -33,6 +78,10 @@ class Carrito(db.Model):
 
 class CarritoItem(db.Model):
     __tablename__ = 'carrito_items'
+    __table_args__ = (
+        # Destino del ON CONFLICT al agregar productos (ver services/carrito.py)
+        db.Index('uq_carrito_items_carrito_producto', 'carrito_id', 'producto_id', unique=True),
+    )
     id_item = db.Column(db.Integer, primary_key=True)
     carrito_id = db.Column(db.Integer, db.ForeignKey('carrito.id_carrito'))
     producto_id = db.Column(db.Integer, db.ForeignKey('productos.id_producto'))
@@ -0,0 +1,18 @@
+from datetime import datetime
+from app import db
+
+
+class PreferenciaMercadoPago(db.Model):
+    """Preference ya creada para un pedido y un contenido (ver services/preferencias_mp.py)"""
+    __tablename__ = 'mercadopago_preferencias'
+    __table_args__ = (
+        db.UniqueConstraint('pedido_id', 'huella', name='uq_preferencia_pedido_huella'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id_pedido', ondelete='CASCADE'), nullable=False)
+    huella = db.Column(db.String(64), nullable=False)  # sha256 de los datos enviados a Mercado Pago
+    preference_id = db.Column(db.String(100))
+    respuesta = db.Column(db.JSON, nullable=False)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,19 @@
+from datetime import datetime
+from app import db
+
+
+class ReservaStock(db.Model):
+    """Unidades apartadas para un pedido pendiente de pago (ver services/inventario.py)"""
+    __tablename__ = 'reservas_stock'
+    __table_args__ = (
+        # Suma de reservas vigentes por producto (stock disponible del catálogo y checkout)
+        db.Index('ix_reserva_producto_expira', 'producto_id', 'expira_en'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    pedido_id = db.Column(db.Integer, db.ForeignKey('pedidos.id_pedido', ondelete='CASCADE'),
+                          nullable=False, index=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('productos.id_producto', ondelete='CASCADE'), nullable=False)
+    cantidad = db.Column(db.Integer, nullable=False)
+    expira_en = db.Column(db.DateTime, nullable=False, index=True)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
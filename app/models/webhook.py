@@ -0,0 +1,24 @@
+from datetime import datetime
+from app import db
+
+
+class WebhookTrabajo(db.Model):
+    """Notificación de pago recibida, pendiente de procesar (ver services/webhooks_mp.py)"""
+    __tablename__ = 'webhook_trabajos'
+    __table_args__ = (
+        # Un trabajo por pago: las notificaciones repetidas se funden en la misma fila
+        db.UniqueConstraint('proveedor', 'referencia', name='uq_webhook_proveedor_referencia'),
+        db.Index('ix_webhook_estado_proximo', 'estado', 'proximo_intento'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    proveedor = db.Column(db.String(30), nullable=False, default='mercadopago')
+    referencia = db.Column(db.String(100), nullable=False)  # payment id
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')  # pendiente | procesando | completado | fallido
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    recibidas = db.Column(db.Integer, nullable=False, default=1)  # notificaciones recibidas para este pago
+    proximo_intento = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    payload = db.Column(db.JSON)
+    ultimo_error = db.Column(db.Text)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    fecha_actualizacion = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -1,9 +1,11 @@
-from flask import Blueprint, render_template, jsonify, request, redirect, url_for
+from flask import Blueprint, render_template, jsonify, request, redirect, url_for, send_from_directory, send_file, current_app, abort, Response
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask import session
 from app import db
 import datetime
+import os
+import time
 from flask import Flask, request, jsonify
 from app.models.pedido import Pedido, PedidoItem
 from app.models.usuario import Usuario
@@ -11,7 +13,34 @@ from app.models.models import Carrito, CarritoItem, Producto, Categoria
 from app.models.role import Role
 from app.models.favorito import Favorito
 from app.models.analytics import AdminActivity
+from app.services.catalogo import listar_productos, leer_parametros_paginacion, CursorInvalido
+from app.services.cache_catalogo import catalogo_cache, serializar_categoria, version_catalogo
+from app.services.favoritos import version_favoritos, ids_favoritos
+from app.services.etags import calcular_etag, etag_vigente, con_etag, no_modificado, cache_inmutable
+from app.services.busqueda import buscar_productos, normalizar_paginacion, subconsulta_ids
+from app.services.facetas import calcular_facetas
+from app.services.autocompletar import sugerencias, normalizar_limite as normalizar_limite_autocompletar
+from app.services.imagenes import programar_derivados
+from app.services.assets import archivo_para, TIPOS as TIPOS_ASSETS
+from app.services.vitrina import primera_pagina
+from app.services.carrito_invitado import (
+    leer_carrito_invitado, guardar_carrito_invitado, agregar_invitado, fusionar_carrito_invitado
+)
+from app.services.inventario import (
+    descontar_stock, reservar_stock, liberar_reservas, cancelar_pendientes_mercadopago
+)
+from app.services.idempotencia import idempotente
+from app.services.mercadopago_cliente import metricas as metricas_mercadopago
+from app.services.pagos import registrar_pago
+from app.services.movimientos import stock_en, conciliar_inventario, tiene_historial
+from app.services.eventos import canal as canal_eventos, formatear as formatear_evento
+from app.services.carrito import (
+    agregar_producto, contar_items, totales_carrito, cargar_carrito, resumen_carrito, copiar_items_a_pedido,
+    cerrar_carrito, obtener_carrito_id,
+    actualizar_cantidad, eliminar_item, aplicar_operaciones, notificar_cambio_carrito, ErrorCarrito
+)
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 
 web_bp = Blueprint('web', __name__)
 
@@ -58,6 +87,25 @@ def login():
 def registro():
     return render_template('registro.html')
 
+@web_bp.route('/media/img/<path:archivo>')
+def imagen_derivada(archivo):
+    # El nombre lleva el hash del contenido: la URL nunca cambia de contenido
+    respuesta = send_from_directory(current_app.config['IMAGENES_DERIVADOS_DIR'], archivo, conditional=True)
+    return cache_inmutable(respuesta)
+
+@web_bp.route('/assets/<archivo>')
+def asset_versionado(archivo):
+    # Bundles JS/CSS con hash en el nombre; se sirve la variante precomprimida que acepte el cliente
+    ruta, codificacion = archivo_para(archivo, request.accept_encodings)
+    if ruta is None:
+        abort(404)
+    tipo = TIPOS_ASSETS[os.path.splitext(archivo)[1]]
+    respuesta = send_file(ruta, mimetype=tipo, conditional=True)
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    respuesta.vary.add('Accept-Encoding')
+    return cache_inmutable(respuesta)
+
 # ----------------------------------------- RUTAS ADMINISTRADOR ---------------------------------------- #
 
 @web_bp.route('/admin/inventario')
@@ -115,21 +163,30 @@ def admin():
 
 # ----------------------------------------- RUTAS DE USUARIO ---------------------------------------- #
 
+def render_categoria(plantilla, categoria):
+    # La primera página viaja en el HTML; si falla, el JS la pide a /api/productos como antes
+    try:
+        vitrina = primera_pagina(categoria)
+    except Exception as e:
+        print(f"⚠️ Error renderizando productos de {categoria}: {e}")
+        vitrina = None
+    return render_template(plantilla, vitrina=vitrina)
+
 @web_bp.route('/juegos')
 def juegos():
-    return render_template('juegos.html')
+    return render_categoria('juegos.html', 'Juegos')
 
 @web_bp.route('/consolas')
 def consolas():
-    return render_template('consolas.html')
+    return render_categoria('consolas.html', 'Consolas')
 
 @web_bp.route('/controles')
 def controles():
-    return render_template('controles.html')
+    return render_categoria('controles.html', 'Controles')
 
 @web_bp.route('/accesorios')
 def accesorios():
-    return render_template('accesorios.html')
+    return render_categoria('accesorios.html', 'Accesorios')
 
 @web_bp.route('/favoritos')
 @login_required
@@ -214,6 +271,17 @@ def api_login():
         session['user_role'] = usuario.rol_id
         
         print(f"LOGIN EXITOSO: {usuario.nombre_usuario} (Rol: {usuario.rol_id})")
+
+        # Lo que agregó como invitado pasa a su carrito (un solo upsert); un fallo no impide el login
+        carrito_invitado = leer_carrito_invitado(request)
+        if carrito_invitado:
+            try:
+                fusionados = fusionar_carrito_invitado(usuario.id_usuario, carrito_invitado)
+                db.session.commit()
+                print(f"🛒 Carrito de invitado fusionado: {fusionados} productos")
+            except Exception as e:
+                db.session.rollback()
+                print(f"⚠️ No se pudo fusionar el carrito de invitado: {e}")
         
         # Redirigir según rol
         if usuario.rol_id == 1:  # Administrador
@@ -223,7 +291,7 @@ def api_login():
             redirect_url = '/'
             message = 'Login exitoso'
         
-        return jsonify({
+        respuesta = jsonify({
             'success': True, 
             'message': message,
             'redirect_url': redirect_url,
@@ -233,7 +301,10 @@ def api_login():
                 'email': usuario.correo,
                 'role': usuario.rol_id
             }
-        }), 200
+        })
+        if carrito_invitado:
+            guardar_carrito_invitado(respuesta, {})
+        return respuesta, 200
         
     except Exception as e:
         print(f"Error en login: {e}")
@@ -401,42 +472,30 @@ def api_productos():
     try:
         # Obtener parámetro de categoría si existe
         categoria_nombre = request.args.get('categoria')
+
+        etag = calcular_etag('productos', version_catalogo(), request.query_string.decode())
+        if etag_vigente(etag):
+            return no_modificado(etag)
         
-        # ✅ SOLO MOSTRAR PRODUCTOS ACTIVOS Y CON STOCK > 0
-        if categoria_nombre:
-            productos = Producto.query.join(Categoria).filter(
-                Categoria.nombre == categoria_nombre,
-                Producto.activo == True,
-                Producto.stock > 0  # ✅ SOLO productos con stock
-            ).all()
-            print(f"🔍 Filtrando por categoría: {categoria_nombre}, encontrados: {len(productos)} productos")
-        else:
-            # Todos los productos activos con stock
-            productos = Producto.query.filter(
-                Producto.activo == True,
-                Producto.stock > 0  # ✅ SOLO productos con stock
-            ).all()
-            print(f"📦 Todos los productos activos con stock, encontrados: {len(productos)} productos")
-        
-        productos_data = []
-        for producto in productos:
-            productos_data.append({
-                'id': producto.id_producto,
-                'nombre': producto.nombre,
-                'descripcion': producto.descripcion,
-                'precio': float(producto.precio) if producto.precio else 0,
-                'stock': producto.stock,
-                'imagen': producto.imagen,
-                'categoria': producto.categoria.nombre if producto.categoria else 'Sin categoría',
-                'categoria_id': producto.categoria_id
-            })
+        # ✅ SOLO MOSTRAR PRODUCTOS ACTIVOS Y CON STOCK > 0, paginados por cursor
+        pagina = listar_productos(
+            categoria=categoria_nombre,
+            **leer_parametros_paginacion(request.args)
+        )
+        print(f"📦 Catálogo ({categoria_nombre or 'todos'}): {len(pagina['productos'])} productos en esta página")
         
-        return jsonify({
+        return con_etag(jsonify({
             'success': True,
-            'productos': productos_data,
-            'filtro_aplicado': categoria_nombre if categoria_nombre else 'todos'
-        })
-        
+            'productos': pagina['productos'],
+            'filtro_aplicado': categoria_nombre if categoria_nombre else 'todos',
+            'next_cursor': pagina['next_cursor'],
+            'orden': pagina['orden'],
+            'limite': pagina['limite'],
+            'facetas': calcular_facetas(categoria=categoria_nombre)
+        }), etag)
+        
+    except CursorInvalido as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"❌ Error obteniendo productos: {e}")
         import traceback
@@ -446,34 +505,114 @@ def api_productos():
 @web_bp.route('/api/productos/categoria/<int:categoria_id>')
 def api_productos_por_categoria(categoria_id):
     try:
+        etag = calcular_etag('productos-categoria', categoria_id, version_catalogo(), request.query_string.decode())
+        if etag_vigente(etag):
+            return no_modificado(etag)
+
         # ✅ SOLO productos activos y con stock
-        productos = Producto.query.filter(
-            Producto.categoria_id == categoria_id,
-            Producto.activo == True,
-            Producto.stock > 0  # ✅ SOLO productos con stock
-        ).all()
-        
-        productos_data = []
-        for producto in productos:
-            productos_data.append({
-                'id': producto.id_producto,
-                'nombre': producto.nombre,
-                'descripcion': producto.descripcion,
-                'precio': float(producto.precio) if producto.precio else 0,
-                'stock': producto.stock,
-                'imagen': producto.imagen,
-                'categoria_id': producto.categoria_id
-            })
+        pagina = listar_productos(
+            categoria_id=categoria_id,
+            **leer_parametros_paginacion(request.args)
+        )
         
-        return jsonify({
+        return con_etag(jsonify({
             'success': True,
-            'productos': productos_data
-        })
-        
+            'productos': pagina['productos'],
+            'next_cursor': pagina['next_cursor'],
+            'orden': pagina['orden'],
+            'limite': pagina['limite'],
+            'facetas': calcular_facetas(categoria_id=categoria_id)
+        }), etag)
+        
+    except CursorInvalido as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         print(f"❌ Error obteniendo productos por categoría: {e}")
         return jsonify({'success': False, 'error': 'Error al obtener productos'}), 500
 
+@web_bp.route('/api/productos/buscar')
+def api_buscar_productos():
+    """Búsqueda de texto completo ordenada por relevancia (ignora acentos y mayúsculas)"""
+    try:
+        consulta = request.args.get('q', '').strip()
+        if not consulta:
+            return jsonify({'success': False, 'error': 'Parámetro q requerido'}), 400
+
+        etag = calcular_etag('buscar', version_catalogo(), request.query_string.decode())
+        if etag_vigente(etag):
+            return no_modificado(etag)
+
+        pagina, limite = normalizar_paginacion(request.args.get('pagina'), request.args.get('limite'))
+        categoria_id = request.args.get('categoria_id', type=int)
+
+        resultado = buscar_productos(consulta, pagina, limite, categoria_id=categoria_id, solo_con_stock=True)
+
+        return con_etag(jsonify({
+            'success': True,
+            'q': consulta,
+            'productos': resultado['productos'],
+            'pagina': resultado['pagina'],
+            'limite': resultado['limite'],
+            'siguiente_pagina': resultado['siguiente_pagina']
+        }), etag)
+
+    except Exception as e:
+        print(f"❌ Error buscando productos: {e}")
+        return jsonify({'success': False, 'error': 'Error al buscar productos'}), 500
+
+@web_bp.route('/api/productos/autocomplete')
+def api_autocompletar_productos():
+    """Sugerencias de nombres mientras se escribe; se resuelve en memoria"""
+    try:
+        consulta = request.args.get('q', '')
+        limite = normalizar_limite_autocompletar(request.args.get('limite'))
+        return jsonify({
+            'success': True,
+            'sugerencias': sugerencias(consulta, limite)
+        })
+
+    except Exception as e:
+        print(f"❌ Error en autocompletado: {e}")
+        return jsonify({'success': False, 'error': 'Error al obtener sugerencias'}), 500
+
+# ----------------------------------------- EVENTOS (SSE) ---------------------------------------- #
+
+@web_bp.route('/api/eventos')
+def api_eventos():
+    """Stream de eventos del usuario: carrito, favoritos y estado de pedidos.
+
+    No consulta la BD: solo reenvía lo que publican los commits de este proceso.
+    Al (re)conectar el cliente vuelve a leer el contador, así no pierde cambios.
+    """
+    config = current_app.config
+    if not config.get('EVENTOS_SSE_ENABLED', True):
+        return '', 204
+    if 'user_id' not in session:
+        # 200 con un evento 'fin': el cliente cierra sin reintentar ni caer a polling
+        return Response(formatear_evento('fin', {'motivo': 'anonimo'}), mimetype='text/event-stream')
+
+    suscripcion = canal_eventos.suscribir(session['user_id'], config['EVENTOS_MAX_CONEXIONES'])
+    if suscripcion is None:
+        return jsonify({'success': False, 'error': 'Demasiadas conexiones'}), 503
+
+    latido = config['EVENTOS_LATIDO_SEGUNDOS']
+    fin = time.monotonic() + config['EVENTOS_DURACION_MAX_SEGUNDOS']
+
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < fin:
+                evento = suscripcion.siguiente(timeout=min(latido, max(0, fin - time.monotonic())))
+                # Comentario como latido: mantiene viva la conexión y detecta clientes desconectados
+                yield ': ping\n\n' if evento is None else formatear_evento(*evento)
+        finally:
+            canal_eventos.cancelar(suscripcion)
+
+    respuesta = Response(stream(), mimetype='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['X-Accel-Buffering'] = 'no'
+    return respuesta
+
 # ----------------------------------------- CARRITO API ---------------------------------------- #
 
 @web_bp.route('/api/carrito/cantidad')
@@ -481,28 +620,39 @@ def api_carrito_cantidad():
     """Obtener cantidad de items en el carrito"""
     try:
         if 'user_id' not in session:
-            return jsonify({'count': 0})
+            return jsonify({'count': len(leer_carrito_invitado(request))})
         
-        carrito = Carrito.query.filter_by(
-            usuario_id=session['user_id'], 
-            activo=True
-        ).first()
-        
-        count = len(carrito.items) if carrito else 0
-        return jsonify({'count': count})
+        return jsonify({'count': totales_carrito(session['user_id'])['count']})
         
     except Exception as e:
         print(f"Error obteniendo cantidad del carrito: {e}")
         return jsonify({'count': 0})
 
+@web_bp.route('/api/carrito/resumen')
+def api_carrito_resumen():
+    """Totales del carrito para el resumen previo al pago (una consulta agregada)"""
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'error': 'No autenticado'}), 401
+
+        totales = totales_carrito(session['user_id'])
+        return jsonify({
+            'success': True,
+            'count': totales['count'],
+            'unidades': totales['unidades'],
+            'subtotal': float(totales['total']),
+            'total': float(totales['total'])
+        })
+
+    except Exception as e:
+        print(f"Error obteniendo resumen del carrito: {e}")
+        return jsonify({'success': False, 'error': 'Error interno'}), 500
+
 @web_bp.route('/api/carrito/agregar', methods=['POST'])
 def agregar_al_carrito():
     try:
         print(f"🎯 INICIANDO agregar_al_carrito - User: {session.get('user_id')}")
         
-        if 'user_id' not in session:
-            return jsonify({'success': False, 'error': 'Inicia sesion para poder agregar productos al carrito'}), 401
-
         data = request.get_json()
         print(f"📦 Datos recibidos: {data}")
         
@@ -519,79 +669,37 @@ def agregar_al_carrito():
         producto_id = int(producto_id)
         cantidad = int(cantidad)
 
-        print(f"🔍 Buscando producto {producto_id}")
-        producto = Producto.query.filter_by(id_producto=producto_id, activo=True).first()
-        
-        if not producto:
-            return jsonify({'success': False, 'error': 'Producto no encontrado'}), 404
-
-        # Buscar carrito activo del usuario
-        carrito = Carrito.query.filter_by(
-            usuario_id=session['user_id'], 
-            activo=True
-        ).first()
-
-        print(f"🛒 Carrito encontrado: {carrito.id_carrito if carrito else 'NONE'}")
-
-        if not carrito:
-            carrito = Carrito(usuario_id=session['user_id'])
-            db.session.add(carrito)
-            db.session.flush()
-            print(f"🆕 Nuevo carrito creado: {carrito.id_carrito}")
-
-        # ✅ VERIFICACIÓN MÁS ROBUSTA: Buscar item existente
-        item_existente = CarritoItem.query.filter_by(
-            carrito_id=carrito.id_carrito,
-            producto_id=producto_id
-        ).first()
-
-        print(f"🔍 Item existente: {item_existente.id_item if item_existente else 'NONE'}")
+        if 'user_id' in session:
+            # Upsert atómico: crea o incrementa el item validando stock en la misma sentencia
+            resultado = agregar_producto(session['user_id'], producto_id, cantidad)
+            count = contar_items(resultado['carrito_id'])
+            db.session.commit()
+        else:
+            # Invitado: el carrito vive en una cookie firmada hasta que inicie sesión
+            carrito_invitado = leer_carrito_invitado(request)
+            resultado = agregar_invitado(carrito_invitado, producto_id, cantidad)
+            count = len(carrito_invitado)
 
-        if item_existente:
-            # Si ya existe, aumentar la cantidad
-            nueva_cantidad = item_existente.cantidad + cantidad
-            print(f"📈 Actualizando cantidad: {item_existente.cantidad} + {cantidad} = {nueva_cantidad}")
-            
-            # Verificar stock disponible
-            if nueva_cantidad > producto.stock:
-                return jsonify({'success': False, 'error': f'Stock insuficiente. Solo quedan {producto.stock} unidades'}), 400
-            
-            item_existente.cantidad = nueva_cantidad
-            mensaje = f'Cantidad actualizada: ahora tienes {nueva_cantidad} unidades'
-            accion = 'actualizado'
+        if resultado['accion'] == 'actualizado':
+            mensaje = f"Cantidad actualizada: ahora tienes {resultado['cantidad']} unidades"
         else:
-            # Si no existe, crear nuevo item
-            print(f"🆕 Creando nuevo item para producto {producto_id}")
-            nuevo_item = CarritoItem(
-                carrito_id=carrito.id_carrito,
-                producto_id=producto_id,
-                cantidad=cantidad,
-                precio_unitario=producto.precio
-            )
-            db.session.add(nuevo_item)
             mensaje = 'Producto agregado al carrito'
-            accion = 'agregado'
 
-        db.session.commit()
-        print(f"✅ Commit exitoso - {accion}")
-        
-        # Obtener el conteo actualizado
-        carrito_actualizado = Carrito.query.filter_by(
-            usuario_id=session['user_id'], 
-            activo=True
-        ).first()
-        
-        count = len(carrito_actualizado.items) if carrito_actualizado else 0
-        
-        print(f"🎉 Carrito {accion} exitosamente. Total items: {count}")
-        
-        return jsonify({
+        print(f"🎉 Carrito {resultado['accion']} exitosamente. Total items: {count}")
+
+        respuesta = jsonify({
             'success': True, 
             'message': mensaje,
             'carrito_count': count,
-            'accion': accion
+            'accion': resultado['accion']
         })
+        if 'user_id' not in session:
+            guardar_carrito_invitado(respuesta, carrito_invitado)
+        return respuesta
 
+    except ErrorCarrito as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"❌ ERROR en agregar_al_carrito: {e}")
@@ -599,94 +707,88 @@ def agregar_al_carrito():
         traceback.print_exc()
         return jsonify({'success': False, 'error': 'Error interno del servidor'}), 500
 
+def _carrito_json(carrito):
+    """Formato de carrito que consume carrito-dinamico.js"""
+    resumen = resumen_carrito(carrito)
+    items_data = [{
+        'id': item['id'],
+        'producto_id': item['producto_id'],
+        'nombre': item['nombre'],
+        'precio_unitario': item['precio_unitario'],
+        'cantidad': item['cantidad'],
+        'total': item['subtotal'],
+        'imagen': item['imagen'],
+        'stock': item['stock']
+    } for item in resumen['items']]
+    return {
+        'items': items_data,
+        'subtotal': resumen['total'],
+        'total': resumen['total'],
+        'count': resumen['count']
+    }
+
 @web_bp.route('/api/carrito/detalles')
 def api_carrito_detalles():
     try:
         if 'user_id' not in session:
             return jsonify({'success': False, 'error': 'No autenticado'}), 401
 
-        carrito = Carrito.query.filter_by(
-            usuario_id=session['user_id'], 
-            activo=True
-        ).first()
-
-        if not carrito:
-            return jsonify({
-                'success': True,
-                'carrito': {
-                    'items': [],
-                    'subtotal': 0,
-                    'total': 0,
-                    'count': 0
-                }
-            })
-
-        items_data = []
-        subtotal = 0
-        
-        for item in carrito.items:
-            item_total = float(item.precio_unitario) * item.cantidad
-            subtotal += item_total
-            
-            items_data.append({
-                'id': item.id_item,
-                'producto_id': item.producto.id_producto,
-                'nombre': item.producto.nombre,
-                'precio_unitario': float(item.precio_unitario),
-                'cantidad': item.cantidad,
-                'total': item_total,
-                'imagen': item.producto.imagen,
-                'stock': item.producto.stock
-            })
-
         return jsonify({
             'success': True,
-            'carrito': {
-                'items': items_data,
-                'subtotal': subtotal,
-                'total': subtotal,
-                'count': len(carrito.items)
-            }
+            'carrito': _carrito_json(cargar_carrito(session['user_id']))
         })
 
     except Exception as e:
         print(f"Error obteniendo carrito: {e}")
         return jsonify({'success': False, 'error': 'Error interno'}), 500
 
-@web_bp.route('/api/carrito/actualizar/<int:item_id>', methods=['PUT'])
-def actualizar_cantidad_carrito(item_id):
+@web_bp.route('/api/carrito/lote', methods=['POST'])
+def api_carrito_lote():
+    """Aplica varias operaciones (agregar / fijar / eliminar) en una sola transacción.
+
+    Body: {"operaciones": [{"accion": "fijar", "item_id": 3, "cantidad": 2}, ...]}.
+    Devuelve el carrito resultante con el mismo formato que /api/carrito/detalles;
+    si una operación falla no se aplica ninguna.
+    """
     try:
         if 'user_id' not in session:
             return jsonify({'success': False, 'error': 'No autenticado'}), 401
 
-        data = request.get_json()
-        nueva_cantidad = data.get('cantidad', 1)
+        data = request.get_json(silent=True) or {}
+        carrito = aplicar_operaciones(session['user_id'], data.get('operaciones'))
+        db.session.flush()
+        respuesta = _carrito_json(carrito)
+        db.session.commit()
 
-        item = CarritoItem.query.get(item_id)
-        
-        if not item:
-            return jsonify({'success': False, 'error': 'Item no encontrado'}), 404
+        return jsonify({'success': True, 'carrito': respuesta})
 
-        carrito = Carrito.query.filter_by(
-            usuario_id=session['user_id'], 
-            activo=True
-        ).first()
-        
-        if not carrito or item.carrito_id != carrito.id_carrito:
-            return jsonify({'success': False, 'error': 'No autorizado'}), 403
+    except ErrorCarrito as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), e.status
+    except IntegrityError:
+        # Otra petición agregó el mismo producto al mismo tiempo; el cliente reintenta con el carrito nuevo
+        db.session.rollback()
+        return jsonify({'success': False, 'error': 'El carrito cambió, intenta de nuevo'}), 409
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error aplicando operaciones al carrito: {e}")
+        return jsonify({'success': False, 'error': 'Error interno'}), 500
 
-        producto = Producto.query.get(item.producto_id)
-        if nueva_cantidad > producto.stock:
-            return jsonify({'success': False, 'error': 'Stock insuficiente'}), 400
+@web_bp.route('/api/carrito/actualizar/<int:item_id>', methods=['PUT'])
+def actualizar_cantidad_carrito(item_id):
+    try:
+        if 'user_id' not in session:
+            return jsonify({'success': False, 'error': 'No autenticado'}), 401
 
-        if nueva_cantidad <= 0:
-            db.session.delete(item)
-        else:
-            item.cantidad = nueva_cantidad
+        data = request.get_json()
+        actualizar_cantidad(session['user_id'], item_id, data.get('cantidad', 1))
 
         db.session.commit()
         return jsonify({'success': True, 'message': 'Carrito actualizado'})
 
+    except ErrorCarrito as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"Error actualizando carrito: {e}")
@@ -698,24 +800,14 @@ def eliminar_item_carrito(item_id):
         if 'user_id' not in session:
             return jsonify({'success': False, 'error': 'No autenticado'}), 401
 
-        item = CarritoItem.query.get(item_id)
-        
-        if not item:
-            return jsonify({'success': False, 'error': 'Item no encontrado'}), 404
-
-        carrito = Carrito.query.filter_by(
-            usuario_id=session['user_id'], 
-            activo=True
-        ).first()
-        
-        if not carrito or item.carrito_id != carrito.id_carrito:
-            return jsonify({'success': False, 'error': 'No autorizado'}), 403
-
-        db.session.delete(item)
+        eliminar_item(session['user_id'], item_id)
         db.session.commit()
         
         return jsonify({'success': True, 'message': 'Producto eliminado del carrito'})
 
+    except ErrorCarrito as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"Error eliminando item: {e}")
@@ -776,6 +868,11 @@ def api_favoritos():
             return jsonify({'success': False, 'error': 'Debes iniciar sesión para ver favoritos'}), 401
         
         usuario_id = session['user_id']
+
+        # La respuesta incluye datos del producto, así que depende también del catálogo
+        etag = calcular_etag('favoritos', usuario_id, version_favoritos(usuario_id), version_catalogo())
+        if etag_vigente(etag):
+            return no_modificado(etag, privado=True)
         
         # Obtener favoritos con información del producto y categoría
         favoritos = Favorito.query.filter_by(usuario_id=usuario_id)\
@@ -801,11 +898,11 @@ def api_favoritos():
                 }
             })
         
-        return jsonify({
+        return con_etag(jsonify({
             'success': True,
             'favoritos': favoritos_data,
             'count': len(favoritos)
-        })
+        }), etag, privado=True)
         
     except Exception as e:
         print(f"Error obteniendo favoritos: {e}")
@@ -831,12 +928,7 @@ def api_agregar_favorito():
             return jsonify({'success': False, 'error': 'Producto no encontrado'}), 404
 
         # Verificar si ya está en favoritos
-        favorito_existente = Favorito.query.filter_by(
-            usuario_id=session['user_id'],
-            producto_id=producto_id
-        ).first()
-
-        if favorito_existente:
+        if int(producto_id) in ids_favoritos(session['user_id']):
             return jsonify({'success': False, 'error': 'El producto ya está en favoritos'}), 400
 
         # Agregar a favoritos
@@ -891,20 +983,53 @@ def api_eliminar_favorito(producto_id):
 @login_required
 def api_verificar_favorito(producto_id):
     try:
-        favorito = Favorito.query.filter_by(
-            usuario_id=session['user_id'],
-            producto_id=producto_id
-        ).first()
-
         return jsonify({
             'success': True,
-            'es_favorito': favorito is not None
+            'es_favorito': producto_id in ids_favoritos(session['user_id'])
         })
 
     except Exception as e:
         print(f"Error verificando favorito: {e}")
         return jsonify({'success': False, 'error': 'Error interno del servidor'}), 500
 
+FAVORITOS_VERIFICAR_MAX_IDS = 200
+
+@web_bp.route('/api/favoritos/ids')
+@login_required
+def api_favoritos_ids():
+    """Ids favoritos del usuario; con ?ids=1,2,3 indica cuáles de esos productos lo son"""
+    try:
+        usuario_id = session['user_id']
+        consultados = None
+        if request.args.get('ids'):
+            try:
+                consultados = [int(i) for i in request.args['ids'].split(',') if i.strip()]
+            except ValueError:
+                return jsonify({'success': False, 'error': 'Lista de ids inválida'}), 400
+            if len(consultados) > FAVORITOS_VERIFICAR_MAX_IDS:
+                return jsonify({
+                    'success': False,
+                    'error': f'Máximo {FAVORITOS_VERIFICAR_MAX_IDS} ids por consulta'
+                }), 400
+
+        version = version_favoritos(usuario_id)
+        etag = calcular_etag('favoritos-ids', usuario_id, version, request.query_string)
+        if etag_vigente(etag):
+            return no_modificado(etag, privado=True)
+
+        ids = ids_favoritos(usuario_id, version)
+        respuesta = {'success': True}
+        if consultados is None:
+            respuesta['ids'] = sorted(ids)
+        else:
+            respuesta['ids'] = sorted(i for i in set(consultados) if i in ids)
+            respuesta['es_favorito'] = {str(i): i in ids for i in consultados}
+        return con_etag(jsonify(respuesta), etag, privado=True)
+
+    except Exception as e:
+        print(f"Error obteniendo ids de favoritos: {e}")
+        return jsonify({'success': False, 'error': 'Error interno del servidor'}), 500
+
 # ----------------------------------------- API ADMIN PRODUCTOS ---------------------------------------- #
 
 @web_bp.route('/api/admin/productos')
@@ -921,7 +1046,11 @@ def api_admin_productos():
 
         # Aplicar filtros
         if search:
-            query = query.filter(Producto.nombre.ilike(f'%{search}%'))
+            coincidencias = subconsulta_ids(search)
+            if coincidencias is None:
+                query = query.filter(db.false())
+            else:
+                query = query.filter(Producto.id_producto.in_(coincidencias))
         
         if categoria_id:
             query = query.filter(Producto.categoria_id == categoria_id)
@@ -962,18 +1091,19 @@ def api_admin_productos():
 @admin_required
 def api_categorias():
     try:
-        categorias = Categoria.query.all()
-        
-        categorias_data = [{
-            'id': cat.id_categoria,
-            'nombre': cat.nombre,
-            'descripcion': cat.descripcion
-        } for cat in categorias]
+        etag = calcular_etag('categorias', version_catalogo())
+        if etag_vigente(etag):
+            return no_modificado(etag)
 
-        return jsonify({
+        if current_app.config.get('CATALOGO_CACHE_ENABLED', True):
+            categorias = catalogo_cache.obtener().categorias
+        else:
+            categorias = [serializar_categoria(c) for c in Categoria.query.order_by(Categoria.id_categoria).all()]
+
+        return con_etag(jsonify({
             'success': True,
-            'categorias': categorias_data
-        })
+            'categorias': categorias
+        }), etag)
         
     except Exception as e:
         print(f"Error obteniendo categorías: {e}")
@@ -1011,6 +1141,7 @@ def api_admin_agregar_producto():
 
         db.session.add(nuevo_producto)
         db.session.commit()
+        programar_derivados(nuevo_producto)
 
         return jsonify({
             'success': True,
@@ -1033,12 +1164,15 @@ def api_admin_editar_producto():
         if not producto_id:
             return jsonify({'success': False, 'error': 'ID de producto requerido'}), 400
 
-        producto = Producto.query.get(producto_id)
+        # Bloquear la fila si cambia el stock: el ajuste registrado es nuevo - anterior
+        # y un checkout simultáneo no debe cambiar el anterior entre la lectura y el commit
+        producto = db.session.get(Producto, producto_id, with_for_update='stock' in data)
         if not producto:
             return jsonify({'success': False, 'error': 'Producto no encontrado'}), 404
 
-        # Actualizar campos
+        # Actualizar campos (el ajuste de stock queda en el registro de movimientos)
         stock_anterior = producto.stock
+        imagen_anterior = producto.imagen
         if 'nombre' in data:
             producto.nombre = data['nombre']
         if 'descripcion' in data:
@@ -1070,6 +1204,8 @@ def api_admin_editar_producto():
             producto.activo = data['activo']
 
         db.session.commit()
+        if producto.imagen != imagen_anterior:
+            programar_derivados(producto)
 
         return jsonify({
             'success': True,
@@ -1126,7 +1262,20 @@ def api_admin_eliminar_producto(producto_id):
         for favorito in favoritos:
             db.session.delete(favorito)
 
-        # 3. Finalmente eliminar el producto
+        # 3. Con movimientos de inventario o pedidos solo se desactiva: esas filas
+        #    apuntan al producto y el historial no se borra. Desde que se siembra el
+        #    saldo inicial es el caso de casi todo producto con stock.
+        if tiene_historial(producto_id):
+            producto.activo = False
+            db.session.commit()
+            return jsonify({
+                'success': True,
+                'desactivado': True,
+                'message': ('El producto NO se eliminó: tiene movimientos de inventario o pedidos, '
+                            'así que se desactivó y ya no aparece en la tienda')
+            })
+
+        # 4. Sin historial se elimina
         db.session.delete(producto)
         db.session.commit()
 
@@ -1144,6 +1293,7 @@ def api_admin_eliminar_producto(producto_id):
 
 @web_bp.route('/api/pedidos/procesar', methods=['POST'])
 @login_required
+@idempotente
 def api_procesar_pedido():
     try:
         if 'user_id' not in session:
@@ -1156,44 +1306,23 @@ def api_procesar_pedido():
         
         print(f"🎯 Procesando pedido para usuario {session['user_id']}")
 
-        # Obtener el carrito activo del usuario
-        carrito = Carrito.query.filter_by(
-            usuario_id=session['user_id'], 
-            activo=True
-        ).first()
+        # Obtener el carrito activo del usuario (items y productos en la misma carga)
+        carrito = cargar_carrito(session['user_id'])
 
         if not carrito or not carrito.items:
             return jsonify({'success': False, 'error': 'Carrito vacío'}), 400
 
-        # Verificar stock y calcular total
-        total_pedido = 0
-        items_pedido = []
-        
-        for item in carrito.items:
-            producto = Producto.query.get(item.producto_id)
-            
-            if not producto or not producto.activo:
-                return jsonify({
-                    'success': False, 
-                    'error': f'El producto {producto.nombre if producto else "desconocido"} no está disponible'
-                }), 400
-            
-            if producto.stock < item.cantidad:
-                return jsonify({
-                    'success': False, 
-                    'error': f'Stock insuficiente para {producto.nombre}. Disponible: {producto.stock}, Solicitado: {item.cantidad}'
-                }), 400
-            
-            # Calcular total del item
-            item_total = float(item.precio_unitario) * item.cantidad
-            total_pedido += item_total
-            items_pedido.append({
-                'producto': producto,
-                'item_carrito': item,
-                'cantidad': item.cantidad,
-                'precio': float(item.precio_unitario),
-                'total': item_total
-            })
+        # El total exacto lo calcula la BD en una consulta agregada
+        total_pedido = totales_carrito(session['user_id'])['total']
+
+        # Cerrar el carrito primero: un segundo checkout simultáneo del mismo carrito se rechaza aquí
+        if not cerrar_carrito(carrito.id_carrito):
+            return jsonify({'success': False, 'error': 'El carrito ya fue procesado'}), 409
+
+        # Un intento de Mercado Pago abandonado no debe apartar stock contra este pago
+        cancelados = cancelar_pendientes_mercadopago(session['user_id'])
+        if cancelados:
+            print(f"🔁 Pedidos Mercado Pago pendientes reemplazados por el checkout: {cancelados}")
 
         # ✅ CREAR PEDIO CON INFORMACIÓN DE PAYPAL
         nuevo_pedido = Pedido(
@@ -1208,33 +1337,25 @@ def api_procesar_pedido():
         db.session.add(nuevo_pedido)
         db.session.flush()  # Para obtener el ID del pedido
 
-        # Crear items del pedido y actualizar stock
-        for item_data in items_pedido:
-            producto = item_data['producto']
-            item_carrito = item_data['item_carrito']
-            
-            # Crear item del pedido
-            pedido_item = PedidoItem(
-                pedido_id=nuevo_pedido.id_pedido,
-                producto_id=producto.id_producto,
-                cantidad=item_carrito.cantidad,
-                precio_unitario=item_carrito.precio_unitario
-            )
-            db.session.add(pedido_item)
-            
-            # Actualizar stock del producto
-            producto.stock -= item_carrito.cantidad
-            
-            # Deshabilitar producto si stock llega a 0
-            if producto.stock == 0:
-                producto.activo = False
-                print(f"⚠️ Producto deshabilitado por stock 0: {producto.nombre}")
+        # Descontar stock con un UPDATE condicional por producto (en orden de id): si alguno
+        # no alcanza se lanza StockInsuficiente y se deshace todo el pedido
+        cantidades = {}
+        for item in carrito.items:
+            cantidades[item.producto_id] = cantidades.get(item.producto_id, 0) + item.cantidad
+        restantes = descontar_stock(cantidades, motivo=f'pedido {nuevo_pedido.id_pedido}')
+        for producto_id, stock in restantes.items():
+            if stock == 0:
+                print(f"⚠️ Producto deshabilitado por stock 0: {producto_id}")
+
+        # Crear items del pedido desde el carrito (INSERT ... SELECT)
+        copiar_items_a_pedido(carrito.id_carrito, nuevo_pedido.id_pedido)
 
         # Limpiar el carrito
         for item in carrito.items:
             db.session.delete(item)
         
         carrito.activo = False
+        notificar_cambio_carrito(session['user_id'])
 
         db.session.commit()
 
@@ -1242,8 +1363,13 @@ def api_procesar_pedido():
 
         # Seleccionar el id de transacción según el método de pago
         transaccion_id = nuevo_pedido.id_transaccion_paypal
+        detalles = detalles_paypal
         if metodo_pago == 'mercadopago':
             transaccion_id = nuevo_pedido.id_transaccion_mercadopago
+            detalles = detalles_mercadopago
+
+        registrar_pago(nuevo_pedido.id_pedido, metodo_pago, 'aprobado', total_pedido,
+                       referencia=transaccion_id, payload=detalles or None)
 
         return jsonify({
             'success': True,
@@ -1253,6 +1379,10 @@ def api_procesar_pedido():
             'transaccion_id': transaccion_id
         })
 
+    except ErrorCarrito as e:
+        db.session.rollback()
+        print(f"⚠️ Pedido rechazado: {e}")
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"❌ Error procesando pedido: {e}")
@@ -1263,48 +1393,53 @@ def api_procesar_pedido():
 
 @web_bp.route('/api/pedidos/crear-mercadopago', methods=['POST'])
 @login_required
+@idempotente
 def api_crear_pedido_mercadopago():
     """Crear un pedido en estado 'pendiente' para ser asociado a una preference de Mercado Pago.
 
     No reduce stock ni limpia el carrito; eso se hace cuando la transacción sea confirmada por el webhook.
+    Las unidades quedan reservadas RESERVA_STOCK_MINUTOS para que no se vendan mientras se paga;
+    los pedidos Mercado Pago pendientes anteriores del usuario se cancelan y liberan su reserva.
     """
     try:
         if 'user_id' not in session:
             return jsonify({'success': False, 'error': 'No autenticado'}), 401
 
-        # Obtener el carrito activo del usuario
-        carrito = Carrito.query.filter_by(usuario_id=session['user_id'], activo=True).first()
-        if not carrito or not carrito.items:
+        # Total exacto calculado por la BD, sin cargar los items
+        totales = totales_carrito(session['user_id'])
+        if not totales['count']:
             return jsonify({'success': False, 'error': 'Carrito vacío'}), 400
 
-        # Calcular total y crear pedido en estado pendiente
-        total_pedido = 0
-        for item in carrito.items:
-            total_pedido += float(item.precio_unitario) * item.cantidad
+        # Un reintento reemplaza al intento anterior: sus reservas no deben contar contra este
+        cancelados = cancelar_pendientes_mercadopago(session['user_id'])
+        if cancelados:
+            print(f"🔁 Pedidos Mercado Pago pendientes reemplazados: {cancelados}")
 
         nuevo_pedido = Pedido(
             usuario_id=session['user_id'],
-            total=total_pedido,
+            total=totales['total'],
             estado='pendiente',
             metodo_pago='mercadopago'
         )
         db.session.add(nuevo_pedido)
         db.session.flush()
 
-        # Crear items del pedido (no tocar stock)
-        for item in carrito.items:
-            pedido_item = PedidoItem(
-                pedido_id=nuevo_pedido.id_pedido,
-                producto_id=item.producto_id,
-                cantidad=item.cantidad,
-                precio_unitario=item.precio_unitario
-            )
-            db.session.add(pedido_item)
+        # Crear items del pedido con un INSERT ... SELECT (no tocar stock)
+        copiar_items_a_pedido(obtener_carrito_id(session['user_id']), nuevo_pedido.id_pedido)
+
+        # Reservar las unidades del pedido (falla si ya no quedan libres)
+        cantidades = dict(db.session.query(PedidoItem.producto_id, func.sum(PedidoItem.cantidad))
+                          .filter(PedidoItem.pedido_id == nuevo_pedido.id_pedido)
+                          .group_by(PedidoItem.producto_id).all())
+        reservar_stock(nuevo_pedido.id_pedido, cantidades, current_app.config['RESERVA_STOCK_MINUTOS'])
 
         db.session.commit()
 
         return jsonify({'success': True, 'pedido_id': nuevo_pedido.id_pedido})
 
+    except ErrorCarrito as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), e.status
     except Exception as e:
         db.session.rollback()
         print(f"Error creando pedido Mercado Pago: {e}")
@@ -1645,6 +1780,9 @@ def api_admin_cambiar_estado_pedido():
             return jsonify({'success': False, 'error': 'Estado no válido'}), 400
         
         pedido.estado = nuevo_estado
+        if nuevo_estado == 'cancelado':
+            # Un pedido cancelado deja de apartar stock
+            liberar_reservas(pedido.id_pedido)
         db.session.commit()
         
         return jsonify({
@@ -1740,6 +1878,46 @@ def api_admin_dashboard_summary():
         return jsonify({'success': False, 'error': 'Error al cargar resumen'}), 500
 
 
+@web_bp.route('/api/admin/mercadopago/metricas')
+@admin_required
+def api_admin_mercadopago_metricas():
+    """Latencia, errores y estado del disyuntor del cliente de Mercado Pago (por proceso)"""
+    return jsonify({'success': True, 'metricas': metricas_mercadopago()})
+
+
+@web_bp.route('/api/admin/inventario/<int:producto_id>/stock')
+@admin_required
+def api_admin_stock_en(producto_id):
+    """Stock del producto en una fecha (?en=ISO 8601 UTC) según el registro de movimientos"""
+    en = request.args.get('en')
+    try:
+        momento = datetime.datetime.fromisoformat(en) if en else datetime.datetime.utcnow()
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Fecha inválida, usar ISO 8601'}), 400
+    if momento.tzinfo is not None:
+        momento = momento.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    if db.session.get(Producto, producto_id) is None:
+        return jsonify({'success': False, 'error': 'Producto no encontrado'}), 404
+    return jsonify({
+        'success': True,
+        'producto_id': producto_id,
+        'en': momento.isoformat(),
+        'stock': stock_en(producto_id, momento)
+    })
+
+
+@web_bp.route('/api/admin/inventario/conciliacion')
+@admin_required
+def api_admin_conciliar_inventario():
+    """Productos cuyo stock actual no cuadra con el registro de movimientos"""
+    try:
+        diferencias = conciliar_inventario()
+        return jsonify({'success': True, 'total': len(diferencias), 'diferencias': diferencias})
+    except Exception as e:
+        print(f"Error conciliando inventario: {e}")
+        return jsonify({'success': False, 'error': 'Error al conciliar inventario'}), 500
+
+
 @web_bp.route('/api/admin/dashboard/sales')
 @admin_required
 def api_admin_dashboard_sales():
@@ -0,0 +1,91 @@
+"""Benchmark de latencia de la búsqueda de productos (p50 / p95 / p99).
+
+Crea un catálogo sintético en una base SQLite temporal (o en BENCH_DATABASE_URL)
+y ejecuta consultas representativas contra `buscar_productos`.
+
+    python -m app.scripts.bench_busqueda --productos 20000 --consultas 500
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+PALABRAS = [
+    'control', 'inalámbrico', 'consola', 'edición', 'especial', 'juego', 'acción',
+    'aventura', 'carreras', 'fútbol', 'audífonos', 'teclado', 'ratón', 'cámara',
+    'memoria', 'soporte', 'batería', 'pro', 'elite', 'negro', 'blanco', 'rojo',
+    'mario', 'zelda', 'halo', 'fifa', 'guerra', 'dragón', 'espada', 'música',
+]
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--productos', type=int, default=20000)
+    parser.add_argument('--consultas', type=int, default=500)
+    parser.add_argument('--semilla', type=int, default=7)
+    args = parser.parse_args()
+
+    archivo = None
+    if not os.environ.get('BENCH_DATABASE_URL'):
+        archivo = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or f'sqlite:///{archivo}'
+
+    from app import create_app, db
+    from app.models.models import Producto, Categoria
+    from app.services.busqueda import buscar_productos, reindexar
+
+    random.seed(args.semilla)
+    app = create_app()
+    with app.app_context():
+        if Producto.query.count() < args.productos:
+            categorias = [c.id_categoria for c in Categoria.query.all()]
+            filas = []
+            for i in range(args.productos):
+                nombre = ' '.join(random.sample(PALABRAS, 3)).title()
+                filas.append({
+                    'nombre': f'{nombre} {i}',
+                    'descripcion': ' '.join(random.choices(PALABRAS, k=12)),
+                    'precio': random.randint(100, 20000),
+                    'stock': random.randint(0, 50),
+                    'categoria_id': random.choice(categorias),
+                    'activo': True,
+                })
+            # Inserción directa (sin ORM) y reindexado en bloque
+            db.session.execute(Producto.__table__.insert(), filas)
+            reindexar(db.session.connection())
+            db.session.commit()
+
+        consultas = []
+        for _ in range(args.consultas):
+            terminos = random.sample(PALABRAS, random.choice([1, 1, 2, 3]))
+            # Mitad de las consultas sin acentos y con prefijos, como al escribir en el buscador
+            if random.random() < 0.5:
+                terminos = [t[:max(3, len(t) - 2)] for t in terminos]
+            consultas.append(' '.join(terminos))
+
+        buscar_productos(consultas[0])  # calentar cache del catálogo
+        tiempos = []
+        for consulta in consultas:
+            inicio = time.perf_counter()
+            buscar_productos(consulta, pagina=1, limite=20)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    print(f"Productos: {args.productos}  Consultas: {len(tiempos)}")
+    print(f"p50: {percentil(tiempos, 50):.2f} ms  p95: {percentil(tiempos, 95):.2f} ms  "
+          f"p99: {percentil(tiempos, 99):.2f} ms  media: {statistics.mean(tiempos):.2f} ms")
+
+    if archivo:
+        os.remove(archivo)
+
+
+if __name__ == '__main__':
+    main()
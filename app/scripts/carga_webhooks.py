@@ -0,0 +1,131 @@
+"""Prueba de carga de la cola de webhooks de Mercado Pago contra el servidor falso.
+
+Crea `--pedidos` pedidos pendientes en una base SQLite temporal (o en
+BENCH_DATABASE_URL), envía `--repeticiones` notificaciones por pago en paralelo
+y deja que el pool de workers las procese contra app/scripts/fake_mercadopago.py
+(con latencia y errores 500 simulados, que fuerzan reintentos). Termina con
+código 1 si algún pedido no quedó completado o el stock no se descontó
+exactamente una vez por pedido.
+
+    python -m app.scripts.carga_webhooks --pedidos 100 --repeticiones 3 --latencia 0.2 --tasa-error 0.2
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.scripts.fake_mercadopago import iniciar_en_hilo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pedidos', type=int, default=100)
+    parser.add_argument('--repeticiones', type=int, default=3, help='notificaciones por pago')
+    parser.add_argument('--latencia', type=float, default=0.2, help='segundos por consulta al servidor falso')
+    parser.add_argument('--tasa-error', type=float, default=0.2, help='fracción de respuestas 500')
+    parser.add_argument('--workers', type=int, default=4, help='hilos del pool de webhooks')
+    parser.add_argument('--hilos', type=int, default=16, help='hilos que envían notificaciones')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    servidor = iniciar_en_hilo(latencia=args.latencia, tasa_error=args.tasa_error)
+
+    archivo = None
+    if not os.environ.get('BENCH_DATABASE_URL'):
+        archivo = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or f'sqlite:///{archivo}'
+    os.environ['MERCADOPAGO_API_URL'] = servidor.url
+    os.environ['MERCADOPAGO_ACCESS_TOKEN'] = 'TEST'
+    os.environ['MP_WEBHOOK_WORKERS'] = '0'  # el pool se arranca después de encolar
+    os.environ['MP_WEBHOOK_BACKOFF_BASE_SEGUNDOS'] = '0.05'
+    os.environ['MP_WEBHOOK_MAX_INTENTOS'] = '20'
+
+    from app import create_app, db
+    from app.models.models import Producto, Categoria
+    from app.models.pedido import Pedido, PedidoItem
+    from app.models.usuario import Usuario
+    from app.models.webhook import WebhookTrabajo
+    from app.models.analytics import Pago
+    from app.services.pagos import buffer_pagos
+    from app.services.webhooks_mp import pool_webhooks
+
+    app = create_app()
+    with app.app_context():
+        categoria = Categoria.query.first().id_categoria
+        producto = Producto(nombre='Producto webhook', precio=100, stock=args.pedidos, categoria_id=categoria)
+        usuario = Usuario(nombre='Comprador', correo='comprador@ejemplo.com',
+                          nombre_usuario='comprador', password='x', rol_id=2)
+        db.session.add_all([producto, usuario])
+        db.session.flush()
+        pedidos = []
+        for _ in range(args.pedidos):
+            pedido = Pedido(usuario_id=usuario.id_usuario, total=100, estado='pendiente', metodo_pago='mercadopago')
+            db.session.add(pedido)
+            db.session.flush()
+            db.session.add(PedidoItem(pedido_id=pedido.id_pedido, producto_id=producto.id_producto,
+                                      cantidad=1, precio_unitario=100))
+            pedidos.append(pedido.id_pedido)
+        producto_id = producto.id_producto
+        db.session.commit()
+
+    def notificar(pedido_id):
+        # El servidor falso usa el payment id como external_reference (= id del pedido)
+        cliente = app.test_client()
+        inicio = time.perf_counter()
+        respuesta = cliente.post('/api/mercadopago/webhook', json={'type': 'payment', 'data': {'id': str(pedido_id)}})
+        return respuesta.status_code, time.perf_counter() - inicio
+
+    envios = pedidos * args.repeticiones
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.hilos) as pool:
+        resultados = list(pool.map(notificar, envios))
+    duracion_envio = time.perf_counter() - inicio
+
+    pool_webhooks.iniciar(app, args.workers)
+    inicio = time.perf_counter()
+    with app.app_context():
+        while time.perf_counter() - inicio < args.timeout:
+            abiertos = WebhookTrabajo.query.filter(WebhookTrabajo.estado.in_(('pendiente', 'procesando'))).count()
+            db.session.rollback()
+            if not abiertos:
+                break
+            time.sleep(0.2)
+    duracion_proceso = time.perf_counter() - inicio
+    pool_webhooks.detener()
+    buffer_pagos.detener()  # vacía el registro de pagos antes de contar
+
+    with app.app_context():
+        completados = Pedido.query.filter(Pedido.id_pedido.in_(pedidos), Pedido.estado == 'completado').count()
+        stock = db.session.get(Producto, producto_id).stock
+        trabajos = WebhookTrabajo.query.count()
+        fallidos = WebhookTrabajo.query.filter_by(estado='fallido').count()
+        reintentos = db.session.query(db.func.coalesce(db.func.sum(WebhookTrabajo.intentos), 0)).scalar()
+        pagos = Pago.query.filter(Pago.pedido_id.in_(pedidos), Pago.estado == 'aprobado').count()
+
+    latencias = sorted(t for _, t in resultados)
+    codigos = {}
+    for codigo, _ in resultados:
+        codigos[codigo] = codigos.get(codigo, 0) + 1
+    print(f"Notificaciones: {len(envios)} en {duracion_envio:.2f}s, respuestas {codigos}")
+    print(f"Latencia del ack: p50 {statistics.median(latencias) * 1000:.1f} ms, "
+          f"p95 {latencias[int(len(latencias) * 0.95) - 1] * 1000:.1f} ms")
+    print(f"Procesado en {duracion_proceso:.2f}s: {trabajos} trabajos (dedup de {len(envios)}), "
+          f"{completados}/{len(pedidos)} pedidos completados, {fallidos} fallidos, "
+          f"{servidor.peticiones} consultas a MP, intentos registrados {reintentos}")
+    print(f"Stock inicial {len(pedidos)}, final {stock}, pagos aprobados registrados {pagos}")
+
+    servidor.shutdown()
+    if archivo:
+        os.remove(archivo)
+
+    if completados != len(pedidos) or stock != 0 or fallidos or pagos < len(pedidos):
+        print("❌ La cola no procesó todos los pagos exactamente una vez")
+        sys.exit(1)
+    print("✅ Todos los pagos procesados una vez")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+"""Genera los bundles JS/CSS con hash, sus variantes .gz/.br y el manifiesto.
+
+No necesita la base de datos; pensado para el paso de build del despliegue.
+
+    python -m app.scripts.construir_assets
+"""
+import argparse
+import os
+
+from app.config import BASE_DIR
+from app.services.assets import construir
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--salida', default=os.environ.get('ASSETS_DIR', os.path.join(BASE_DIR, 'static', 'dist')))
+    args = parser.parse_args()
+
+    manifiesto = construir(os.path.join(BASE_DIR, 'static'), args.salida)
+    for nombre, datos in sorted(manifiesto.items()):
+        print(f"{nombre:22} -> {datos['archivo']} ({datos['bytes']} bytes)")
+    print(f"✅ Manifiesto escrito en {os.path.join(args.salida, 'manifest.json')}")
+
+
+if __name__ == '__main__':
+    main()
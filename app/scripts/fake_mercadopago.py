@@ -0,0 +1,131 @@
+"""Servidor falso de la API de Mercado Pago para pruebas locales sin red.
+
+Responde lo que usa la tienda, con latencia y tasa de errores 500 configurables:
+
+    GET  /v1/payments/<id>       pago aprobado; external_reference = <id> salvo
+                                 que se haya registrado otro en `servidor.pagos`
+    POST /checkout/preferences   preference con id e init_point locales
+
+Uso con la app: MERCADOPAGO_API_URL=http://127.0.0.1:8765 MERCADOPAGO_ACCESS_TOKEN=TEST
+
+    python -m app.scripts.fake_mercadopago --puerto 8765 --latencia 0.3 --tasa-error 0.1
+"""
+import argparse
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RUTA_PAGO = re.compile(r'^/v1/payments/([^/?]+)')
+
+
+class ManejadorMP(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como la API real
+    disable_nagle_algorithm = True  # sin esto cada respuesta keep-alive espera ~40 ms al ACK
+
+    def log_message(self, formato, *args):
+        if self.server.verbose:
+            super().log_message(formato, *args)
+
+    def _responder(self, status, datos):
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _simular(self):
+        """Aplica latencia y errores; True si ya respondió con un error"""
+        self.server.contar()
+        if self.server.latencia:
+            time.sleep(self.server.latencia)
+        if random.random() < self.server.tasa_error:
+            self._responder(500, {'message': 'internal_error', 'status': 500})
+            return True
+        return False
+
+    def do_GET(self):
+        coincide = RUTA_PAGO.match(self.path)
+        if not coincide:
+            return self._responder(404, {'message': 'not_found', 'status': 404})
+        if self._simular():
+            return
+        payment_id = coincide.group(1)
+        pago = self.server.pagos.get(payment_id) or {'status': 'approved', 'external_reference': payment_id}
+        self._responder(200, {'id': payment_id, 'status_detail': 'accredited', **pago})
+
+    def do_POST(self):
+        largo = int(self.headers.get('Content-Length') or 0)
+        try:
+            datos = json.loads(self.rfile.read(largo) or b'{}')
+        except ValueError:
+            return self._responder(400, {'message': 'bad_request', 'status': 400})
+        if self.path.split('?')[0] != '/checkout/preferences':
+            return self._responder(404, {'message': 'not_found', 'status': 404})
+        if self._simular():
+            return
+        pref_id = f"pref-{next(self.server.secuencia)}"
+        host = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+        self._responder(201, {
+            'id': pref_id,
+            'init_point': f"{host}/checkout/{pref_id}",
+            'sandbox_init_point': f"{host}/checkout/{pref_id}",
+            'external_reference': datos.get('external_reference', ''),
+            'items': datos.get('items', []),
+        })
+
+
+class ServidorMP(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, latencia=0.0, tasa_error=0.0, verbose=False):
+        super().__init__(direccion, ManejadorMP)
+        self.latencia = latencia
+        self.tasa_error = tasa_error
+        self.verbose = verbose
+        self.pagos = {}  # payment_id -> campos del pago (status, external_reference, ...)
+        self.secuencia = itertools.count(1)
+        self.peticiones = 0
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # El cliente cortó por timeout mientras se simulaba la latencia
+        pass
+
+    def contar(self):
+        with self._lock:
+            self.peticiones += 1
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+def iniciar_en_hilo(puerto=0, latencia=0.0, tasa_error=0.0):
+    """Arranca el servidor en un hilo daemon (puerto 0 = uno libre) y lo devuelve"""
+    servidor = ServidorMP(('127.0.0.1', puerto), latencia, tasa_error)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--puerto', type=int, default=8765)
+    parser.add_argument('--latencia', type=float, default=0.0, help='segundos por petición')
+    parser.add_argument('--tasa-error', type=float, default=0.0, help='fracción de respuestas 500')
+    args = parser.parse_args()
+
+    servidor = ServidorMP(('127.0.0.1', args.puerto), args.latencia, args.tasa_error, verbose=True)
+    print(f"Mercado Pago falso en {servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
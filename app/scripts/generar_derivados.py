@@ -0,0 +1,62 @@
+"""Backfill de derivados de imagen (thumb/card/detail) para los productos existentes.
+
+Genera en un pool de procesos los derivados de cada imagen local que aún no los
+tenga (o de todas con --forzar) y los registra en `producto_imagenes`. Una misma
+imagen usada por varios productos se procesa una sola vez.
+
+    python -m app.scripts.generar_derivados --workers 4
+"""
+import argparse
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sqlalchemy.orm import selectinload
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--forzar', action='store_true', help='regenerar aunque ya existan derivados')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.models.models import Producto
+    from app.services.imagenes import generar_derivados, registrar_derivados, ruta_local
+
+    app = create_app()
+    with app.app_context():
+        carpeta = app.config['IMAGENES_DERIVADOS_DIR']
+        por_ruta = defaultdict(list)  # ruta en disco -> [(producto_id, imagen)]
+        omitidos = 0
+        for producto in Producto.query.options(selectinload(Producto.imagenes_derivadas)).all():
+            ruta = ruta_local(producto.imagen, app.static_folder)
+            if ruta is None:
+                omitidos += 1
+                continue
+            vigentes = [d for d in producto.imagenes_derivadas if d.origen == producto.imagen]
+            if vigentes and not args.forzar and all(
+                    os.path.exists(os.path.join(carpeta, d.archivo_webp)) for d in vigentes):
+                continue
+            por_ruta[ruta].append((producto.id_producto, producto.imagen))
+
+        print(f"🖼️ {len(por_ruta)} imágenes por procesar ({omitidos} productos sin imagen local)")
+        registrados = errores = 0
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            futuros = {pool.submit(generar_derivados, ruta, carpeta): ruta for ruta in por_ruta}
+            for futuro in as_completed(futuros):
+                ruta = futuros[futuro]
+                try:
+                    resultados = futuro.result()
+                except Exception as e:
+                    errores += 1
+                    print(f"⚠️ {ruta}: {e}")
+                    continue
+                for producto_id, imagen in por_ruta[ruta]:
+                    registrados += registrar_derivados(producto_id, imagen, resultados)
+
+    print(f"✅ Derivados registrados para {registrados} productos, {errores} imágenes con error")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""Borra carritos cerrados y abandonados fuera de la ventana de retención.
+
+Es el mismo trabajo que corre el scheduler cada CARRITO_LIMPIEZA_HORAS; útil
+para una primera limpieza grande o para probar otra retención.
+
+    python -m app.scripts.limpiar_carritos --inactivos 30 --abandonados 90
+"""
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--inactivos', type=int, help='días que se conservan los carritos cerrados')
+    parser.add_argument('--abandonados', type=int, help='días sin actividad antes de borrar un carrito activo')
+    parser.add_argument('--lote', type=int, help='carritos por transacción')
+    parser.add_argument('--max-lotes', type=int, default=1000)
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.services.carrito import limpiar_carritos
+
+    app = create_app()
+    with app.app_context():
+        reporte = limpiar_carritos(
+            args.inactivos if args.inactivos is not None else app.config['CARRITO_RETENCION_INACTIVOS_DIAS'],
+            args.abandonados if args.abandonados is not None else app.config['CARRITO_RETENCION_ABANDONADOS_DIAS'],
+            lote=args.lote or app.config['CARRITO_LIMPIEZA_LOTE'],
+            max_lotes=args.max_lotes
+        )
+
+    print(f"✅ Carritos cerrados borrados: {reporte['carritos_inactivos']}")
+    print(f"✅ Carritos abandonados borrados: {reporte['carritos_abandonados']}")
+    print(f"✅ Items borrados: {reporte['items']} en {reporte['lotes']} lotes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Prueba de carga del checkout: muchos usuarios compran a la vez el mismo stock.
+
+Crea `--usuarios` usuarios con el mismo producto (y uno extra por usuario, para
+que los pedidos toquen varios productos) en una base SQLite temporal (o en
+BENCH_DATABASE_URL) y lanza todos los POST /api/pedidos/procesar en paralelo.
+Termina con código 1 si algún stock queda negativo, si lo vendido no cuadra
+con lo descontado o si el stock no cuadra con el registro de movimientos.
+
+    python -m app.scripts.stress_checkout --usuarios 40 --stock 7 --hilos 16
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--usuarios', type=int, default=40)
+    parser.add_argument('--stock', type=int, default=7, help='stock del producto disputado')
+    parser.add_argument('--cantidad', type=int, default=1, help='unidades que compra cada usuario')
+    parser.add_argument('--hilos', type=int, default=16)
+    args = parser.parse_args()
+
+    archivo = None
+    if not os.environ.get('BENCH_DATABASE_URL'):
+        archivo = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or f'sqlite:///{archivo}'
+
+    from sqlalchemy import func
+
+    from app import create_app, db
+    from app.models.models import Producto, Categoria, Carrito, CarritoItem
+    from app.models.pedido import PedidoItem
+    from app.models.usuario import Usuario
+    from app.services.movimientos import conciliar_inventario
+
+    app = create_app()
+    with app.app_context():
+        categoria = Categoria.query.first().id_categoria
+        disputado = Producto(nombre='Producto disputado', precio=100, stock=args.stock, categoria_id=categoria)
+        db.session.add(disputado)
+        db.session.flush()
+        usuarios = []
+        for i in range(args.usuarios):
+            usuario = Usuario(nombre=f'Comprador {i}', correo=f'comprador{i}@ejemplo.com',
+                              nombre_usuario=f'comprador{i}', password='x', rol_id=2)
+            extra = Producto(nombre=f'Extra {i}', precio=10, stock=1, categoria_id=categoria)
+            db.session.add_all([usuario, extra])
+            db.session.flush()
+            carrito = Carrito(usuario_id=usuario.id_usuario, activo=True)
+            db.session.add(carrito)
+            db.session.flush()
+            db.session.add_all([
+                CarritoItem(carrito_id=carrito.id_carrito, producto_id=disputado.id_producto,
+                            cantidad=args.cantidad, precio_unitario=100),
+                CarritoItem(carrito_id=carrito.id_carrito, producto_id=extra.id_producto,
+                            cantidad=1, precio_unitario=10),
+            ])
+            usuarios.append(usuario.id_usuario)
+        disputado_id = disputado.id_producto
+        db.session.commit()
+
+    inicio = threading.Barrier(min(args.hilos, len(usuarios)))
+
+    def comprar(usuario_id):
+        cliente = app.test_client()
+        with cliente.session_transaction() as sesion:
+            sesion['user_id'] = usuario_id
+        try:
+            inicio.wait(timeout=5)
+        except threading.BrokenBarrierError:
+            pass
+        return cliente.post('/api/pedidos/procesar', json={'metodo_pago': 'paypal'}).status_code
+
+    with ThreadPoolExecutor(max_workers=args.hilos) as pool:
+        codigos = Counter(pool.map(comprar, usuarios))
+
+    with app.app_context():
+        stock_final = db.session.get(Producto, disputado_id).stock
+        negativos = Producto.query.filter(Producto.stock < 0).count()
+        vendidos = db.session.query(func.coalesce(func.sum(PedidoItem.cantidad), 0))\
+            .filter(PedidoItem.producto_id == disputado_id).scalar()
+        descuadres = conciliar_inventario()
+
+    print(f"Respuestas: {dict(codigos)}")
+    print(f"Stock inicial {args.stock}, vendido {vendidos}, stock final {stock_final}, "
+          f"productos con stock negativo: {negativos}, descuadres con el registro: {len(descuadres)}")
+
+    if archivo:
+        os.remove(archivo)
+
+    if negativos or stock_final < 0 or vendidos + stock_final != args.stock or descuadres:
+        print("❌ Sobreventa o descuento inconsistente")
+        sys.exit(1)
+    print("✅ Sin sobreventa")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Verifica que eliminar productos desde el panel no choque con el registro de inventario.
+
+Crea en una base SQLite temporal (o en BENCH_DATABASE_URL) un producto con
+alta registrada, uno anterior al registro (saldo inicial sembrado) y uno sin
+historial, y los elimina con DELETE /api/admin/productos/eliminar/<id>. En
+SQLite activa las llaves foráneas para fallar igual que Postgres. Termina con
+código 1 si alguna respuesta no es 200, si un producto con historial se borró o
+perdió movimientos, o si el producto sin historial sigue existiendo.
+
+    python -m app.scripts.verificar_eliminar_producto
+"""
+import os
+import sys
+import tempfile
+
+
+def main():
+    archivo = None
+    if not os.environ.get('BENCH_DATABASE_URL'):
+        archivo = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+    os.environ['DATABASE_URL'] = os.environ.get('BENCH_DATABASE_URL') or f'sqlite:///{archivo}'
+
+    from sqlalchemy import event, text
+    from sqlalchemy.engine import Engine
+
+    @event.listens_for(Engine, 'connect')
+    def _llaves_foraneas(conexion, registro):
+        if type(conexion).__module__.startswith('sqlite3'):
+            conexion.execute('PRAGMA foreign_keys=ON')
+
+    from app import create_app, db
+    from app.models.analytics import InventarioMovimiento
+    from app.models.models import Producto, Categoria
+    from app.models.role import Role
+    from app.models.usuario import Usuario
+    from app.services.movimientos import sembrar_saldos_iniciales
+
+    app = create_app()
+    with app.app_context():
+        categoria = Categoria.query.first().id_categoria
+        if db.session.get(Role, 1) is None:
+            db.session.add(Role(id_rol=1, nombre='admin'))
+            db.session.flush()
+        con_alta = Producto(nombre='Con alta', precio=10, stock=5, categoria_id=categoria)
+        sin_historial = Producto(nombre='Sin historial', precio=10, stock=0, categoria_id=categoria)
+        admin = Usuario(nombre='Admin', correo='admin@ejemplo.com', nombre_usuario='admin_eliminar',
+                        password='x', rol_id=1)
+        db.session.add_all([con_alta, sin_historial, admin])
+        db.session.commit()
+        # Producto creado antes del registro: sin movimientos hasta que se siembra
+        anterior = db.session.execute(text(
+            "INSERT INTO productos (nombre, precio, stock, categoria_id, activo) "
+            "VALUES ('Anterior al registro', 10, 3, :categoria, :activo) RETURNING id_producto"
+        ), {'categoria': categoria, 'activo': True}).scalar()
+        db.session.commit()
+        sembrar_saldos_iniciales()
+        con_historial = [con_alta.id_producto, anterior]
+        sin_historial_id = sin_historial.id_producto
+        movimientos_antes = InventarioMovimiento.query.count()
+        admin_id = admin.id_usuario
+
+    cliente = app.test_client()
+    with cliente.session_transaction() as sesion:
+        sesion['user_id'] = admin_id
+        sesion['user_role'] = 1
+
+    errores = []
+    for producto_id in con_historial + [sin_historial_id]:
+        respuesta = cliente.delete(f'/api/admin/productos/eliminar/{producto_id}')
+        datos = respuesta.get_json()
+        print(f"Producto {producto_id}: {respuesta.status_code} {datos.get('message') or datos.get('error')}")
+        if respuesta.status_code != 200:
+            errores.append(f'producto {producto_id} respondió {respuesta.status_code}')
+
+    with app.app_context():
+        for producto_id in con_historial:
+            producto = db.session.get(Producto, producto_id)
+            if producto is None or producto.activo:
+                errores.append(f'producto {producto_id} con historial no quedó desactivado')
+        if db.session.get(Producto, sin_historial_id) is not None:
+            errores.append(f'producto {sin_historial_id} sin historial no se eliminó')
+        if InventarioMovimiento.query.count() != movimientos_antes:
+            errores.append('se perdieron movimientos de inventario')
+
+    if archivo:
+        os.remove(archivo)
+
+    if errores:
+        for error in errores:
+            print(f"❌ {error}")
+        sys.exit(1)
+    print("✅ Productos con historial desactivados, sin historial eliminados")
+
+
+if __name__ == '__main__':
+    main()
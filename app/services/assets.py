@@ -0,0 +1,140 @@
+"""Bundles de JS/CSS con huella de contenido, minificados y precomprimidos.
+
+Cada bundle concatena en orden los archivos de `app/static` que usa una página,
+se minifica (rjsmin / rcssmin) y se escribe en ASSETS_DIR como
+`<nombre>.<hash>.<ext>` junto a sus variantes `.gz` y `.br`. El manifiesto
+(`manifest.json`) mapea el nombre lógico al archivo con hash; las plantillas lo
+resuelven con `asset_urls('tienda.js')` y la ruta /assets/ lo sirve con
+Cache-Control immutable, eligiendo la variante comprimida según Accept-Encoding.
+
+Sin manifiesto (o con FLASK_DEBUG) `asset_urls` devuelve los archivos originales
+de /static, así el desarrollo no requiere reconstruir nada.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli solo se generan variantes .gz
+    brotli = None
+
+try:
+    import rjsmin
+    import rcssmin
+except ImportError:  # opcional: sin minificadores solo se concatena
+    rjsmin = rcssmin = None
+
+# nombre lógico -> archivos de app/static en el orden en que se cargan
+BUNDLES = {
+    'tienda.css': ['css/stylee.css'],
+    'cuenta.css': ['css/style.css'],
+    'reporte.css': ['css/stylee.css', 'css/style-provisional.css'],
+    # Antes de jQuery/Backbone (CDN)
+    'tienda.js': ['js/user-menu.js', 'js/carrito-dinamico.js', 'js/productos-dinamicos.js'],
+    # Después de jQuery/Backbone
+    'tienda-backbone.js': ['js/favoritos-backbone.js', 'js/carrito-sync.js'],
+}
+
+MANIFIESTO = 'manifest.json'
+URL_ASSETS = '/assets/'
+TIPOS = {'.js': 'text/javascript', '.css': 'text/css'}
+
+_estado = {'manifiesto': None, 'activo': False, 'carpeta': None}
+
+
+def _minificar(nombre, contenido):
+    if nombre.endswith('.js'):
+        return rjsmin.jsmin(contenido) if rjsmin else contenido
+    return rcssmin.cssmin(contenido) if rcssmin else contenido
+
+
+def _escribir(ruta, datos):
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    with open(temporal, 'wb') as archivo:
+        archivo.write(datos)
+    os.replace(temporal, ruta)
+
+
+def construir(static_folder, carpeta_salida):
+    """Genera todos los bundles y el manifiesto; devuelve el manifiesto"""
+    os.makedirs(carpeta_salida, exist_ok=True)
+    manifiesto = {}
+    for nombre, fuentes in BUNDLES.items():
+        partes = []
+        for fuente in fuentes:
+            with open(os.path.join(static_folder, fuente), encoding='utf-8') as archivo:
+                partes.append(archivo.read())
+        # ';' entre archivos JS: uno que no termine en ';' no debe pegarse con el siguiente
+        separador = ';\n' if nombre.endswith('.js') else '\n'
+        datos = _minificar(nombre, separador.join(partes)).encode('utf-8')
+
+        base, extension = os.path.splitext(nombre)
+        archivo = f'{base}.{hashlib.sha256(datos).hexdigest()[:12]}{extension}'
+        ruta = os.path.join(carpeta_salida, archivo)
+        if not os.path.exists(ruta):
+            _escribir(ruta + '.gz', gzip.compress(datos, compresslevel=9, mtime=0))
+            if brotli:
+                _escribir(ruta + '.br', brotli.compress(datos, quality=11))
+            # El archivo base al final: si existe, sus variantes también
+            _escribir(ruta, datos)
+        manifiesto[nombre] = {'archivo': archivo, 'fuentes': fuentes, 'bytes': len(datos)}
+
+    _escribir(os.path.join(carpeta_salida, MANIFIESTO),
+              json.dumps(manifiesto, indent=2, sort_keys=True).encode('utf-8'))
+    return manifiesto
+
+
+def _desactualizado(static_folder, carpeta_salida):
+    ruta = os.path.join(carpeta_salida, MANIFIESTO)
+    if not os.path.exists(ruta):
+        return True
+    generado = os.path.getmtime(ruta)
+    return any(
+        os.path.getmtime(os.path.join(static_folder, fuente)) > generado
+        for fuentes in BUNDLES.values() for fuente in fuentes
+    )
+
+
+def init_app(app):
+    """Registra `asset_urls` en Jinja y construye los bundles si faltan o están viejos"""
+    app.jinja_env.globals['asset_urls'] = asset_urls
+    carpeta = app.config['ASSETS_DIR']
+    _estado['carpeta'] = carpeta
+    _estado['activo'] = app.config.get('ASSETS_BUNDLES_ENABLED', True) and not app.debug
+    if not _estado['activo']:
+        return
+    try:
+        if _desactualizado(app.static_folder, carpeta):
+            manifiesto = construir(app.static_folder, carpeta)
+            print(f"✅ Bundles estáticos generados: {', '.join(sorted(manifiesto))}")
+        else:
+            with open(os.path.join(carpeta, MANIFIESTO), encoding='utf-8') as archivo:
+                manifiesto = json.load(archivo)
+        _estado['manifiesto'] = manifiesto
+    except Exception as e:
+        print(f"⚠️ No se pudieron generar los bundles, se usan los archivos originales: {e}")
+        _estado['manifiesto'] = None
+
+
+def asset_urls(nombre):
+    """URLs a incluir en la plantilla para el bundle `nombre` (una sola si está construido)"""
+    manifiesto = _estado['manifiesto'] if _estado['activo'] else None
+    if manifiesto and nombre in manifiesto:
+        return [URL_ASSETS + manifiesto[nombre]['archivo']]
+    return ['/static/' + fuente for fuente in BUNDLES[nombre]]
+
+
+def archivo_para(archivo, codificaciones):
+    """(ruta, Content-Encoding) de la mejor variante de `archivo` para el cliente, o (None, None)"""
+    carpeta = _estado['carpeta']
+    if not carpeta or os.path.splitext(archivo)[1] not in TIPOS or os.sep in archivo or '/' in archivo:
+        return None, None
+    ruta = os.path.join(carpeta, archivo)
+    if not os.path.isfile(ruta):
+        return None, None
+    for codificacion, extension in (('br', '.br'), ('gzip', '.gz')):
+        if codificacion in codificaciones and os.path.isfile(ruta + extension):
+            return ruta + extension, codificacion
+    return ruta, None
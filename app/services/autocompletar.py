@@ -0,0 +1,86 @@
+"""Autocompletado de nombres de producto desde un índice de prefijos en memoria.
+
+El índice es una lista ordenada de (clave, posición, id_producto) donde cada
+clave es el nombre normalizado a partir de cada una de sus palabras, así "xb"
+encuentra "Control Xbox Elite". Se consulta con bisect, sin tocar la BD, y se
+deriva del snapshot del catálogo: cuando cambian productos se actualizan solo
+sus entradas en lugar de reconstruir el índice completo.
+"""
+from bisect import bisect_left, insort
+
+from app.services.busqueda import normalizar_texto
+from app.services.cache_catalogo import catalogo_cache
+
+AUTOCOMPLETAR_LIMITE_DEFAULT = 8
+AUTOCOMPLETAR_LIMITE_MAX = 20
+
+
+def _entradas(registro):
+    palabras = normalizar_texto(registro.nombre).split()
+    return [(' '.join(palabras[i:]), i, registro.id) for i in range(len(palabras))]
+
+
+class IndicePrefijos:
+    def __init__(self, entradas):
+        self.entradas = entradas  # lista ordenada de (clave, posicion, id_producto)
+
+    @classmethod
+    def construir(cls, snapshot):
+        entradas = []
+        for registro in snapshot.registros.values():
+            entradas.extend(_entradas(registro))
+        entradas.sort()
+        return cls(entradas)
+
+    @classmethod
+    def actualizar(cls, previo, snapshot, cambios):
+        """Copia el índice anterior reemplazando solo las entradas de los productos cambiados"""
+        entradas = [e for e in previo.entradas if e[2] not in cambios] if cambios else list(previo.entradas)
+        for producto_id in cambios:
+            registro = snapshot.registros.get(producto_id)
+            if registro:
+                for entrada in _entradas(registro):
+                    insort(entradas, entrada)
+        return cls(entradas)
+
+    def sugerir(self, prefijo, registros, limite):
+        """Hasta `limite` productos cuyo nombre tiene una palabra que empieza con `prefijo`"""
+        inicio = bisect_left(self.entradas, (prefijo,))
+        candidatos = {}
+        # Revisar un número acotado de entradas para mantener la consulta en microsegundos
+        for clave, posicion, producto_id in self.entradas[inicio:inicio + limite * 10]:
+            if not clave.startswith(prefijo):
+                break
+            registro = registros.get(producto_id)
+            if registro is None or registro.stock <= 0:
+                continue
+            if producto_id not in candidatos or posicion < candidatos[producto_id][0]:
+                candidatos[producto_id] = (posicion, len(registro.nombre), registro.nombre)
+        # Primero coincidencias al inicio del nombre, luego nombres más cortos
+        mejores = sorted(candidatos.items(), key=lambda item: item[1])[:limite]
+        return [producto_id for producto_id, _ in mejores]
+
+
+def normalizar_limite(limite):
+    try:
+        return max(1, min(int(limite), AUTOCOMPLETAR_LIMITE_MAX))
+    except (TypeError, ValueError):
+        return AUTOCOMPLETAR_LIMITE_DEFAULT
+
+
+def sugerencias(consulta, limite=AUTOCOMPLETAR_LIMITE_DEFAULT):
+    prefijo = ' '.join(normalizar_texto(consulta).split())
+    if not prefijo:
+        return []
+    snapshot = catalogo_cache.obtener()
+    indice = snapshot.derivado('autocompletar', IndicePrefijos.construir, IndicePrefijos.actualizar)
+    resultado = []
+    for producto_id in indice.sugerir(prefijo, snapshot.registros, limite):
+        producto = snapshot.producto(producto_id)
+        resultado.append({
+            'id': producto['id'],
+            'nombre': producto['nombre'],
+            'categoria': producto['categoria'],
+            'imagen': producto['imagen']
+        })
+    return resultado
@@ -0,0 +1,309 @@
+"""Índice de búsqueda de texto completo de productos.
+
+Indexa nombre, categoría y descripción con pesos distintos y ordena por relevancia:
+- PostgreSQL: tabla `productos_busqueda` con un `tsvector` (índice GIN) y, si la
+  extensión pg_trgm está disponible, un índice de trigramas para tolerar errores.
+- SQLite (desarrollo): tabla virtual FTS5 `productos_fts` con ranking bm25.
+
+Los textos se normalizan en Python (minúsculas y sin acentos) tanto al indexar
+como al consultar, así "cancion" encuentra "Canción" sin depender de `unaccent`.
+El índice se mantiene en la misma transacción que modifica los productos.
+"""
+import re
+import unicodedata
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, inspect, text, bindparam, Integer, column
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import db
+from app.models.models import Producto, Categoria
+from app.services.catalogo import serializar_producto, reservado_por_producto
+from app.services.cache_catalogo import catalogo_cache
+
+BUSQUEDA_LIMITE_DEFAULT = 20
+BUSQUEDA_LIMITE_MAX = 50
+
+_TOKEN = re.compile(r'[^\W_]+', re.UNICODE)
+
+_estado = {'eventos': False, 'trigramas': False}
+
+
+def normalizar_texto(valor):
+    """Minúsculas y sin diacríticos: 'Canción Ñandú' -> 'cancion nandu'"""
+    if not valor:
+        return ''
+    descompuesto = unicodedata.normalize('NFKD', valor)
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def _tokens(consulta):
+    return _TOKEN.findall(normalizar_texto(consulta))[:10]
+
+
+def _es_postgres(bind):
+    return bind.dialect.name == 'postgresql'
+
+
+def init_app(app):
+    if _estado['eventos']:
+        return
+    event.listen(db.session, 'after_flush', _despues_flush)
+    _estado['eventos'] = True
+
+
+def preparar_indice():
+    """Crear las estructuras del índice si no existen y poblarlo si está vacío"""
+    engine = db.engine
+    with engine.begin() as conexion:
+        if _es_postgres(engine):
+            try:
+                with conexion.begin_nested():
+                    conexion.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                _estado['trigramas'] = True
+            except Exception as e:
+                print(f"⚠️ pg_trgm no disponible, búsqueda sin trigramas: {e}")
+            conexion.execute(text(
+                'CREATE TABLE IF NOT EXISTS productos_busqueda ('
+                ' producto_id INTEGER PRIMARY KEY REFERENCES productos(id_producto) ON DELETE CASCADE,'
+                ' documento TSVECTOR NOT NULL,'
+                ' texto TEXT NOT NULL)'
+            ))
+            conexion.execute(text(
+                'CREATE INDEX IF NOT EXISTS ix_productos_busqueda_documento '
+                'ON productos_busqueda USING GIN (documento)'
+            ))
+            if _estado['trigramas']:
+                conexion.execute(text(
+                    'CREATE INDEX IF NOT EXISTS ix_productos_busqueda_trgm '
+                    'ON productos_busqueda USING GIN (texto gin_trgm_ops)'
+                ))
+            total = conexion.execute(text('SELECT COUNT(*) FROM productos_busqueda')).scalar()
+        else:
+            conexion.execute(text(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS productos_fts USING fts5('
+                "nombre, categoria, descripcion, tokenize='unicode61 remove_diacritics 2')"
+            ))
+            total = conexion.execute(text('SELECT COUNT(*) FROM productos_fts')).scalar()
+
+        if not total:
+            reindexar(conexion)
+
+
+def reindexar(conexion, producto_ids=None):
+    """(Re)escribir las filas del índice; sin ids reconstruye el índice completo"""
+    sql = (
+        'SELECT p.id_producto, p.nombre, p.descripcion, c.nombre AS categoria '
+        'FROM productos p LEFT JOIN categorias c ON c.id_categoria = p.categoria_id'
+    )
+    if producto_ids is None:
+        filas = conexion.execute(text(sql)).all()
+    else:
+        producto_ids = list(producto_ids)
+        if not producto_ids:
+            return 0
+        filas = conexion.execute(
+            text(sql + ' WHERE p.id_producto IN :ids').bindparams(bindparam('ids', expanding=True)),
+            {'ids': producto_ids}
+        ).all()
+
+    postgres = _es_postgres(conexion)
+    tabla = 'productos_busqueda' if postgres else 'productos_fts'
+    columna_id = 'producto_id' if postgres else 'rowid'
+
+    if producto_ids is None:
+        conexion.execute(text(f'DELETE FROM {tabla}'))
+    else:
+        conexion.execute(
+            text(f'DELETE FROM {tabla} WHERE {columna_id} IN :ids').bindparams(bindparam('ids', expanding=True)),
+            {'ids': producto_ids}
+        )
+
+    documentos = [{
+        'id': fila.id_producto,
+        'nombre': normalizar_texto(fila.nombre),
+        'categoria': normalizar_texto(fila.categoria),
+        'descripcion': normalizar_texto(fila.descripcion),
+    } for fila in filas]
+
+    if documentos:
+        if postgres:
+            conexion.execute(text(
+                'INSERT INTO productos_busqueda (producto_id, documento, texto) VALUES (:id, '
+                "setweight(to_tsvector('spanish', :nombre), 'A') || "
+                "setweight(to_tsvector('spanish', :categoria), 'B') || "
+                "setweight(to_tsvector('spanish', :descripcion), 'C'), "
+                ":nombre)"
+            ), documentos)
+        else:
+            conexion.execute(text(
+                'INSERT INTO productos_fts (rowid, nombre, categoria, descripcion) '
+                'VALUES (:id, :nombre, :categoria, :descripcion)'
+            ), documentos)
+    return len(documentos)
+
+
+def _cambio_texto(obj, atributos):
+    estado = inspect(obj)
+    return any(estado.attrs[a].history.has_changes() for a in atributos)
+
+
+def _despues_flush(session, flush_context):
+    producto_ids = set()
+    categoria_ids = set()
+    for obj in session.new:
+        if isinstance(obj, Producto):
+            producto_ids.add(obj.id_producto)
+    for obj in session.dirty:
+        # Los cambios de stock/precio no afectan el índice; solo los de texto
+        if isinstance(obj, Producto) and _cambio_texto(obj, ('nombre', 'descripcion', 'categoria_id')):
+            producto_ids.add(obj.id_producto)
+        elif isinstance(obj, Categoria) and _cambio_texto(obj, ('nombre',)):
+            categoria_ids.add(obj.id_categoria)
+
+    eliminados = [obj.id_producto for obj in session.deleted if isinstance(obj, Producto)]
+    if not producto_ids and not categoria_ids and not eliminados:
+        return
+
+    conexion = session.connection()
+    if categoria_ids:
+        # Renombrar una categoría cambia el documento de todos sus productos
+        filas = conexion.execute(
+            text('SELECT id_producto FROM productos WHERE categoria_id IN :ids')
+            .bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(categoria_ids)}
+        ).scalars()
+        producto_ids.update(filas)
+    if eliminados:
+        reindexar(conexion, eliminados)
+    if producto_ids:
+        reindexar(conexion, producto_ids)
+
+
+def _consulta_fts(tokens, postgres):
+    if postgres:
+        return ' & '.join(f'{t}:*' for t in tokens)
+    return ' '.join(f'"{t}"*' for t in tokens)
+
+
+def subconsulta_ids(consulta):
+    """SELECT de ids de productos que coinciden, para usar en `Producto.id_producto.in_(...)`"""
+    tokens = _tokens(consulta)
+    if not tokens:
+        return None
+    postgres = _es_postgres(db.engine)
+    if postgres:
+        condicion = "documento @@ to_tsquery('spanish', :consulta)"
+        if _estado['trigramas']:
+            condicion = f'({condicion} OR texto % :texto)'
+        sql = text(f'SELECT producto_id AS id FROM productos_busqueda WHERE {condicion}')
+    else:
+        sql = text('SELECT rowid AS id FROM productos_fts WHERE productos_fts MATCH :consulta')
+    parametros = {'consulta': _consulta_fts(tokens, postgres)}
+    if postgres and _estado['trigramas']:
+        parametros['texto'] = ' '.join(tokens)
+    return sql.bindparams(**parametros).columns(column('id', Integer))
+
+
+def normalizar_paginacion(pagina, limite):
+    try:
+        pagina = max(1, int(pagina))
+    except (TypeError, ValueError):
+        pagina = 1
+    try:
+        limite = max(1, min(int(limite), BUSQUEDA_LIMITE_MAX))
+    except (TypeError, ValueError):
+        limite = BUSQUEDA_LIMITE_DEFAULT
+    return pagina, limite
+
+
+def buscar_ids(consulta, pagina=1, limite=BUSQUEDA_LIMITE_DEFAULT, categoria_id=None,
+               solo_activos=True, solo_con_stock=False):
+    """Ids de productos ordenados por relevancia; devuelve (ids, hay_mas)"""
+    tokens = _tokens(consulta)
+    if not tokens:
+        return [], False
+
+    postgres = _es_postgres(db.engine)
+    filtros = []
+    if solo_activos:
+        filtros.append('p.activo = :activo')
+    if solo_con_stock:
+        # Stock disponible: físico menos reservas vigentes (ver services/inventario.py)
+        filtros.append('p.stock > (SELECT COALESCE(SUM(r.cantidad), 0) FROM reservas_stock r '
+                       'WHERE r.producto_id = p.id_producto AND r.expira_en > :ahora)')
+    if categoria_id:
+        filtros.append('p.categoria_id = :categoria_id')
+
+    if postgres:
+        condicion = "b.documento @@ to_tsquery('spanish', :consulta)"
+        rango = "ts_rank_cd(b.documento, to_tsquery('spanish', :consulta))"
+        if _estado['trigramas']:
+            condicion = f'({condicion} OR b.texto % :texto)'
+            rango = f'({rango} + similarity(b.texto, :texto))'
+        sql = (
+            f'SELECT b.producto_id AS id, {rango} AS rango FROM productos_busqueda b '
+            'JOIN productos p ON p.id_producto = b.producto_id '
+            f"WHERE {' AND '.join([condicion] + filtros)} "
+            'ORDER BY rango DESC, b.producto_id LIMIT :limite OFFSET :offset'
+        )
+    else:
+        # bm25: menor es mejor; pesos nombre > categoría > descripción
+        sql = (
+            'SELECT f.rowid AS id, bm25(productos_fts, 10.0, 4.0, 1.0) AS rango FROM productos_fts f '
+            'JOIN productos p ON p.id_producto = f.rowid '
+            f"WHERE {' AND '.join(['productos_fts MATCH :consulta'] + filtros)} "
+            'ORDER BY rango, f.rowid LIMIT :limite OFFSET :offset'
+        )
+
+    parametros = {
+        'consulta': _consulta_fts(tokens, postgres),
+        'texto': ' '.join(tokens),
+        'activo': True,
+        'categoria_id': categoria_id,
+        'limite': limite + 1,
+        'offset': (pagina - 1) * limite,
+        'ahora': datetime.utcnow(),
+    }
+    if not (postgres and _estado['trigramas']):
+        parametros.pop('texto')
+    if not categoria_id:
+        parametros.pop('categoria_id')
+    if not solo_activos:
+        parametros.pop('activo')
+    if not solo_con_stock:
+        parametros.pop('ahora')
+
+    consulta_sql = text(sql)
+    if solo_con_stock:
+        # Mismo formato de fecha que las columnas DateTime del ORM
+        consulta_sql = consulta_sql.bindparams(bindparam('ahora', type_=db.DateTime))
+    ids = [fila.id for fila in db.session.execute(consulta_sql, parametros)]
+    return ids[:limite], len(ids) > limite
+
+
+def buscar_productos(consulta, pagina=1, limite=BUSQUEDA_LIMITE_DEFAULT, categoria_id=None,
+                     solo_con_stock=False):
+    """Página de productos activos serializados, ordenados por relevancia"""
+    ids, hay_mas = buscar_ids(consulta, pagina, limite, categoria_id=categoria_id,
+                              solo_con_stock=solo_con_stock)
+
+    payloads = {}
+    if ids and current_app.config.get('CATALOGO_CACHE_ENABLED', True):
+        snapshot = catalogo_cache.obtener()
+        payloads = {i: snapshot.producto(i) for i in ids if snapshot.producto(i)}
+    faltantes = [i for i in ids if i not in payloads]
+    if faltantes:
+        reservado = reservado_por_producto(faltantes)
+        for producto in Producto.query\
+                .options(joinedload(Producto.categoria), selectinload(Producto.imagenes_derivadas))\
+                .filter(Producto.id_producto.in_(faltantes)).all():
+            payloads[producto.id_producto] = serializar_producto(producto, reservado.get(producto.id_producto, 0))
+
+    return {
+        'productos': [payloads[i] for i in ids if i in payloads],
+        'pagina': pagina,
+        'limite': limite,
+        'siguiente_pagina': pagina + 1 if hay_mas else None
+    }
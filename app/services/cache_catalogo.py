@@ -0,0 +1,326 @@
+"""Snapshot en memoria del catálogo, versionado y con invalidación write-through.
+
+El snapshot guarda los productos activos y las categorías ya serializados junto
+con la versión del catálogo (tabla `catalogo_version`). Cualquier transacción que
+toque un Producto o una Categoría incrementa esa versión al terminar su commit, en
+una transacción propia y corta, y el worker marca los productos afectados para
+recargarlos. La fila de la versión no entra en la transacción del cambio: si lo
+hiciera, todos los checkouts y reservas de la tienda esperarían su bloqueo hasta
+el commit. Los cambios hechos por otros workers se detectan comparando la versión
+de la BD cada CATALOGO_CACHE_VERIFICAR_SEGUNDOS, así que las lecturas normales no
+tocan la BD.
+"""
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from flask import current_app
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import db
+from app.models.models import Producto, Categoria, CatalogoVersion
+from app.services.catalogo import (
+    FECHA_SIN_VALOR, ORDENES, serializar_producto, codificar_cursor, decodificar_cursor,
+    reservado_por_producto
+)
+
+_Registro = namedtuple('_Registro', 'id categoria_id stock nombre precio fecha_creacion payload')
+
+_CLAVES = {
+    'recientes': lambda r: r.fecha_creacion or FECHA_SIN_VALOR,
+    'precio_asc': lambda r: r.precio,
+    'precio_desc': lambda r: r.precio,
+    'nombre': lambda r: r.nombre,
+}
+
+
+def serializar_categoria(categoria):
+    return {
+        'id': categoria.id_categoria,
+        'nombre': categoria.nombre,
+        'descripcion': categoria.descripcion
+    }
+
+
+def _registro(producto, reservado=0):
+    payload = serializar_producto(producto, reservado)
+    return _Registro(
+        id=producto.id_producto,
+        categoria_id=producto.categoria_id,
+        stock=payload['stock'],
+        nombre=producto.nombre,
+        precio=producto.precio,
+        fecha_creacion=producto.fecha_creacion,
+        payload=payload
+    )
+
+
+class CatalogoSnapshot:
+    """Vista inmutable del catálogo en una versión dada"""
+
+    def __init__(self, version, registros, categorias, anterior=None, cambios=None):
+        self.version = version
+        self.registros = registros  # id_producto -> _Registro
+        self.categorias = categorias  # lista serializada
+        self.categorias_por_nombre = {c['nombre']: c['id'] for c in categorias}
+        self._indices = {}
+        self._derivados = {}
+        # Snapshot del que se parchó este y los ids que cambiaron, para derivados incrementales
+        self._anterior = anterior
+        self._cambios = cambios or set()
+
+    def derivado(self, nombre, construir, actualizar=None):
+        """Estructura calculada a partir del snapshot (índices, conteos...), memoizada por versión.
+
+        Si el snapshot anterior ya la tenía y se da `actualizar(previo, snapshot, ids_cambiados)`,
+        se actualiza incrementalmente en lugar de reconstruirla.
+        """
+        valor = self._derivados.get(nombre)
+        if valor is None:
+            previo = self._anterior._derivados.get(nombre) if self._anterior else None
+            if previo is not None and actualizar is not None:
+                valor = actualizar(previo, self, self._cambios)
+            else:
+                valor = construir(self)
+            self._derivados[nombre] = valor
+        return valor
+
+    def producto(self, producto_id):
+        registro = self.registros.get(producto_id)
+        return registro.payload if registro else None
+
+    def _indice(self, orden, categoria_id):
+        """Lista ordenada ascendente de (clave, id) por orden y categoría (None = todas)"""
+        llave = (orden, categoria_id)
+        indice = self._indices.get(llave)
+        if indice is None:
+            clave = _CLAVES[orden]
+            indice = sorted(
+                (clave(r), r.id) for r in self.registros.values()
+                if categoria_id is None or r.categoria_id == categoria_id
+            )
+            self._indices[llave] = indice
+        return indice
+
+    def listar(self, orden, limite, cursor=None, categoria=None, categoria_id=None,
+               solo_con_stock=True):
+        """Misma semántica que catalogo.listar_productos pero sin consultar la BD"""
+        if categoria:
+            id_por_nombre = self.categorias_por_nombre.get(categoria)
+            if id_por_nombre is None or (categoria_id and int(categoria_id) != id_por_nombre):
+                return {'productos': [], 'next_cursor': None, 'orden': orden, 'limite': limite}
+            categoria_id = id_por_nombre
+        categoria_id = int(categoria_id) if categoria_id else None
+
+        indice = self._indice(orden, categoria_id)
+        descendente = ORDENES[orden][1]
+
+        if cursor:
+            posicion = decodificar_cursor(cursor, orden)
+            if descendente:
+                rango = range(bisect_left(indice, posicion) - 1, -1, -1)
+            else:
+                rango = range(bisect_right(indice, posicion), len(indice))
+        else:
+            rango = range(len(indice) - 1, -1, -1) if descendente else range(len(indice))
+
+        seleccion = []
+        for i in rango:
+            registro = self.registros[indice[i][1]]
+            if solo_con_stock and registro.stock <= 0:
+                continue
+            seleccion.append(indice[i])
+            if len(seleccion) > limite:
+                break
+
+        hay_mas = len(seleccion) > limite
+        seleccion = seleccion[:limite]
+        next_cursor = None
+        if hay_mas:
+            clave, ultimo_id = seleccion[-1]
+            next_cursor = codificar_cursor(orden, clave, ultimo_id)
+
+        return {
+            'productos': [self.registros[producto_id].payload for _, producto_id in seleccion],
+            'next_cursor': next_cursor,
+            'orden': orden,
+            'limite': limite
+        }
+
+
+def _leer_version_bd():
+    return db.session.execute(
+        select(CatalogoVersion.version).where(CatalogoVersion.id == 1)
+    ).scalar() or 0
+
+
+def _incrementar_version(conexion):
+    tabla = CatalogoVersion.__table__
+    resultado = conexion.execute(
+        update(tabla).where(tabla.c.id == 1).values(version=tabla.c.version + 1)
+    )
+    if resultado.rowcount == 0:
+        conexion.execute(insert(tabla).values(id=1, version=1))
+        return 1
+    return conexion.execute(select(tabla.c.version).where(tabla.c.id == 1)).scalar()
+
+
+class CatalogoCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._invalido = False
+        self._pendientes = set()
+        self._version_objetivo = None
+        self._ultima_verificacion = 0.0
+        self._eventos_registrados = False
+
+    def init_app(self, app):
+        if self._eventos_registrados:
+            return
+        event.listen(db.session, 'after_flush', _despues_flush)
+        event.listen(db.session, 'after_commit', _despues_commit)
+        event.listen(db.session, 'after_rollback', _despues_rollback)
+        self._eventos_registrados = True
+
+    @property
+    def version(self):
+        return self.obtener().version
+
+    def obtener(self):
+        """Snapshot vigente; solo consulta la BD si hubo cambios o toca verificar versión"""
+        snapshot = self._snapshot
+        intervalo = current_app.config.get('CATALOGO_CACHE_VERIFICAR_SEGUNDOS', 5)
+        ahora = time.monotonic()
+        if (snapshot is not None and not self._invalido and not self._pendientes
+                and ahora - self._ultima_verificacion < intervalo):
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or self._invalido:
+                snapshot = self._cargar_completo()
+            else:
+                if ahora - self._ultima_verificacion >= intervalo:
+                    self._ultima_verificacion = ahora
+                    esperado = self._version_objetivo or snapshot.version
+                    if _leer_version_bd() != esperado:
+                        snapshot = self._cargar_completo()
+                if self._pendientes:
+                    snapshot = self._aplicar_pendientes(snapshot)
+            self._snapshot = snapshot
+            return snapshot
+
+    def invalidar(self):
+        with self._lock:
+            self._invalido = True
+
+    def registrar_commit(self, version, producto_ids, categorias):
+        """Llamado tras el commit de una transacción que modificó el catálogo"""
+        with self._lock:
+            if self._snapshot is None:
+                return
+            esperado = self._version_objetivo or self._snapshot.version
+            if categorias or version != esperado + 1:
+                # Hubo cambios de otros workers entre medio: recargar todo
+                self._invalido = True
+                return
+            self._pendientes.update(producto_ids)
+            self._version_objetivo = version
+
+    def _cargar_completo(self):
+        # Leer la versión antes que los datos: si alguien escribe entre ambas lecturas
+        # la siguiente verificación verá una versión distinta y recargará.
+        version = _leer_version_bd()
+        productos = Producto.query.options(joinedload(Producto.categoria), selectinload(Producto.imagenes_derivadas))\
+            .filter(Producto.activo == True).all()
+        categorias = Categoria.query.order_by(Categoria.id_categoria).all()
+        reservado = reservado_por_producto()
+        self._invalido = False
+        self._pendientes = set()
+        self._version_objetivo = None
+        self._ultima_verificacion = time.monotonic()
+        print(f"📚 Catálogo en memoria cargado: {len(productos)} productos (versión {version})")
+        return CatalogoSnapshot(
+            version,
+            {p.id_producto: _registro(p, reservado.get(p.id_producto, 0)) for p in productos},
+            [serializar_categoria(c) for c in categorias]
+        )
+
+    def _aplicar_pendientes(self, snapshot):
+        ids = self._pendientes
+        productos = Producto.query.options(joinedload(Producto.categoria), selectinload(Producto.imagenes_derivadas))\
+            .filter(Producto.id_producto.in_(ids)).all()
+        reservado = reservado_por_producto(ids)
+        registros = dict(snapshot.registros)
+        for producto_id in ids:
+            registros.pop(producto_id, None)
+        for producto in productos:
+            if producto.activo:
+                registros[producto.id_producto] = _registro(producto, reservado.get(producto.id_producto, 0))
+        # Solo se conserva un nivel de historial para no encadenar snapshots viejos en memoria
+        snapshot._anterior = None
+        nuevo = CatalogoSnapshot(self._version_objetivo, registros, snapshot.categorias,
+                                 anterior=snapshot, cambios=set(ids))
+        self._pendientes = set()
+        self._version_objetivo = None
+        return nuevo
+
+
+catalogo_cache = CatalogoCache()
+
+
+def version_catalogo():
+    """Versión vigente del catálogo (desde memoria si el cache está activo)"""
+    if current_app.config.get('CATALOGO_CACHE_ENABLED', True):
+        return catalogo_cache.version
+    return _leer_version_bd()
+
+
+def registrar_cambio_catalogo(session, producto_ids=(), categorias=False):
+    """Marca el catálogo como modificado en la transacción actual de `session`.
+
+    Los cambios hechos con el ORM se detectan solos en after_flush; usar esta
+    función para UPDATE/DELETE directos que no pasan por la unidad de trabajo.
+    La versión se incrementa después del commit (ver _despues_commit).
+    """
+    cambios = session.info.setdefault('catalogo_cambios', {'ids': set(), 'categorias': False})
+    cambios['ids'].update(producto_ids)
+    cambios['categorias'] = cambios['categorias'] or categorias
+
+
+def _despues_flush(session, flush_context):
+    producto_ids = set()
+    categorias = False
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, (Producto, Categoria)):
+            continue
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        if isinstance(obj, Producto):
+            producto_ids.add(obj.id_producto)
+        else:
+            categorias = True
+    if producto_ids or categorias:
+        registrar_cambio_catalogo(session, producto_ids, categorias)
+
+
+def _despues_commit(session):
+    cambios = session.info.pop('catalogo_cambios', None)
+    if not cambios:
+        return
+    try:
+        with db.engine.begin() as conexion:
+            version = _incrementar_version(conexion)
+    except Exception as e:
+        # Los otros workers verán el cambio con el siguiente incremento; este recarga todo
+        print(f"⚠️ No se pudo incrementar la versión del catálogo: {e}")
+        catalogo_cache.invalidar()
+        return
+    catalogo_cache.registrar_commit(version, cambios['ids'], cambios['categorias'])
+
+
+def _despues_rollback(session):
+    session.info.pop('catalogo_cambios', None)
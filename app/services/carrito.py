@@ -0,0 +1,457 @@
+"""Servicio único del carrito: lectura, alta, cambio de cantidad y eliminación de items.
+
+Los blueprints (routes/web.py, carrito/routes.py y api/carrito.py) solo adaptan
+estas funciones a su formato de respuesta. Leer un carrito cuesta siempre dos
+consultas (carrito + items con producto y categoría) sin importar cuántos items
+tenga.
+
+Agregar un producto es un solo INSERT ... SELECT ... ON CONFLICT DO UPDATE sobre
+el índice único (carrito_id, producto_id): la validación de stock va dentro de la
+misma sentencia, así un doble clic nunca crea filas duplicadas ni supera el stock.
+PostgreSQL y SQLite (>= 3.35) comparten la sintaxis; se construye con el `insert`
+específico de cada dialecto.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from sqlalchemy import and_, func, inspect, literal, select, text, update, delete
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import db
+from app.models.models import Carrito, CarritoItem, Producto
+from app.models.pedido import PedidoItem
+from app.services.db_util import insert_dialecto
+from app.services.eventos import notificar
+
+
+CENTAVOS = Decimal('0.01')
+
+
+class ErrorCarrito(ValueError):
+    """Operación de carrito rechazada; `status` es el código HTTP sugerido."""
+
+    def __init__(self, mensaje, status=400):
+        super().__init__(mensaje)
+        self.status = status
+
+
+def normalizar_carritos():
+    """Fusiona carritos activos e items duplicados para poder crear los índices únicos.
+
+    Se ejecuta al iniciar, antes de crear índices faltantes; si los índices ya
+    existen no hay duplicados posibles y no hace nada.
+    """
+    existentes = {i['name'] for i in inspect(db.engine).get_indexes('carrito_items')}
+    existentes |= {i['name'] for i in inspect(db.engine).get_indexes('carrito')}
+    if {'uq_carrito_items_carrito_producto', 'uq_carrito_usuario_activo'} <= existentes:
+        return
+
+    carritos = Carrito.__table__
+    items = CarritoItem.__table__
+
+    # 1. Un solo carrito activo por usuario: los items de los demás pasan al más antiguo
+    usuarios = db.session.execute(
+        select(carritos.c.usuario_id).where(carritos.c.activo == True)
+        .group_by(carritos.c.usuario_id).having(func.count() > 1)
+    ).scalars().all()
+    for usuario_id in usuarios:
+        ids = db.session.execute(
+            select(carritos.c.id_carrito)
+            .where(carritos.c.usuario_id == usuario_id, carritos.c.activo == True)
+            .order_by(carritos.c.id_carrito)
+        ).scalars().all()
+        conservar, sobrantes = ids[0], ids[1:]
+        db.session.execute(update(items).where(items.c.carrito_id.in_(sobrantes)).values(carrito_id=conservar))
+        db.session.execute(update(carritos).where(carritos.c.id_carrito.in_(sobrantes)).values(activo=False))
+
+    # 2. Un solo item por (carrito, producto): se suman las cantidades en el más antiguo
+    grupos = db.session.execute(
+        select(items.c.carrito_id, items.c.producto_id, func.min(items.c.id_item), func.sum(items.c.cantidad))
+        .group_by(items.c.carrito_id, items.c.producto_id).having(func.count() > 1)
+    ).all()
+    for carrito_id, producto_id, conservar, cantidad in grupos:
+        db.session.execute(update(items).where(items.c.id_item == conservar).values(cantidad=cantidad))
+        db.session.execute(delete(items).where(
+            items.c.carrito_id == carrito_id, items.c.producto_id == producto_id, items.c.id_item != conservar
+        ))
+
+    db.session.commit()
+    if usuarios or grupos:
+        print(f"🧹 Carritos normalizados: {len(usuarios)} usuarios con varios carritos activos, "
+              f"{len(grupos)} productos duplicados fusionados")
+
+
+def obtener_carrito_id(usuario_id, crear=False):
+    """Id del carrito activo del usuario; con `crear` lo crea si no existe (sin duplicar)"""
+    carritos = Carrito.__table__
+    consulta = select(carritos.c.id_carrito).where(carritos.c.usuario_id == usuario_id, carritos.c.activo == True)
+    carrito_id = db.session.execute(consulta).scalar()
+    if carrito_id is None and crear:
+        # Si otra petición lo crea al mismo tiempo, el índice único parcial descarta este INSERT
+        # (el predicado debe coincidir textualmente con el del índice para que SQLite lo reconozca)
+        db.session.execute(
+            insert_dialecto(carritos)
+            .values(usuario_id=usuario_id, activo=True, fecha_creacion=datetime.utcnow())
+            .on_conflict_do_nothing(index_elements=['usuario_id'], index_where=text('activo'))
+        )
+        carrito_id = db.session.execute(consulta).scalar()
+    return carrito_id
+
+
+def _sentencia_agregar(usuario_id, producto_id, cantidad):
+    items = CarritoItem.__table__
+    productos = Producto.__table__
+    carritos = Carrito.__table__
+    # El carrito activo se resuelve dentro de la misma sentencia (join), sin consulta previa
+    origen = select(
+        carritos.c.id_carrito, productos.c.id_producto, literal(cantidad), productos.c.precio,
+        literal(datetime.utcnow(), type_=items.c.fecha_agregado.type)
+    ).select_from(
+        productos.join(carritos, and_(carritos.c.usuario_id == usuario_id, carritos.c.activo == True))
+    ).where(
+        productos.c.id_producto == producto_id,
+        productos.c.activo == True,
+        productos.c.stock >= cantidad
+    )
+    sentencia = insert_dialecto(items).from_select(
+        ['carrito_id', 'producto_id', 'cantidad', 'precio_unitario', 'fecha_agregado'], origen
+    )
+    stock = select(productos.c.stock).where(productos.c.id_producto == items.c.producto_id).scalar_subquery()
+    return sentencia.on_conflict_do_update(
+        index_elements=['carrito_id', 'producto_id'],
+        set_={'cantidad': items.c.cantidad + sentencia.excluded.cantidad},
+        # Si la suma supera el stock no se actualiza y la sentencia no devuelve filas
+        where=items.c.cantidad + sentencia.excluded.cantidad <= stock
+    ).returning(items.c.carrito_id, items.c.cantidad)
+
+
+def _motivo_rechazo(producto_id):
+    """Solo tras un rechazo: distinguir producto inexistente de stock insuficiente"""
+    stock = db.session.execute(
+        select(Producto.stock).where(Producto.id_producto == producto_id, Producto.activo == True)
+    ).first()
+    if stock is None:
+        return ErrorCarrito('Producto no encontrado', 404)
+    return ErrorCarrito(f'Stock insuficiente. Solo quedan {stock[0] or 0} unidades')
+
+
+def agregar_producto(usuario_id, producto_id, cantidad=1):
+    """Suma `cantidad` del producto al carrito activo en una sola sentencia (sin commit).
+
+    Devuelve {'carrito_id', 'cantidad' (total en el carrito), 'accion'}; lanza
+    ErrorCarrito si el producto no existe o no hay stock suficiente. Solo si el
+    usuario aún no tiene carrito (o la sentencia se rechaza) hay consultas extra.
+    """
+    if cantidad < 1:
+        raise ErrorCarrito('La cantidad debe ser mayor a 0')
+    fila = db.session.execute(_sentencia_agregar(usuario_id, producto_id, cantidad)).first()
+    if fila is None:
+        if obtener_carrito_id(usuario_id) is not None:
+            raise _motivo_rechazo(producto_id)
+        obtener_carrito_id(usuario_id, crear=True)
+        fila = db.session.execute(_sentencia_agregar(usuario_id, producto_id, cantidad)).first()
+        if fila is None:
+            raise _motivo_rechazo(producto_id)
+    carrito_id, total = fila
+    notificar_cambio_carrito(usuario_id)
+    return {
+        'carrito_id': carrito_id,
+        'cantidad': total,
+        'accion': 'agregado' if total == cantidad else 'actualizado'
+    }
+
+
+def cargar_carrito(usuario_id):
+    """Carrito activo con items, productos y categorías ya cargados (o None)"""
+    return Carrito.query.options(
+        selectinload(Carrito.items).joinedload(CarritoItem.producto).joinedload(Producto.categoria)
+    ).filter_by(usuario_id=usuario_id, activo=True).first()
+
+
+def serializar_item(item):
+    """Datos de un item; cada blueprint elige las claves de su formato histórico"""
+    producto = item.producto
+    precio = item.precio_unitario or 0
+    return {
+        'id': item.id_item,
+        'producto_id': item.producto_id,
+        'nombre': producto.nombre if producto else None,
+        'precio_unitario': float(precio),
+        'cantidad': item.cantidad,
+        'subtotal': float(precio * item.cantidad),
+        'imagen': producto.imagen if producto else None,
+        'stock': producto.stock if producto else 0,
+        'categoria': producto.categoria.nombre if producto and producto.categoria else None,
+    }
+
+
+def resumen_carrito(carrito):
+    """Items serializados y totales; `count` es el número de items (no de unidades)"""
+    if carrito is None:
+        return {'carrito_id': None, 'items': [], 'total': 0, 'unidades': 0, 'count': 0}
+    items = [serializar_item(item) for item in carrito.items if item.producto is not None]
+    return {
+        'carrito_id': carrito.id_carrito,
+        'items': items,
+        'total': float(sum((item.precio_unitario or 0) * item.cantidad
+                           for item in carrito.items if item.producto is not None)),
+        'unidades': sum(item['cantidad'] for item in items),
+        'count': len(carrito.items),
+    }
+
+
+def _item_del_usuario(usuario_id, item_id):
+    item = CarritoItem.query.options(joinedload(CarritoItem.producto))\
+        .join(Carrito, Carrito.id_carrito == CarritoItem.carrito_id)\
+        .filter(CarritoItem.id_item == item_id, Carrito.usuario_id == usuario_id, Carrito.activo == True)\
+        .first()
+    if item is None:
+        if db.session.get(CarritoItem, item_id) is None:
+            raise ErrorCarrito('Item no encontrado', 404)
+        raise ErrorCarrito('No autorizado', 403)
+    return item
+
+
+def actualizar_cantidad(usuario_id, item_id, cantidad):
+    """Fija la cantidad de un item del carrito activo; 0 o menos lo elimina (sin commit).
+
+    Devuelve la cantidad final (0 si se eliminó).
+    """
+    notificar_cambio_carrito(usuario_id)
+    return _fijar_cantidad(_item_del_usuario(usuario_id, item_id), int(cantidad))
+
+
+def cambiar_cantidad(usuario_id, item_id, cambio):
+    """Suma `cambio` (puede ser negativo) a la cantidad del item"""
+    item = _item_del_usuario(usuario_id, item_id)
+    notificar_cambio_carrito(usuario_id)
+    return _fijar_cantidad(item, item.cantidad + int(cambio))
+
+
+def _fijar_cantidad(item, cantidad):
+    if cantidad <= 0:
+        db.session.delete(item)
+        return 0
+    if item.producto is not None and cantidad > (item.producto.stock or 0):
+        raise ErrorCarrito('Stock insuficiente')
+    item.cantidad = cantidad
+    return cantidad
+
+
+def eliminar_item(usuario_id, item_id):
+    db.session.delete(_item_del_usuario(usuario_id, item_id))
+    notificar_cambio_carrito(usuario_id)
+
+
+ACCIONES_LOTE = ('agregar', 'fijar', 'eliminar')
+MAX_OPERACIONES_LOTE = 50
+
+
+def _entero(valor, mensaje):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ErrorCarrito(mensaje)
+
+
+def aplicar_operaciones(usuario_id, operaciones):
+    """Aplica una lista de operaciones sobre el carrito activo (sin commit) y lo devuelve.
+
+    Cada operación es {'accion': 'agregar'|'fijar'|'eliminar', 'item_id' o
+    'producto_id', 'cantidad'}. El carrito se carga una vez (esa carga es la
+    verificación de pertenencia), las operaciones se aplican en orden sobre los
+    objetos en memoria y el stock se valida con la cantidad final de cada item;
+    cualquier error lanza ErrorCarrito y el llamador hace rollback de todo el lote.
+    """
+    if not isinstance(operaciones, list) or not operaciones:
+        raise ErrorCarrito('Se requiere una lista de operaciones')
+    if len(operaciones) > MAX_OPERACIONES_LOTE:
+        raise ErrorCarrito(f'Máximo {MAX_OPERACIONES_LOTE} operaciones por lote')
+    for operacion in operaciones:
+        if not isinstance(operacion, dict) or operacion.get('accion') not in ACCIONES_LOTE:
+            raise ErrorCarrito(f'Operación no válida: {operacion!r}')
+
+    carrito = cargar_carrito(usuario_id)
+    if carrito is None:
+        if not any(op['accion'] == 'agregar' for op in operaciones):
+            raise ErrorCarrito('Item no encontrado', 404)
+        obtener_carrito_id(usuario_id, crear=True)
+        carrito = cargar_carrito(usuario_id)
+    por_item = {item.id_item: item for item in carrito.items}
+    por_producto = {item.producto_id: item for item in carrito.items}
+    quitados = {}  # producto_id -> item eliminado en este lote (se reutiliza si se vuelve a agregar)
+
+    # Productos que aún no están en el carrito, en una sola consulta
+    nuevos = {
+        _entero(op.get('producto_id'), 'ID de producto no proporcionado')
+        for op in operaciones if op['accion'] == 'agregar'
+    } - set(por_producto)
+    productos = {}
+    if nuevos:
+        productos = {p.id_producto: p for p in Producto.query.options(joinedload(Producto.categoria)).filter(
+            Producto.id_producto.in_(nuevos), Producto.activo == True
+        )}
+
+    for operacion in operaciones:
+        accion = operacion['accion']
+        if accion == 'agregar':
+            producto_id = _entero(operacion['producto_id'], 'ID de producto no proporcionado')
+            cantidad = _entero(operacion.get('cantidad', 1), 'Cantidad no válida')
+            if cantidad < 1:
+                raise ErrorCarrito('La cantidad debe ser mayor a 0')
+            item = por_producto.get(producto_id)
+            if item is not None:
+                item.cantidad += cantidad
+                continue
+            item = quitados.pop(producto_id, None)
+            if item is not None:
+                # Borrar e insertar la misma fila en un flush chocaría con el índice único
+                item.cantidad = cantidad
+            else:
+                producto = productos.get(producto_id)
+                if producto is None:
+                    raise ErrorCarrito('Producto no encontrado', 404)
+                item = CarritoItem(producto_id=producto_id, producto=producto, cantidad=cantidad,
+                                   precio_unitario=producto.precio)
+            carrito.items.append(item)
+            por_producto[producto_id] = item
+            continue
+
+        if operacion.get('item_id') is not None:
+            item = por_item.get(_entero(operacion['item_id'], 'ID de item no válido'))
+        else:
+            item = por_producto.get(_entero(operacion.get('producto_id'), 'ID de item no proporcionado'))
+        if item is None or por_producto.get(item.producto_id) is not item:
+            raise ErrorCarrito('Item no encontrado', 404)
+        cantidad = 0 if accion == 'eliminar' else _entero(operacion.get('cantidad'), 'Cantidad no válida')
+        if cantidad <= 0:
+            carrito.items.remove(item)
+            quitados[item.producto_id] = por_producto.pop(item.producto_id)
+        else:
+            item.cantidad = cantidad
+
+    for item in carrito.items:
+        if item.producto is not None and item.cantidad > (item.producto.stock or 0):
+            raise ErrorCarrito(f'Stock insuficiente para {item.producto.nombre}. '
+                               f'Solo quedan {item.producto.stock or 0} unidades')
+
+    notificar_cambio_carrito(usuario_id)
+    return carrito
+
+
+def notificar_cambio_carrito(usuario_id):
+    """Publica los nuevos totales del carrito al confirmar la transacción actual"""
+    notificar(db.session, usuario_id, 'carrito', lambda: _evento_totales(usuario_id))
+
+
+def _evento_totales(usuario_id):
+    totales = totales_carrito(usuario_id)
+    return dict(totales, total=float(totales['total']))
+
+
+def contar_items(carrito_id):
+    return db.session.execute(
+        select(func.count()).select_from(CarritoItem.__table__).where(CarritoItem.carrito_id == carrito_id)
+    ).scalar() or 0
+
+
+
+def totales_carrito(usuario_id):
+    """Resumen del carrito activo en una sola consulta agregada, sin cargar items.
+
+    Devuelve {'count' (items distintos), 'unidades' (suma de cantidades),
+    'total' (Decimal exacto, calculado por la BD)}.
+    """
+    items = CarritoItem.__table__
+    carritos = Carrito.__table__
+    count, unidades, total = db.session.execute(
+        select(
+            func.count(items.c.id_item),
+            func.coalesce(func.sum(items.c.cantidad), 0),
+            func.coalesce(func.sum(items.c.cantidad * items.c.precio_unitario), 0, type_=items.c.precio_unitario.type)
+        ).select_from(items.join(carritos, carritos.c.id_carrito == items.c.carrito_id))
+        .where(carritos.c.usuario_id == usuario_id, carritos.c.activo == True)
+    ).one()
+    return {'count': count, 'unidades': int(unidades), 'total': Decimal(total).quantize(CENTAVOS)}
+
+
+def cerrar_carrito(carrito_id):
+    """Marca el carrito como procesado si sigue activo; False si otra petición ya lo cerró.
+
+    Es lo primero que hace el checkout: el UPDATE condicional bloquea la fila, así
+    dos checkouts simultáneos del mismo carrito no generan dos pedidos.
+    """
+    carritos = Carrito.__table__
+    return db.session.execute(
+        update(carritos).where(carritos.c.id_carrito == carrito_id, carritos.c.activo == True).values(activo=False)
+    ).rowcount == 1
+
+
+def copiar_items_a_pedido(carrito_id, pedido_id):
+    """Copia los items del carrito a `pedido_items` con un solo INSERT ... SELECT"""
+    items = CarritoItem.__table__
+    origen = select(literal(pedido_id), items.c.producto_id, items.c.cantidad, items.c.precio_unitario)\
+        .where(items.c.carrito_id == carrito_id)\
+        .order_by(items.c.id_item)
+    return db.session.execute(
+        PedidoItem.__table__.insert().from_select(['pedido_id', 'producto_id', 'cantidad', 'precio_unitario'], origen)
+    ).rowcount
+
+
+def limpiar_carritos(retencion_inactivos_dias, retencion_abandonados_dias, lote=500, max_lotes=20):
+    """Borra en lotes los carritos cerrados y los abandonados; devuelve las filas borradas.
+
+    - Inactivos (ya pasaron por checkout, sus líneas están en pedido_items):
+      `fecha_creacion` anterior a la retención de inactivos.
+    - Abandonados: activos, creados antes de la retención de abandonados y sin
+      ningún item agregado dentro de esa ventana.
+
+    Cada lote (a lo sumo `lote` carritos) es una transacción corta: bloquea los
+    carritos (FOR UPDATE SKIP LOCKED, se saltan los que otra transacción está
+    usando), vuelve a evaluar el criterio con una consulta nueva y borra los
+    items y los carritos que siguen cumpliéndolo. Mientras dure el bloqueo nadie
+    puede agregar items a esos carritos (la llave foránea espera la fila), así un
+    item agregado entre la selección y el borrado conserva el carrito. Se procesan
+    como máximo `max_lotes` lotes por ejecución; el resto queda para la siguiente.
+    """
+    carritos = Carrito.__table__
+    items = CarritoItem.__table__
+    ahora = datetime.utcnow()
+    limite_inactivos = ahora - timedelta(days=retencion_inactivos_dias)
+    limite_abandonados = ahora - timedelta(days=retencion_abandonados_dias)
+
+    actividad_reciente = select(items.c.id_item).where(
+        items.c.carrito_id == carritos.c.id_carrito, items.c.fecha_agregado >= limite_abandonados
+    ).exists()
+    criterios = {
+        'inactivos': and_(carritos.c.activo == False, carritos.c.fecha_creacion < limite_inactivos),
+        'abandonados': and_(carritos.c.activo == True, carritos.c.fecha_creacion < limite_abandonados,
+                            ~actividad_reciente),
+    }
+
+    reporte = {'carritos_inactivos': 0, 'carritos_abandonados': 0, 'items': 0, 'lotes': 0}
+    for tipo, criterio in criterios.items():
+        while reporte['lotes'] < max_lotes:
+            ids = db.session.execute(
+                select(carritos.c.id_carrito).where(criterio).order_by(carritos.c.id_carrito).limit(lote)
+                .with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not ids:
+                break
+            # Con los carritos bloqueados, el criterio se evalúa de nuevo: un item confirmado
+            # después de la primera consulta conserva el carrito
+            confirmados = db.session.execute(
+                select(carritos.c.id_carrito).where(carritos.c.id_carrito.in_(ids), criterio)
+            ).scalars().all()
+            if confirmados:
+                reporte['items'] += db.session.execute(
+                    delete(items).where(items.c.carrito_id.in_(confirmados))
+                ).rowcount
+                reporte[f'carritos_{tipo}'] += db.session.execute(
+                    delete(carritos).where(carritos.c.id_carrito.in_(confirmados))
+                ).rowcount
+            db.session.commit()
+            reporte['lotes'] += 1
+            if len(ids) < lote:
+                break
+    return reporte
@@ -0,0 +1,121 @@
+"""Carrito de invitado en una cookie firmada, fusionado con el carrito de la BD al iniciar sesión.
+
+Mientras el usuario navega sin sesión, agregar un producto solo lee su stock y
+reescribe la cookie: cero escrituras en la BD. El contenido es una lista
+compacta `producto:cantidad` separada por puntos (p. ej. `12:1.7:3`) firmada
+con la SECRET_KEY, así el cliente no puede alterarla. Al iniciar sesión se
+fusiona con el carrito activo del usuario en un solo INSERT ... SELECT ... ON
+CONFLICT DO UPDATE, limitando cada cantidad al stock disponible.
+"""
+from datetime import datetime
+
+from flask import current_app
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import case, literal, select
+
+from app import db
+from app.models.models import CarritoItem, Producto
+from app.services.carrito import ErrorCarrito, notificar_cambio_carrito, obtener_carrito_id
+from app.services.db_util import insert_dialecto
+
+COOKIE_CARRITO_INVITADO = 'carrito_invitado'
+MAX_PRODUCTOS_INVITADO = 50
+DURACION_COOKIE = 30 * 24 * 3600
+
+
+def _firmador():
+    return Signer(current_app.secret_key, salt='carrito-invitado')
+
+
+def leer_carrito_invitado(request):
+    """{producto_id: cantidad} de la cookie; vacío si no existe o la firma no es válida"""
+    valor = request.cookies.get(COOKIE_CARRITO_INVITADO)
+    if not valor:
+        return {}
+    try:
+        datos = _firmador().unsign(valor).decode('ascii')
+    except (BadSignature, UnicodeDecodeError):
+        return {}
+    contenido = {}
+    for par in datos.split('.'):
+        producto_id, _, cantidad = par.partition(':')
+        if producto_id.isdigit() and cantidad.isdigit() and int(cantidad) > 0:
+            contenido[int(producto_id)] = int(cantidad)
+    return contenido
+
+
+def guardar_carrito_invitado(respuesta, contenido):
+    """Escribe (o borra, si quedó vacío) la cookie en `respuesta`"""
+    if not contenido:
+        respuesta.delete_cookie(COOKIE_CARRITO_INVITADO)
+        return respuesta
+    datos = '.'.join(f'{producto_id}:{cantidad}' for producto_id, cantidad in contenido.items())
+    respuesta.set_cookie(
+        COOKIE_CARRITO_INVITADO,
+        _firmador().sign(datos.encode('ascii')).decode('ascii'),
+        max_age=DURACION_COOKIE,
+        httponly=True,
+        samesite='Lax',
+        secure=current_app.config.get('SESSION_COOKIE_SECURE', False)
+    )
+    return respuesta
+
+
+def agregar_invitado(contenido, producto_id, cantidad=1):
+    """Suma `cantidad` al contenido (en memoria) validando stock con una sola lectura.
+
+    Devuelve {'cantidad' (total del producto), 'accion'}; lanza ErrorCarrito igual
+    que el carrito de la BD.
+    """
+    if cantidad < 1:
+        raise ErrorCarrito('La cantidad debe ser mayor a 0')
+    if producto_id not in contenido and len(contenido) >= MAX_PRODUCTOS_INVITADO:
+        raise ErrorCarrito('Inicia sesión para agregar más productos al carrito')
+    stock = db.session.execute(
+        select(Producto.stock).where(Producto.id_producto == producto_id, Producto.activo == True)
+    ).first()
+    if stock is None:
+        raise ErrorCarrito('Producto no encontrado', 404)
+    total = contenido.get(producto_id, 0) + cantidad
+    if total > (stock[0] or 0):
+        raise ErrorCarrito(f'Stock insuficiente. Solo quedan {stock[0] or 0} unidades')
+    accion = 'actualizado' if producto_id in contenido else 'agregado'
+    contenido[producto_id] = total
+    return {'cantidad': total, 'accion': accion}
+
+
+def fusionar_carrito_invitado(usuario_id, contenido):
+    """Pasa el carrito de invitado al carrito activo del usuario (sin commit).
+
+    Un solo upsert para todos los productos: los que ya estaban en el carrito suman
+    la cantidad, sin pasar del stock; productos inexistentes o sin stock se ignoran.
+    Devuelve las filas insertadas o actualizadas.
+    """
+    if not contenido:
+        return 0
+    carrito_id = obtener_carrito_id(usuario_id, crear=True)
+    items = CarritoItem.__table__
+    productos = Producto.__table__
+
+    pedida = case(contenido, value=productos.c.id_producto)
+    origen = select(
+        literal(carrito_id), productos.c.id_producto,
+        case((pedida > productos.c.stock, productos.c.stock), else_=pedida),
+        productos.c.precio, literal(datetime.utcnow(), type_=items.c.fecha_agregado.type)
+    ).where(
+        productos.c.id_producto.in_(list(contenido)),
+        productos.c.activo == True,
+        productos.c.stock > 0
+    )
+    sentencia = insert_dialecto(items).from_select(
+        ['carrito_id', 'producto_id', 'cantidad', 'precio_unitario', 'fecha_agregado'], origen
+    )
+    stock = select(productos.c.stock).where(productos.c.id_producto == items.c.producto_id).scalar_subquery()
+    suma = items.c.cantidad + sentencia.excluded.cantidad
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=['carrito_id', 'producto_id'],
+        set_={'cantidad': case((suma > stock, stock), else_=suma)}
+    )
+    filas = db.session.execute(sentencia).rowcount
+    notificar_cambio_carrito(usuario_id)
+    return filas
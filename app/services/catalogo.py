@@ -0,0 +1,221 @@
+"""Motor único de listado del catálogo con paginación por cursor (keyset).
+
+En lugar de OFFSET (que recorre todas las filas anteriores) cada página
+continúa desde la última fila vista usando la clave de orden + id_producto,
+así el costo de una página no depende del tamaño de la tabla `productos`.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from flask import current_app
+from sqlalchemy import and_, func, literal, or_, select
+from sqlalchemy.orm import contains_eager, selectinload
+
+from app import db
+from app.models.models import Producto, Categoria
+from app.models.reserva import ReservaStock
+from app.services.imagenes import serializar_derivados
+
+# orden -> (columna, descendente)
+ORDENES = {
+    'recientes': (Producto.fecha_creacion, True),
+    'precio_asc': (Producto.precio, False),
+    'precio_desc': (Producto.precio, True),
+    'nombre': (Producto.nombre, False),
+}
+ORDEN_DEFAULT = 'recientes'
+
+# Los productos sin fecha_creacion ordenan como los más antiguos, en ambos caminos
+FECHA_SIN_VALOR = datetime.min
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se puede decodificar o no corresponde al orden pedido."""
+
+
+def subconsulta_reservado(producto_id, excluir_pedido=None):
+    """Subconsulta escalar con las unidades reservadas vigentes del producto `producto_id`.
+
+    `producto_id` suele ser la columna Producto.id_producto (subconsulta correlacionada).
+    """
+    reservas = ReservaStock.__table__
+    condiciones = [reservas.c.producto_id == producto_id, reservas.c.expira_en > datetime.utcnow()]
+    if excluir_pedido is not None:
+        condiciones.append(reservas.c.pedido_id != excluir_pedido)
+    return select(func.coalesce(func.sum(reservas.c.cantidad), 0)).where(*condiciones).scalar_subquery()
+
+
+def stock_disponible():
+    """Expresión SQL del stock disponible: físico menos reservas vigentes"""
+    return Producto.stock - subconsulta_reservado(Producto.id_producto)
+
+
+def reservado_por_producto(producto_ids=None):
+    """{producto_id: unidades reservadas vigentes}; todos los productos si `producto_ids` es None.
+
+    Una consulta agrupada sobre el índice (producto_id, expira_en) de reservas_stock.
+    """
+    reservas = ReservaStock.__table__
+    consulta = select(reservas.c.producto_id, func.sum(reservas.c.cantidad))\
+        .where(reservas.c.expira_en > datetime.utcnow()).group_by(reservas.c.producto_id)
+    if producto_ids is not None:
+        producto_ids = list(producto_ids)
+        if not producto_ids:
+            return {}
+        consulta = consulta.where(reservas.c.producto_id.in_(producto_ids))
+    return {producto_id: int(total) for producto_id, total in db.session.execute(consulta)}
+
+
+def serializar_producto(producto, reservado=0):
+    """Formato estándar de un producto para las APIs del catálogo.
+
+    `stock` es el disponible: el físico menos lo reservado por pedidos pendientes.
+    """
+    imagenes, srcset = serializar_derivados(producto)
+    return {
+        'id': producto.id_producto,
+        'nombre': producto.nombre,
+        'descripcion': producto.descripcion,
+        'precio': float(producto.precio) if producto.precio else 0,
+        'stock': max(0, (producto.stock or 0) - reservado),
+        'imagen': producto.imagen,
+        'imagenes': imagenes,
+        'srcset': srcset,
+        'categoria': producto.categoria.nombre if producto.categoria else 'Sin categoría',
+        'categoria_id': producto.categoria_id
+    }
+
+
+def _valor_a_json(valor):
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _valor_desde_json(orden, valor):
+    if orden == 'recientes':
+        return datetime.fromisoformat(valor)
+    if orden in ('precio_asc', 'precio_desc'):
+        return Decimal(valor)
+    return str(valor)
+
+
+def codificar_cursor(orden, valor, id_producto):
+    crudo = json.dumps({'o': orden, 'v': _valor_a_json(valor), 'id': id_producto}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, orden):
+    """Devuelve (valor, id_producto) de un cursor generado por `codificar_cursor`"""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        datos = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if datos['o'] != orden:
+            raise CursorInvalido('El cursor no corresponde al orden solicitado')
+        return _valor_desde_json(orden, datos['v']), int(datos['id'])
+    except CursorInvalido:
+        raise
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidOperation):
+        raise CursorInvalido('Cursor inválido')
+
+
+def normalizar_limite(limite):
+    maximo = current_app.config.get('CATALOGO_PAGE_SIZE_MAX', 100)
+    try:
+        limite = int(limite)
+    except (TypeError, ValueError):
+        return current_app.config.get('CATALOGO_PAGE_SIZE', 24)
+    return max(1, min(limite, maximo))
+
+
+def leer_parametros_paginacion(args):
+    """Extrae orden, limite y cursor de los query params de la petición"""
+    return {
+        'orden': args.get('orden'),
+        'limite': args.get('limite'),
+        'cursor': args.get('cursor') or None,
+    }
+
+
+def listar_productos(categoria=None, categoria_id=None, orden=None,
+                     limite=None, cursor=None, solo_con_stock=True):
+    """Obtener una página de productos activos.
+
+    Se sirve desde el snapshot en memoria (ver cache_catalogo) salvo que
+    CATALOGO_CACHE_ENABLED esté desactivado. Devuelve dict con `productos`
+    (serializados), `next_cursor` (None si es la última página), `orden` y
+    `limite` efectivos.
+    """
+    orden = orden if orden in ORDENES else ORDEN_DEFAULT
+    limite = normalizar_limite(limite)
+
+    if current_app.config.get('CATALOGO_CACHE_ENABLED', True):
+        from app.services.cache_catalogo import catalogo_cache
+        return catalogo_cache.obtener().listar(
+            orden, limite, cursor=cursor, categoria=categoria, categoria_id=categoria_id,
+            solo_con_stock=solo_con_stock
+        )
+
+    columna, descendente = ORDENES[orden]
+    atributo = columna.key
+    if orden == 'recientes':
+        # Sin el COALESCE un NULL no se puede comparar con el cursor (ni viaja en él)
+        columna = func.coalesce(columna, literal(FECHA_SIN_VALOR, db.DateTime))
+
+    query = Producto.query.outerjoin(Categoria, Producto.categoria_id == Categoria.id_categoria)\
+        .options(contains_eager(Producto.categoria), selectinload(Producto.imagenes_derivadas))\
+        .filter(Producto.activo == True)
+
+    if solo_con_stock:
+        # Mismo criterio que el snapshot: stock disponible, descontando reservas
+        query = query.filter(stock_disponible() > 0)
+
+    if categoria:
+        query = query.filter(Categoria.nombre == categoria)
+
+    if categoria_id:
+        query = query.filter(Producto.categoria_id == categoria_id)
+
+    if cursor:
+        valor, ultimo_id = decodificar_cursor(cursor, orden)
+        if descendente:
+            query = query.filter(or_(
+                columna < valor,
+                and_(columna == valor, Producto.id_producto < ultimo_id)
+            ))
+        else:
+            query = query.filter(or_(
+                columna > valor,
+                and_(columna == valor, Producto.id_producto > ultimo_id)
+            ))
+
+    if descendente:
+        query = query.order_by(columna.desc(), Producto.id_producto.desc())
+    else:
+        query = query.order_by(columna.asc(), Producto.id_producto.asc())
+
+    # Pedimos una fila extra para saber si existe página siguiente sin hacer COUNT
+    filas = query.limit(limite + 1).all()
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    reservado = reservado_por_producto(p.id_producto for p in filas)
+
+    next_cursor = None
+    if hay_mas:
+        ultimo = filas[-1]
+        valor = getattr(ultimo, atributo)
+        if orden == 'recientes' and valor is None:
+            valor = FECHA_SIN_VALOR
+        next_cursor = codificar_cursor(orden, valor, ultimo.id_producto)
+
+    return {
+        'productos': [serializar_producto(p, reservado.get(p.id_producto, 0)) for p in filas],
+        'next_cursor': next_cursor,
+        'orden': orden,
+        'limite': limite
+    }
@@ -0,0 +1,10 @@
+"""Utilidades de SQL compartidas por los servicios."""
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+
+
+def insert_dialecto(tabla):
+    """INSERT del dialecto de la sesión actual, con on_conflict_do_nothing/do_update"""
+    dialecto = db.session.get_bind().dialect.name
+    return (postgresql.insert if dialecto == 'postgresql' else sqlite.insert)(tabla)
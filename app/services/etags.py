@@ -0,0 +1,36 @@
+"""ETags fuertes derivados de versiones (catálogo, favoritos) para responder 304.
+
+El ETag se calcula solo con la versión y los parámetros de la petición, así que
+una revalidación con If-None-Match vigente no ejecuta la consulta ni serializa nada.
+"""
+import hashlib
+
+from flask import request, make_response
+
+
+def calcular_etag(*partes):
+    return hashlib.sha1('|'.join(str(p) for p in partes).encode()).hexdigest()
+
+
+def etag_vigente(etag):
+    """True si el cliente ya tiene esta versión (If-None-Match)"""
+    return request.if_none_match.contains_weak(etag)
+
+
+def con_etag(respuesta, etag, privado=False):
+    respuesta = make_response(respuesta)
+    if respuesta.status_code in (200, 304):
+        respuesta.set_etag(etag)
+        # no-cache: el navegador puede guardar la respuesta pero debe revalidarla siempre
+        respuesta.headers['Cache-Control'] = 'private, no-cache' if privado else 'no-cache'
+    return respuesta
+
+
+def cache_inmutable(respuesta):
+    """Para URLs con huella de contenido: el contenido de esa URL nunca cambia"""
+    respuesta.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return respuesta
+
+
+def no_modificado(etag, privado=False):
+    return con_etag(make_response('', 304), etag, privado=privado)
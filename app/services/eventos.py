@@ -0,0 +1,145 @@
+"""Canal de eventos por usuario (Server-Sent Events) con fan-out en memoria.
+
+Cada pestaña abierta se suscribe a /api/eventos y recibe, cuando ocurren, los
+cambios de su usuario: cantidad del carrito, favoritos y estado de pedidos. Los
+eventos se acumulan en la sesión de SQLAlchemy y se publican solo después del
+commit (un rollback los descarta), igual que la invalidación del catálogo.
+
+El fan-out vive en memoria del proceso y lo comparten todos los hilos del worker
+(gunicorn gthread). Con varios procesos un evento solo llega a las pestañas
+conectadas al mismo proceso; como la conexión se renueva cada
+EVENTOS_DURACION_MAX_SEGUNDOS y el cliente vuelve a leer el estado al reconectar,
+lo publicado en otro proceso se ve con ese retraso como máximo.
+"""
+import json
+import queue
+import threading
+
+from sqlalchemy import event, inspect
+
+from app import db
+from app.models.pedido import Pedido
+
+# Eventos en espera por conexión; si un cliente no los consume se descartan los nuevos
+EVENTOS_MAX_EN_COLA = 100
+
+_eventos_registrados = False
+
+
+class Suscripcion:
+    def __init__(self, usuario_id):
+        self.usuario_id = usuario_id
+        self._cola = queue.Queue(maxsize=EVENTOS_MAX_EN_COLA)
+
+    def entregar(self, evento):
+        try:
+            self._cola.put_nowait(evento)
+        except queue.Full:
+            pass
+
+    def siguiente(self, timeout):
+        """Próximo evento o None si no llegó ninguno en `timeout` segundos"""
+        try:
+            return self._cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class CanalEventos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones = {}  # usuario_id -> set de Suscripcion
+        self._total = 0
+
+    def suscribir(self, usuario_id, maximo=None):
+        """Nueva suscripción, o None si ya hay `maximo` conexiones abiertas en el proceso"""
+        with self._lock:
+            if maximo is not None and self._total >= maximo:
+                return None
+            suscripcion = Suscripcion(usuario_id)
+            self._suscripciones.setdefault(usuario_id, set()).add(suscripcion)
+            self._total += 1
+            return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            abiertas = self._suscripciones.get(suscripcion.usuario_id)
+            if not abiertas or suscripcion not in abiertas:
+                return
+            abiertas.discard(suscripcion)
+            self._total -= 1
+            if not abiertas:
+                del self._suscripciones[suscripcion.usuario_id]
+
+    def publicar(self, usuario_id, tipo, datos):
+        with self._lock:
+            destinos = list(self._suscripciones.get(usuario_id, ()))
+        evento = (tipo, datos)
+        for suscripcion in destinos:
+            suscripcion.entregar(evento)
+        return len(destinos)
+
+    def conexiones(self):
+        with self._lock:
+            return self._total
+
+
+canal = CanalEventos()
+
+
+def formatear(tipo, datos):
+    """Evento en formato text/event-stream"""
+    return f"event: {tipo}\ndata: {json.dumps(datos, separators=(',', ':'))}\n\n"
+
+
+def notificar(session, usuario_id, tipo, datos, clave=None):
+    """Programa un evento para después del commit de `session`.
+
+    `datos` puede ser un callable: se evalúa justo antes del commit (dentro de la
+    transacción), así varias operaciones sobre lo mismo generan un solo evento con
+    el estado final. Eventos con el mismo (usuario, tipo, clave) se reemplazan.
+    """
+    if usuario_id is None:
+        return
+    session.info.setdefault('eventos_pendientes', {})[(usuario_id, tipo, clave)] = datos
+
+
+def init_app(app):
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    event.listen(db.session, 'after_flush', _despues_flush)
+    event.listen(db.session, 'before_commit', _antes_commit)
+    event.listen(db.session, 'after_commit', _despues_commit)
+    event.listen(db.session, 'after_rollback', _despues_rollback)
+    _eventos_registrados = True
+
+
+def _despues_flush(session, flush_context):
+    # Cambios de estado de pedidos hechos por el ORM (checkout, webhook, panel de admin)
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Pedido):
+            continue
+        if obj not in session.new and not inspect(obj).attrs.estado.history.has_changes():
+            continue
+        notificar(session, obj.usuario_id, 'pedido',
+                  {'pedido_id': obj.id_pedido, 'estado': obj.estado}, clave=obj.id_pedido)
+
+
+def _antes_commit(session):
+    pendientes = session.info.get('eventos_pendientes')
+    if not pendientes or not any(callable(datos) for datos in pendientes.values()):
+        return
+    session.flush()
+    for clave, datos in list(pendientes.items()):
+        if callable(datos):
+            pendientes[clave] = datos()
+
+
+def _despues_commit(session):
+    for (usuario_id, tipo, _), datos in session.info.pop('eventos_pendientes', {}).items():
+        canal.publicar(usuario_id, tipo, datos)
+
+
+def _despues_rollback(session):
+    session.info.pop('eventos_pendientes', None)
@@ -0,0 +1,91 @@
+"""Conteos por faceta del catálogo (categoría, banda de precio, disponibilidad).
+
+Se calculan con una sola consulta agrupada por (categoría, banda, disponible) y
+se guardan por versión del catálogo, así que el listado los devuelve sin
+consultas extra hasta que el catálogo cambie. Los conteos de precio y
+disponibilidad se acotan a la categoría filtrada; los de categoría son globales.
+"""
+from flask import current_app
+from sqlalchemy import case, func
+
+from app import db
+from app.models.models import Producto, Categoria
+from app.services.cache_catalogo import catalogo_cache, version_catalogo
+from app.services.catalogo import stock_disponible
+
+BANDAS_PRECIO_DEFAULT = (500, 1000, 5000, 10000)
+
+# Solo se usa con CATALOGO_CACHE_ENABLED desactivado: (version, limites) -> filas
+_memo = {}
+
+
+def _limites_bandas():
+    return tuple(current_app.config.get('CATALOGO_BANDAS_PRECIO') or BANDAS_PRECIO_DEFAULT)
+
+
+def _contar(limites):
+    banda = case(
+        *[(Producto.precio < limite, indice) for indice, limite in enumerate(limites)],
+        else_=len(limites)
+    )
+    # Stock disponible (físico menos reservas), como el listado y el snapshot
+    disponible = case((stock_disponible() > 0, 1), else_=0)
+    filas = db.session.query(
+        Producto.categoria_id,
+        Categoria.nombre,
+        banda.label('banda'),
+        disponible.label('disponible'),
+        func.count(Producto.id_producto)
+    ).outerjoin(Categoria, Categoria.id_categoria == Producto.categoria_id)\
+        .filter(Producto.activo == True)\
+        .group_by(Producto.categoria_id, Categoria.nombre, banda, disponible)\
+        .all()
+    return [tuple(fila) for fila in filas]
+
+
+def _filas_agrupadas(limites):
+    if current_app.config.get('CATALOGO_CACHE_ENABLED', True):
+        snapshot = catalogo_cache.obtener()
+        return snapshot.derivado(f'facetas:{limites}', lambda _: _contar(limites))
+
+    llave = (version_catalogo(), limites)
+    if llave not in _memo:
+        _memo.clear()
+        _memo[llave] = _contar(limites)
+    return _memo[llave]
+
+
+def _etiqueta_banda(indice, limites):
+    minimo = limites[indice - 1] if indice > 0 else 0
+    maximo = limites[indice] if indice < len(limites) else None
+    return {
+        'banda': f'{minimo}-{maximo}' if maximo is not None else f'{minimo}+',
+        'min': minimo,
+        'max': maximo
+    }
+
+
+def calcular_facetas(categoria=None, categoria_id=None):
+    limites = _limites_bandas()
+    filas = _filas_agrupadas(limites)
+
+    if categoria and not categoria_id:
+        categoria_id = next((cid for cid, nombre, *_ in filas if nombre == categoria), -1)
+
+    por_categoria = {}
+    por_banda = [0] * (len(limites) + 1)
+    disponibilidad = {'en_stock': 0, 'sin_stock': 0}
+
+    for cid, nombre, banda, disponible, total in filas:
+        entrada = por_categoria.setdefault(cid, {'id': cid, 'nombre': nombre or 'Sin categoría', 'total': 0})
+        entrada['total'] += total
+        if categoria_id and cid != int(categoria_id):
+            continue
+        por_banda[banda] += total
+        disponibilidad['en_stock' if disponible else 'sin_stock'] += total
+
+    return {
+        'categorias': sorted(por_categoria.values(), key=lambda c: (c['id'] is None, c['id'] or 0)),
+        'precio': [dict(_etiqueta_banda(i, limites), total=total) for i, total in enumerate(por_banda)],
+        'disponibilidad': disponibilidad
+    }
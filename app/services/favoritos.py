@@ -0,0 +1,126 @@
+"""Versión por usuario de la lista de favoritos y cache en memoria de sus ids.
+
+Cualquier flush que agregue o elimine un Favorito incrementa la versión del
+usuario en `favoritos_version` dentro de la misma transacción. Al hacer commit
+el conjunto de ids cacheado del usuario se actualiza con el cambio (write-through);
+una lectura solo compara la versión guardada con la de la BD, así los cambios
+hechos en otros workers se detectan con una consulta por clave primaria.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event, insert, select, update
+
+from app import db
+from app.models.favorito import Favorito, FavoritoVersion
+from app.services.eventos import canal
+
+# Usuarios con su conjunto de favoritos en memoria (los menos usados se descartan)
+FAVORITOS_CACHE_MAX_USUARIOS = 5000
+
+_eventos_registrados = False
+
+
+class FavoritosCache:
+    def __init__(self, max_usuarios=FAVORITOS_CACHE_MAX_USUARIOS):
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # usuario_id -> (version, frozenset de producto_id)
+        self._max = max_usuarios
+
+    def obtener(self, usuario_id, version):
+        with self._lock:
+            entrada = self._entradas.get(usuario_id)
+            if entrada is None or entrada[0] != version:
+                return None
+            self._entradas.move_to_end(usuario_id)
+            return entrada[1]
+
+    def guardar(self, usuario_id, version, ids):
+        with self._lock:
+            self._entradas[usuario_id] = (version, frozenset(ids))
+            self._entradas.move_to_end(usuario_id)
+            while len(self._entradas) > self._max:
+                self._entradas.popitem(last=False)
+
+    def aplicar(self, usuario_id, version, agregados, eliminados):
+        """Aplica un commit propio; si la versión no es la siguiente se descarta la entrada"""
+        with self._lock:
+            entrada = self._entradas.get(usuario_id)
+            if entrada is None:
+                return
+            if entrada[0] != version - 1:
+                del self._entradas[usuario_id]
+                return
+            self._entradas[usuario_id] = (version, (entrada[1] - eliminados) | agregados)
+
+
+favoritos_cache = FavoritosCache()
+
+
+def init_app(app):
+    global _eventos_registrados
+    if _eventos_registrados:
+        return
+    event.listen(db.session, 'after_flush', _despues_flush)
+    event.listen(db.session, 'after_commit', _despues_commit)
+    event.listen(db.session, 'after_rollback', _despues_rollback)
+    _eventos_registrados = True
+
+
+def version_favoritos(usuario_id):
+    return db.session.execute(
+        select(FavoritoVersion.version).where(FavoritoVersion.usuario_id == usuario_id)
+    ).scalar() or 0
+
+
+def ids_favoritos(usuario_id, version=None):
+    """Conjunto (frozenset) de ids de productos favoritos del usuario"""
+    if version is None:
+        version = version_favoritos(usuario_id)
+    ids = favoritos_cache.obtener(usuario_id, version)
+    if ids is None:
+        ids = frozenset(db.session.execute(
+            select(Favorito.producto_id).where(Favorito.usuario_id == usuario_id)
+        ).scalars())
+        favoritos_cache.guardar(usuario_id, version, ids)
+    return ids
+
+
+def _incrementar_version(conexion, usuario_id):
+    tabla = FavoritoVersion.__table__
+    resultado = conexion.execute(
+        update(tabla).where(tabla.c.usuario_id == usuario_id).values(version=tabla.c.version + 1)
+    )
+    if resultado.rowcount == 0:
+        conexion.execute(insert(tabla).values(usuario_id=usuario_id, version=1))
+        return 1
+    return conexion.execute(select(tabla.c.version).where(tabla.c.usuario_id == usuario_id)).scalar()
+
+
+def _despues_flush(session, flush_context):
+    cambios = {}  # usuario_id -> (agregados, eliminados)
+    for obj in session.new:
+        if isinstance(obj, Favorito):
+            cambios.setdefault(obj.usuario_id, (set(), set()))[0].add(obj.producto_id)
+    for obj in session.deleted:
+        if isinstance(obj, Favorito):
+            cambios.setdefault(obj.usuario_id, (set(), set()))[1].add(obj.producto_id)
+    if not cambios:
+        return
+    conexion = session.connection()
+    pendientes = session.info.setdefault('favoritos_cambios', [])
+    for usuario_id in sorted(cambios):
+        agregados, eliminados = cambios[usuario_id]
+        pendientes.append((usuario_id, _incrementar_version(conexion, usuario_id), agregados, eliminados))
+
+
+def _despues_commit(session):
+    for usuario_id, version, agregados, eliminados in session.info.pop('favoritos_cambios', []):
+        favoritos_cache.aplicar(usuario_id, version, agregados, eliminados)
+        canal.publicar(usuario_id, 'favoritos', {
+            'version': version, 'agregados': sorted(agregados), 'eliminados': sorted(eliminados)
+        })
+
+
+def _despues_rollback(session):
+    session.info.pop('favoritos_cambios', None)
@@ -0,0 +1,146 @@
+"""Cabecera Idempotency-Key para los endpoints que crean pedidos.
+
+La primera petición con una clave la reserva (fila 'procesando' confirmada antes
+de ejecutar la vista) y al terminar guarda el status y el JSON de la respuesta.
+Una repetición con la misma clave devuelve lo guardado sin tocar carrito ni
+stock; si llega mientras la primera sigue en curso recibe 409. La huella
+(método + ruta + cuerpo) evita reutilizar una clave para otra petición distinta.
+
+Las respuestas 5xx no se guardan: la reserva se libera y el cliente puede
+reintentar con la misma clave. Sin la cabecera los endpoints funcionan como antes.
+
+Una reserva 'procesando' solo se toma de nuevo cuando ya no puede quedar viva la
+petición original: nunca antes de MARGEN_BLOQUEO veces la peor llamada a
+Mercado Pago (timeouts de conexión y lectura por cada intento).
+"""
+import hashlib
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, jsonify, request, session
+from sqlalchemy import delete, select, update
+
+from app import db
+from app.models.idempotencia import IdempotenciaClave
+from app.services.db_util import insert_dialecto
+
+CABECERA = 'Idempotency-Key'
+MAX_LONGITUD_CLAVE = 100
+MARGEN_BLOQUEO = 4
+
+
+def bloqueo_segundos():
+    """Antigüedad desde la que una reserva 'procesando' se considera abandonada"""
+    config = current_app.config
+    peor_llamada_mp = ((config['MERCADOPAGO_TIMEOUT_CONEXION'] + config['MERCADOPAGO_TIMEOUT_LECTURA'])
+                       * (config['MERCADOPAGO_REINTENTOS'] + 1))
+    return max(config['IDEMPOTENCIA_BLOQUEO_SEGUNDOS'], peor_llamada_mp * MARGEN_BLOQUEO)
+
+
+def _huella():
+    datos = b'\n'.join([request.method.encode(), request.path.encode(), request.get_data() or b''])
+    return hashlib.sha256(datos).hexdigest()
+
+
+def _reservar(usuario_id, endpoint, clave, huella):
+    """True si esta petición se queda con la clave (nueva, o reserva abandonada)"""
+    tabla = IdempotenciaClave.__table__
+    ahora = datetime.utcnow()
+    insertada = db.session.execute(
+        insert_dialecto(tabla).values(usuario_id=usuario_id, endpoint=endpoint, clave=clave,
+                                      huella=huella, estado='procesando', fecha_creacion=ahora)
+        .on_conflict_do_nothing(index_elements=['usuario_id', 'endpoint', 'clave'])
+    ).rowcount == 1
+    if not insertada:
+        # Una reserva 'procesando' más vieja que el bloqueo es de un worker que murió: se toma
+        limite = ahora - timedelta(seconds=bloqueo_segundos())
+        insertada = db.session.execute(
+            update(tabla).where(
+                tabla.c.usuario_id == usuario_id, tabla.c.endpoint == endpoint, tabla.c.clave == clave,
+                tabla.c.huella == huella, tabla.c.estado == 'procesando', tabla.c.fecha_creacion < limite
+            ).values(fecha_creacion=ahora)
+        ).rowcount == 1
+    db.session.commit()
+    return insertada
+
+
+def _registro(usuario_id, endpoint, clave):
+    return db.session.execute(
+        select(IdempotenciaClave).where(
+            IdempotenciaClave.usuario_id == usuario_id,
+            IdempotenciaClave.endpoint == endpoint,
+            IdempotenciaClave.clave == clave
+        )
+    ).scalar_one_or_none()
+
+
+def _guardar(usuario_id, endpoint, clave, respuesta):
+    tabla = IdempotenciaClave.__table__
+    condicion = (tabla.c.usuario_id == usuario_id, tabla.c.endpoint == endpoint, tabla.c.clave == clave)
+    cuerpo = respuesta.get_json(silent=True) if respuesta.is_json else None
+    if respuesta.status_code >= 500 or cuerpo is None:
+        db.session.execute(delete(tabla).where(*condicion))
+    else:
+        db.session.execute(update(tabla).where(*condicion).values(
+            estado='completado', status_code=respuesta.status_code, respuesta=cuerpo
+        ))
+    db.session.commit()
+
+
+def idempotente(vista):
+    """Decorador para vistas POST autenticadas por sesión que devuelven JSON"""
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        clave = request.headers.get(CABECERA)
+        if not clave or 'user_id' not in session:
+            return vista(*args, **kwargs)
+        if len(clave) > MAX_LONGITUD_CLAVE:
+            return jsonify({'success': False, 'error': f'{CABECERA} demasiado larga'}), 400
+
+        usuario_id = session['user_id']
+        endpoint = request.endpoint
+        huella = _huella()
+        if not _reservar(usuario_id, endpoint, clave, huella):
+            registro = _registro(usuario_id, endpoint, clave)
+            if registro is None:
+                # Se liberó entre el INSERT y la lectura (la primera falló con 5xx)
+                return jsonify({'success': False, 'error': 'Reintenta la petición'}), 409
+            if registro.huella != huella:
+                return jsonify({'success': False, 'error': f'{CABECERA} ya usada con otra petición'}), 422
+            if registro.estado != 'completado':
+                respuesta = jsonify({'success': False, 'error': 'La petición original sigue en proceso'})
+                respuesta.headers['Retry-After'] = '2'
+                return respuesta, 409
+            respuesta = jsonify(registro.respuesta)
+            respuesta.status_code = registro.status_code
+            respuesta.headers['Idempotent-Replayed'] = 'true'
+            return respuesta
+
+        try:
+            respuesta = current_app.make_response(vista(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _guardar(usuario_id, endpoint, clave, current_app.make_response(('', 500)))
+            raise
+        db.session.rollback()  # por si la vista dejó algo sin confirmar
+        _guardar(usuario_id, endpoint, clave, respuesta)
+        return respuesta
+    return envoltura
+
+
+def limpiar_claves(ttl_horas, lote=1000, max_lotes=50):
+    """Borra en lotes las claves más viejas que el TTL; devuelve cuántas borró"""
+    tabla = IdempotenciaClave.__table__
+    limite = datetime.utcnow() - timedelta(hours=ttl_horas)
+    borradas = 0
+    for _ in range(max_lotes):
+        ids = db.session.execute(
+            select(tabla.c.id).where(tabla.c.fecha_creacion < limite).order_by(tabla.c.id).limit(lote)
+        ).scalars().all()
+        if not ids:
+            break
+        borradas += db.session.execute(delete(tabla).where(tabla.c.id.in_(ids))).rowcount
+        db.session.commit()
+        if len(ids) < lote:
+            break
+    return borradas
@@ -0,0 +1,189 @@
+"""Derivados de las imágenes de producto: tamaños thumb/card/detail en WebP + respaldo.
+
+Cuando un admin guarda un producto con una imagen local (/static/...), la imagen
+se redimensiona en un pool de procesos (Pillow libera poco el GIL) y los archivos
+se escriben en IMAGENES_DERIVADOS_DIR con el hash del contenido en el nombre.
+Al terminar se registran en `producto_imagenes` y se marca el producto como
+cambiado en el catálogo, así las APIs empiezan a devolver las URLs para srcset.
+Las URLs se sirven con Cache-Control immutable: si la imagen cambia, cambia el hash.
+"""
+import atexit
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+from app import db
+from app.models.models import Producto, ProductoImagen
+
+# variante -> ancho máximo en px (nunca se agranda la imagen original)
+VARIANTES = {'thumb': 160, 'card': 400, 'detail': 1000}
+CALIDAD_WEBP = 80
+CALIDAD_JPEG = 85
+URL_DERIVADOS = '/media/img/'
+
+_pool = {'executor': None}
+_lock = threading.Lock()
+
+
+def url_derivado(archivo):
+    return URL_DERIVADOS + archivo
+
+
+def serializar_derivados(producto):
+    """URLs por variante y cadenas srcset listas para <picture>; None si no hay derivados vigentes"""
+    derivados = [d for d in producto.imagenes_derivadas if d.origen == producto.imagen]
+    if not derivados:
+        return None, None
+    derivados.sort(key=lambda d: d.ancho)
+    imagenes = {
+        d.variante: {
+            'ancho': d.ancho,
+            'alto': d.alto,
+            'webp': url_derivado(d.archivo_webp),
+            'respaldo': url_derivado(d.archivo_respaldo)
+        } for d in derivados
+    }
+    srcset = {
+        'webp': ', '.join(f'{url_derivado(d.archivo_webp)} {d.ancho}w' for d in derivados),
+        'respaldo': ', '.join(f'{url_derivado(d.archivo_respaldo)} {d.ancho}w' for d in derivados)
+    }
+    return imagenes, srcset
+
+
+def ruta_local(imagen, static_folder):
+    """Ruta en disco de una imagen servida desde /static, o None si es externa o no existe"""
+    if not imagen or not imagen.startswith('/static/'):
+        return None
+    raiz = os.path.realpath(static_folder)
+    ruta = os.path.realpath(os.path.join(raiz, imagen[len('/static/'):].split('?')[0]))
+    if not ruta.startswith(raiz + os.sep) or not os.path.isfile(ruta):
+        return None
+    return ruta
+
+
+def _guardar(imagen, ruta, formato, **opciones):
+    # Escribir a un temporal y renombrar: otro proceso nunca ve un archivo a medias
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    imagen.save(temporal, formato, **opciones)
+    os.replace(temporal, ruta)
+
+
+def generar_derivados(ruta_original, carpeta_salida, variantes=None):
+    """Genera los derivados de una imagen. Corre en un proceso del pool: no usa la BD.
+
+    Devuelve una lista de dicts con variante, ancho, alto, archivos y hash. Los
+    archivos que ya existen (mismo contenido) no se vuelven a escribir.
+    """
+    from PIL import Image, ImageOps
+
+    variantes = variantes or VARIANTES
+    with open(ruta_original, 'rb') as archivo:
+        contenido = archivo.read()
+    digest = hashlib.sha256(contenido).hexdigest()[:16]
+
+    original = Image.open(io.BytesIO(contenido))
+    original = ImageOps.exif_transpose(original)
+    con_alfa = original.mode in ('RGBA', 'LA') or (original.mode == 'P' and 'transparency' in original.info)
+    original = original.convert('RGBA' if con_alfa else 'RGB')
+    extension = 'png' if con_alfa else 'jpg'
+
+    os.makedirs(carpeta_salida, exist_ok=True)
+    resultados = []
+    for variante, ancho_max in variantes.items():
+        imagen = original.copy()
+        if imagen.width > ancho_max:
+            alto = max(1, round(imagen.height * ancho_max / imagen.width))
+            imagen = imagen.resize((ancho_max, alto), Image.LANCZOS)
+
+        # El ancho va en el nombre porque dos variantes pueden coincidir si la original es chica
+        base = f'{digest}-{variante}-{imagen.width}'
+        archivo_webp = f'{base}.webp'
+        archivo_respaldo = f'{base}.{extension}'
+
+        ruta_webp = os.path.join(carpeta_salida, archivo_webp)
+        if not os.path.exists(ruta_webp):
+            _guardar(imagen, ruta_webp, 'WEBP', quality=CALIDAD_WEBP, method=4)
+        ruta_respaldo = os.path.join(carpeta_salida, archivo_respaldo)
+        if not os.path.exists(ruta_respaldo):
+            if con_alfa:
+                _guardar(imagen, ruta_respaldo, 'PNG', optimize=True)
+            else:
+                _guardar(imagen, ruta_respaldo, 'JPEG', quality=CALIDAD_JPEG, optimize=True, progressive=True)
+
+        resultados.append({
+            'variante': variante,
+            'ancho': imagen.width,
+            'alto': imagen.height,
+            'archivo_webp': archivo_webp,
+            'archivo_respaldo': archivo_respaldo,
+            'hash_contenido': digest,
+        })
+    return resultados
+
+
+def registrar_derivados(producto_id, origen, resultados):
+    """Guarda los derivados generados para `origen`; se ignoran si la imagen ya cambió"""
+    from app.services.cache_catalogo import registrar_cambio_catalogo
+
+    producto = db.session.get(Producto, producto_id)
+    if producto is None or producto.imagen != origen:
+        return False
+    # Borrar antes de insertar: el flush hace los INSERT primero y chocarían con la restricción única
+    producto.imagenes_derivadas.clear()
+    db.session.flush()
+    for resultado in resultados:
+        producto.imagenes_derivadas.append(ProductoImagen(origen=origen, **resultado))
+    registrar_cambio_catalogo(db.session, [producto_id])
+    db.session.commit()
+    return True
+
+
+def _executor(workers):
+    with _lock:
+        if _pool['executor'] is None:
+            # fork explícito: con spawn/forkserver cada hijo re-importaría run.py y volvería a
+            # crear la app (scheduler, create_all). El hijo solo usa Pillow, no hilos ni la BD.
+            metodos = multiprocessing.get_all_start_methods()
+            contexto = multiprocessing.get_context('fork') if 'fork' in metodos else None
+            _pool['executor'] = ProcessPoolExecutor(max_workers=workers, mp_context=contexto)
+            atexit.register(_pool['executor'].shutdown, wait=False)
+        return _pool['executor']
+
+
+def programar_derivados(producto):
+    """Encola la generación de derivados de la imagen de `producto` (después del commit).
+
+    Devuelve False si la imagen no es local o los derivados están desactivados.
+    """
+    app = current_app._get_current_object()
+    if not app.config.get('IMAGENES_DERIVADOS_ENABLED', True):
+        return False
+    ruta = ruta_local(producto.imagen, app.static_folder)
+    if ruta is None:
+        return False
+
+    producto_id, origen = producto.id_producto, producto.imagen
+    try:
+        futuro = _executor(app.config.get('IMAGENES_DERIVADOS_WORKERS', 2)).submit(
+            generar_derivados, ruta, app.config['IMAGENES_DERIVADOS_DIR']
+        )
+    except Exception as e:
+        # El producto ya se guardó; sin derivados las APIs siguen usando `imagen`
+        print(f"⚠️ No se pudo encolar derivados del producto {producto_id}: {e}")
+        return False
+
+    def _al_terminar(futuro):
+        try:
+            resultados = futuro.result()
+            with app.app_context():
+                registrar_derivados(producto_id, origen, resultados)
+        except Exception as e:
+            print(f"⚠️ Error generando derivados de imagen del producto {producto_id}: {e}")
+
+    futuro.add_done_callback(_al_terminar)
+    return True
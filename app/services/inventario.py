@@ -0,0 +1,198 @@
+"""Descuento de stock sin sobreventa y reservas para pedidos pendientes de pago.
+
+Cada producto se descuenta con un UPDATE condicional
+(`SET stock = stock - :q WHERE id = :id AND stock - reservado >= :q RETURNING stock`), así
+la comprobación y el descuento son una sola operación atómica en la BD: dos
+checkouts simultáneos nunca pueden dejar el stock en negativo. Los productos se
+bloquean en orden de id para que dos transacciones con productos en común
+tomen los bloqueos de fila en el mismo orden y no se bloqueen mutuamente.
+
+Un pedido de Mercado Pago aparta sus unidades en `reservas_stock` al crearse,
+por RESERVA_STOCK_MINUTOS; mientras la reserva está vigente esas unidades no se
+pueden vender a otro (`reservado` = suma de reservas vigentes de otros pedidos)
+y el catálogo muestra `stock - reservado`. Cuando llega el pago, el descuento
+consume la reserva del propio pedido.
+
+Una reserva vencida deja de contar al instante para el checkout y para las
+lecturas que no pasan por el cache del catálogo. El snapshot en memoria, en
+cambio, solo recalcula `reservado` cuando se registra un cambio del producto: el
+job del scheduler que borra las reservas vencidas en lotes es el que lo avisa,
+así que el catálogo puede mostrar esas unidades como apartadas hasta
+RESERVA_LIMPIEZA_MINUTOS después del vencimiento.
+
+Cada descuento queda en el registro de movimientos (ver services/movimientos.py),
+en la misma transacción; reservar no cambia el stock y no genera movimientos.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, insert, select, update
+
+from app import db
+from app.models.models import Producto
+from app.models.pedido import Pedido
+from app.models.reserva import ReservaStock
+from app.services.cache_catalogo import registrar_cambio_catalogo
+from app.services.carrito import ErrorCarrito
+from app.services.catalogo import reservado_por_producto, subconsulta_reservado
+from app.services.movimientos import registrar_movimientos
+
+
+class StockInsuficiente(ErrorCarrito):
+    """Un producto no tenía stock suficiente; la transacción debe deshacerse completa."""
+
+    def __init__(self, mensaje, producto_id, disponible, solicitado):
+        super().__init__(mensaje)
+        self.producto_id = producto_id
+        self.disponible = disponible
+        self.solicitado = solicitado
+
+
+def _bloquear(producto_ids):
+    """Bloquea las filas de los productos en orden de id (SELECT ... FOR UPDATE).
+
+    Después del bloqueo cada sentencia ve las reservas que otra transacción haya
+    confirmado mientras esperábamos; sin él, un UPDATE que espera el bloqueo
+    reevalúa la fila pero no la subconsulta de reservas.
+    """
+    productos = Producto.__table__
+    return db.session.execute(
+        select(productos.c.id_producto, productos.c.stock, productos.c.activo)
+        .where(productos.c.id_producto.in_(sorted(producto_ids)))
+        .order_by(productos.c.id_producto).with_for_update()
+    ).all()
+
+
+def descontar_stock(cantidades, solo_activos=True, pedido_id=None, motivo=None):
+    """Descuenta {producto_id: cantidad} en la transacción actual (sin commit).
+
+    Las reservas vigentes de otros pedidos no se pueden vender; las de `pedido_id`
+    se consumen. Un producto que llega a 0 se desactiva, como al vender desde el
+    panel. Registra una salida por producto con `motivo` (por defecto el pedido).
+    Si alguno no alcanza lanza StockInsuficiente: los UPDATE anteriores siguen
+    pendientes en la transacción y el llamador debe hacer rollback.
+    Devuelve {producto_id: stock restante}.
+    """
+    if not cantidades:
+        return {}
+    productos = Producto.__table__
+    _bloquear(cantidades)
+    if pedido_id is not None:
+        db.session.execute(delete(ReservaStock.__table__).where(ReservaStock.pedido_id == pedido_id))
+
+    restantes = {}
+    for producto_id in sorted(cantidades):
+        cantidad = cantidades[producto_id]
+        condiciones = [productos.c.id_producto == producto_id,
+                       productos.c.stock - subconsulta_reservado(productos.c.id_producto, pedido_id) >= cantidad]
+        if solo_activos:
+            condiciones.append(productos.c.activo == True)
+        fila = db.session.execute(
+            update(productos).where(*condiciones).values(
+                stock=productos.c.stock - cantidad,
+                activo=case((productos.c.stock - cantidad == 0, False), else_=productos.c.activo)
+            ).returning(productos.c.stock)
+        ).first()
+        if fila is None:
+            raise _conflicto(producto_id, cantidad, pedido_id)
+        restantes[producto_id] = fila[0]
+    if motivo is None and pedido_id is not None:
+        motivo = f'pedido {pedido_id}'
+    registrar_movimientos({producto_id: -cantidad for producto_id, cantidad in cantidades.items()},
+                          'salida', motivo)
+    registrar_cambio_catalogo(db.session, list(restantes))
+    return restantes
+
+
+def reservar_stock(pedido_id, cantidades, minutos):
+    """Aparta {producto_id: cantidad} para el pedido durante `minutos` (sin commit).
+
+    Lanza StockInsuficiente si algún producto no tiene esas unidades libres;
+    el llamador debe hacer rollback.
+    """
+    if not cantidades:
+        return
+    bloqueados = {fila.id_producto: fila for fila in _bloquear(cantidades)}
+    reservado = reservado_por_producto(cantidades)
+    for producto_id in sorted(cantidades):
+        fila = bloqueados.get(producto_id)
+        if fila is None or not fila.activo or (fila.stock or 0) - reservado.get(producto_id, 0) < cantidades[producto_id]:
+            raise _conflicto(producto_id, cantidades[producto_id])
+
+    ahora = datetime.utcnow()
+    expira = ahora + timedelta(minutes=minutos)
+    db.session.execute(insert(ReservaStock.__table__), [
+        {'pedido_id': pedido_id, 'producto_id': producto_id, 'cantidad': cantidad,
+         'expira_en': expira, 'fecha_creacion': ahora}
+        for producto_id, cantidad in cantidades.items()
+    ])
+    registrar_cambio_catalogo(db.session, list(cantidades))
+
+
+def liberar_reservas(pedido_id):
+    """Devuelve al catálogo las unidades reservadas por el pedido (sin commit)"""
+    reservas = ReservaStock.__table__
+    producto_ids = db.session.execute(
+        delete(reservas).where(reservas.c.pedido_id == pedido_id).returning(reservas.c.producto_id)
+    ).scalars().all()
+    if producto_ids:
+        registrar_cambio_catalogo(db.session, set(producto_ids))
+    return len(producto_ids)
+
+
+def cancelar_pendientes_mercadopago(usuario_id):
+    """Cancela los pedidos Mercado Pago pendientes del usuario y libera sus reservas (sin commit).
+
+    Cada intento de pago crea un pedido nuevo; sin esto la reserva del intento
+    anterior contaría como apartada contra el reintento del mismo usuario. Si un
+    pedido cancelado aquí llega a pagarse, el webhook lo completa igual.
+    """
+    pedidos = Pedido.__table__
+    pedido_ids = db.session.execute(
+        update(pedidos).where(pedidos.c.usuario_id == usuario_id, pedidos.c.estado == 'pendiente',
+                              pedidos.c.metodo_pago == 'mercadopago')
+        .values(estado='cancelado').returning(pedidos.c.id_pedido)
+    ).scalars().all()
+    for pedido_id in pedido_ids:
+        liberar_reservas(pedido_id)
+    return pedido_ids
+
+
+def limpiar_reservas_vencidas(lote=500, max_lotes=20):
+    """Borra en lotes las reservas vencidas y refresca el stock disponible del catálogo.
+
+    Ya no contaban para el stock disponible; borrarlas mantiene pequeña la tabla y
+    avisa al cache del catálogo de los productos que vuelven a estar libres.
+    """
+    reservas = ReservaStock.__table__
+    ahora = datetime.utcnow()
+    borradas = 0
+    for _ in range(max_lotes):
+        filas = db.session.execute(
+            select(reservas.c.id, reservas.c.producto_id).where(reservas.c.expira_en <= ahora)
+            .order_by(reservas.c.id).limit(lote)
+        ).all()
+        if not filas:
+            break
+        borradas += db.session.execute(
+            delete(reservas).where(reservas.c.id.in_([fila.id for fila in filas]))
+        ).rowcount
+        registrar_cambio_catalogo(db.session, {fila.producto_id for fila in filas})
+        db.session.commit()
+        if len(filas) < lote:
+            break
+    return borradas
+
+
+def _conflicto(producto_id, cantidad, pedido_id=None):
+    actual = db.session.execute(
+        select(Producto.nombre, Producto.stock, Producto.activo, subconsulta_reservado(Producto.id_producto, pedido_id))
+        .where(Producto.id_producto == producto_id)
+    ).first()
+    if actual is None or not actual.activo:
+        nombre = actual.nombre if actual else 'desconocido'
+        return StockInsuficiente(f'El producto {nombre} no está disponible', producto_id, 0, cantidad)
+    disponible = max(0, (actual.stock or 0) - actual[3])
+    return StockInsuficiente(
+        f'Stock insuficiente para {actual.nombre}. Disponible: {disponible}, Solicitado: {cantidad}',
+        producto_id, disponible, cantidad
+    )
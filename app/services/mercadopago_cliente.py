@@ -0,0 +1,230 @@
+"""Cliente del SDK de Mercado Pago compartido por proceso.
+
+El SDK por defecto abre una sesión HTTP nueva (y un handshake TLS) en cada
+llamada y usa un timeout único de 60 s. Aquí hay un SDK por (token, URL base)
+y proceso, con un `requests.Session` propio que reutiliza conexiones keep-alive,
+timeouts de conexión y lectura separados y un disyuntor (circuit breaker): tras
+MERCADOPAGO_DISYUNTOR_FALLOS fallos seguidos (error de red, timeout o 5xx/429)
+las llamadas fallan al instante con ProveedorNoDisponible durante
+MERCADOPAGO_DISYUNTOR_ESPERA_SEGUNDOS; después pasa una llamada de prueba y, si
+responde bien, se vuelve a cerrar.
+
+`metricas()` devuelve latencias y contadores de error del proceso.
+
+MERCADOPAGO_API_URL permite apuntar el SDK a otro servidor (p. ej. el falso de
+app/scripts/fake_mercadopago.py) para probar el flujo de pagos sin red.
+"""
+import threading
+import time
+from collections import deque
+
+import mercadopago
+import requests
+from flask import current_app
+from mercadopago.http import HttpClient
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+URL_API_MERCADOPAGO = 'https://api.mercadopago.com'
+# Códigos que cuentan como fallo del proveedor (no del pedido)
+STATUS_FALLO = frozenset((429, 500, 502, 503, 504))
+# Latencias recientes guardadas para los percentiles
+MUESTRAS_LATENCIA = 500
+
+
+class ProveedorNoDisponible(RuntimeError):
+    """El disyuntor está abierto: Mercado Pago viene fallando y no se le llama"""
+
+
+class Disyuntor:
+    def __init__(self, fallos_para_abrir, espera_segundos):
+        self.fallos_para_abrir = fallos_para_abrir
+        self.espera_segundos = espera_segundos
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_hasta = None
+        self._prueba_en_curso = False
+        self._prueba_desde = 0.0
+
+    @property
+    def estado(self):
+        with self._lock:
+            if self._abierto_hasta is None:
+                return 'cerrado'
+            return 'abierto' if time.monotonic() < self._abierto_hasta else 'semiabierto'
+
+    def permitir(self):
+        """True si la llamada puede salir; en semiabierto solo pasa una a la vez.
+
+        Una prueba que no informó resultado en `espera_segundos` se da por perdida
+        y se deja salir otra, para que el disyuntor no quede abierto para siempre.
+        """
+        with self._lock:
+            if self._abierto_hasta is None:
+                return True
+            ahora = time.monotonic()
+            if ahora < self._abierto_hasta:
+                return False
+            if self._prueba_en_curso and ahora - self._prueba_desde < self.espera_segundos:
+                return False
+            self._prueba_en_curso = True
+            self._prueba_desde = ahora
+            return True
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_hasta = None
+            self._prueba_en_curso = False
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._prueba_en_curso or self._fallos >= self.fallos_para_abrir:
+                self._abierto_hasta = time.monotonic() + self.espera_segundos
+            self._prueba_en_curso = False
+
+
+class MetricasMP:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencias = deque(maxlen=MUESTRAS_LATENCIA)
+        self.llamadas = 0
+        self.errores = 0
+        self.timeouts = 0
+        self.rechazadas = 0
+        self.por_status = {}
+
+    def registrar(self, segundos, status=None, error=None):
+        with self._lock:
+            self.llamadas += 1
+            self._latencias.append(segundos)
+            if status is not None:
+                self.por_status[status] = self.por_status.get(status, 0) + 1
+            if error is not None or status in STATUS_FALLO:
+                self.errores += 1
+            if isinstance(error, requests.Timeout):
+                self.timeouts += 1
+
+    def rechazada(self):
+        with self._lock:
+            self.rechazadas += 1
+
+    def resumen(self):
+        with self._lock:
+            latencias = sorted(self._latencias)
+            datos = {
+                'llamadas': self.llamadas,
+                'errores': self.errores,
+                'timeouts': self.timeouts,
+                'rechazadas_disyuntor': self.rechazadas,
+                'tasa_error': round(self.errores / self.llamadas, 4) if self.llamadas else 0.0,
+                'por_status': {str(k): v for k, v in sorted(self.por_status.items())},
+            }
+        if latencias:
+            datos['latencia_ms'] = {
+                'p50': round(latencias[len(latencias) // 2] * 1000, 1),
+                'p95': round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))] * 1000, 1),
+                'max': round(latencias[-1] * 1000, 1),
+                'muestras': len(latencias),
+            }
+        return datos
+
+
+class ClienteHttpMP(HttpClient):
+    """HttpClient del SDK con sesión keep-alive, timeouts propios y disyuntor"""
+
+    def __init__(self, url_base=None, timeout_conexion=3.05, timeout_lectura=10, conexiones=10,
+                 reintentos=1, disyuntor=None, metricas=None):
+        self.url_base = (url_base or URL_API_MERCADOPAGO).rstrip('/')
+        self.timeout = (timeout_conexion, timeout_lectura)
+        self.disyuntor = disyuntor or Disyuntor(5, 30)
+        self.metricas = metricas or MetricasMP()
+        # Reintentos solo para errores de conexión y GET con 502/503/504 (nunca un POST que ya llegó);
+        # read=False deja pasar el timeout de lectura como requests.ReadTimeout
+        adaptador = HTTPAdapter(
+            pool_connections=1, pool_maxsize=conexiones,
+            max_retries=Retry(total=reintentos, read=False, status_forcelist=(502, 503, 504),
+                              backoff_factor=0.2, raise_on_status=False)
+        )
+        self.sesion = requests.Session()
+        self.sesion.mount('https://', adaptador)
+        self.sesion.mount('http://', adaptador)
+
+    def request(self, method, url, maxretries=None, retry_on=None, backoff_factor=None, **kwargs):
+        # maxretries/retry_on/timeout del SDK se ignoran: los fija este cliente
+        from mercadopago.errors.exceptions import MPServerError
+
+        if url.startswith(URL_API_MERCADOPAGO):
+            url = self.url_base + url[len(URL_API_MERCADOPAGO):]
+        if not self.disyuntor.permitir():
+            self.metricas.rechazada()
+            raise ProveedorNoDisponible('Mercado Pago no disponible temporalmente')
+
+        kwargs['timeout'] = self.timeout
+        inicio = time.perf_counter()
+        correcta = False
+        try:
+            api_result = self.sesion.request(method, url, **kwargs)
+            correcta = api_result.status_code not in STATUS_FALLO
+        except requests.RequestException as e:
+            self.metricas.registrar(time.perf_counter() - inicio, error=e)
+            raise
+        finally:
+            # Cualquier excepción cuenta como fallo: si no se informa, la prueba del
+            # estado semiabierto queda en curso y el disyuntor no vuelve a cerrarse
+            if correcta:
+                self.disyuntor.exito()
+            else:
+                self.disyuntor.fallo()
+        self.metricas.registrar(time.perf_counter() - inicio, status=api_result.status_code)
+
+        response = {'status': api_result.status_code, 'response': None}
+        if api_result.status_code != 204 and api_result.content:
+            try:
+                response['response'] = api_result.json()
+            except ValueError as exc:
+                raise MPServerError(api_result.status_code, {
+                    'message': 'Invalid JSON in response body', 'error': 'invalid_response'
+                }) from exc
+        return response
+
+
+_lock = threading.Lock()
+_clientes = {}  # (token, url_base) -> mercadopago.SDK
+metricas_mp = MetricasMP()
+
+
+def get_mp_client():
+    """SDK compartido del proceso para la configuración actual"""
+    config = current_app.config
+    token = config.get('MERCADOPAGO_ACCESS_TOKEN')
+    if not token:
+        raise RuntimeError('MERCADOPAGO_ACCESS_TOKEN no configurado en la aplicacion')
+    clave = (token, config.get('MERCADOPAGO_API_URL') or URL_API_MERCADOPAGO)
+    sdk = _clientes.get(clave)
+    if sdk is None:
+        with _lock:
+            sdk = _clientes.get(clave)
+            if sdk is None:
+                http = ClienteHttpMP(
+                    clave[1],
+                    timeout_conexion=config['MERCADOPAGO_TIMEOUT_CONEXION'],
+                    timeout_lectura=config['MERCADOPAGO_TIMEOUT_LECTURA'],
+                    conexiones=config['MERCADOPAGO_POOL_CONEXIONES'],
+                    reintentos=config['MERCADOPAGO_REINTENTOS'],
+                    disyuntor=Disyuntor(config['MERCADOPAGO_DISYUNTOR_FALLOS'],
+                                        config['MERCADOPAGO_DISYUNTOR_ESPERA_SEGUNDOS']),
+                    metricas=metricas_mp
+                )
+                sdk = _clientes[clave] = mercadopago.SDK(token, http_client=http)
+    return sdk
+
+
+def metricas():
+    """Contadores del proceso y estado de los disyuntores"""
+    datos = metricas_mp.resumen()
+    with _lock:
+        clientes = list(_clientes.items())
+    datos['disyuntores'] = {url: sdk.http_client.disyuntor.estado for (_, url), sdk in clientes}
+    return datos
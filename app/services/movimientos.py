@@ -0,0 +1,241 @@
+"""Registro append-only de movimientos de inventario y snapshots de stock.
+
+Cada cambio de stock deja una fila en `inventario_movimientos` con la cantidad
+con signo, en la misma transacción que el cambio:
+
+- los UPDATE directos (checkout, webhook de Mercado Pago) llaman a
+  `registrar_movimientos`, que inserta todos los productos en un solo INSERT;
+- los cambios hechos con el ORM (alta y edición de productos en el panel) se
+  detectan en after_flush y se insertan juntos, también en un solo INSERT.
+
+Las filas nunca se modifican ni se borran. Un job del scheduler las compacta en
+`inventario_snapshots`: para cada producto con movimientos desde el último corte
+guarda el stock a un corte nuevo (snapshot anterior + suma del intervalo). El
+stock en una fecha T es el último snapshot con corte <= T más los movimientos
+entre ese corte y T, un rango corto del índice (producto_id, creado_en).
+
+El corte queda INVENTARIO_SNAPSHOT_MARGEN_SEGUNDOS en el pasado: un movimiento
+toma su fecha al insertarse pero solo es visible al confirmar su transacción, y
+un snapshot no debe cerrar un intervalo que todavía puede recibir filas.
+"""
+from datetime import datetime, timedelta
+
+from flask import has_request_context, session as sesion_web
+from sqlalchemy import and_, event, func, insert, inspect, literal, or_, select
+
+from app import db
+from app.models.analytics import InventarioMovimiento, InventarioSnapshot
+from app.models.models import Producto
+from app.models.pedido import PedidoItem
+from app.services.db_util import insert_dialecto
+
+_estado = {'eventos': False}
+
+
+def init_app(app):
+    if _estado['eventos']:
+        return
+    event.listen(db.session, 'after_flush', _despues_flush)
+    _estado['eventos'] = True
+
+
+def registrar_movimientos(cantidades, tipo, motivo=None, usuario_id=None, conexion=None):
+    """Inserta {producto_id: cantidad con signo} en la transacción actual (sin commit)"""
+    ahora = datetime.utcnow()
+    filas = [
+        {'producto_id': producto_id, 'tipo': tipo, 'cantidad': cantidad, 'motivo': motivo,
+         'usuario_id': usuario_id, 'creado_en': ahora}
+        for producto_id, cantidad in sorted(cantidades.items()) if cantidad
+    ]
+    if filas:
+        (conexion or db.session.connection()).execute(insert(InventarioMovimiento.__table__), filas)
+    return len(filas)
+
+
+def _usuario_actual():
+    if has_request_context():
+        return sesion_web.get('user_id')
+    return None
+
+
+def _despues_flush(session, flush_context):
+    altas = {}
+    ajustes = {}
+    for obj in session.new:
+        if isinstance(obj, Producto) and obj.stock:
+            altas[obj.id_producto] = obj.stock
+    for obj in session.dirty:
+        if not isinstance(obj, Producto):
+            continue
+        historial = inspect(obj).attrs.stock.history
+        if not historial.has_changes():
+            continue
+        if not historial.deleted:
+            # El valor anterior no estaba cargado: no hay forma de saber la diferencia
+            print(f"⚠️ Cambio de stock sin valor anterior, no registrado: producto {obj.id_producto}")
+            continue
+        ajustes[obj.id_producto] = (historial.added[0] or 0) - (historial.deleted[0] or 0)
+    if not altas and not ajustes:
+        return
+
+    conexion = session.connection()
+    usuario_id = _usuario_actual()
+    registrar_movimientos(altas, 'entrada', 'alta de producto', usuario_id, conexion)
+    registrar_movimientos(ajustes, 'ajuste', 'edición de stock', usuario_id, conexion)
+
+
+def tiene_historial(producto_id):
+    """True si el producto tiene movimientos de inventario o aparece en pedidos.
+
+    Esas filas apuntan al producto y el registro es append-only: un producto con
+    historial no se puede borrar, solo desactivar.
+    """
+    movimientos = InventarioMovimiento.__table__
+    return db.session.execute(select(
+        select(movimientos.c.id).where(movimientos.c.producto_id == producto_id).exists()
+        | select(PedidoItem.id_item).where(PedidoItem.producto_id == producto_id).exists()
+    )).scalar()
+
+
+def sembrar_saldos_iniciales():
+    """Registra como saldo inicial el stock de los productos sin movimientos (con commit).
+
+    Los productos creados antes de existir el registro no tienen historia; sin
+    esta fila su stock no cuadraría con la suma de movimientos. Corre al arrancar
+    cada worker: si dos lo hacen a la vez, el índice único parcial
+    uq_inv_mov_saldo_inicial descarta la fila repetida (ON CONFLICT DO NOTHING).
+    """
+    productos = Producto.__table__
+    movimientos = InventarioMovimiento.__table__
+    sin_movimientos = ~select(movimientos.c.id).where(
+        movimientos.c.producto_id == productos.c.id_producto).exists()
+    resultado = db.session.execute(
+        insert_dialecto(movimientos).from_select(
+            ['producto_id', 'tipo', 'cantidad', 'motivo', 'creado_en'],
+            select(productos.c.id_producto, literal('ajuste'), productos.c.stock, literal('saldo inicial'),
+                   literal(datetime.utcnow(), db.DateTime))
+            .where(productos.c.stock != 0, sin_movimientos)
+        ).on_conflict_do_nothing()
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+def _ultimos_snapshots(producto_ids, momento=None):
+    """Subconsulta (producto_id, corte) con el último snapshot de cada producto hasta `momento`"""
+    snapshots = InventarioSnapshot.__table__
+    consulta = select(snapshots.c.producto_id, func.max(snapshots.c.corte).label('corte'))
+    if producto_ids is not None:
+        consulta = consulta.where(snapshots.c.producto_id.in_(producto_ids))
+    if momento is not None:
+        consulta = consulta.where(snapshots.c.corte <= momento)
+    return consulta.group_by(snapshots.c.producto_id).subquery()
+
+
+def saldos(producto_ids, momento=None):
+    """{producto_id: stock} según el registro: último snapshot + movimientos posteriores.
+
+    Con `momento` responde el stock que había en esa fecha; sin él, el actual.
+    """
+    producto_ids = list(producto_ids)
+    if not producto_ids:
+        return {}
+    snapshots = InventarioSnapshot.__table__
+    movimientos = InventarioMovimiento.__table__
+    ultimos = _ultimos_snapshots(producto_ids, momento)
+
+    resultado = {producto_id: 0 for producto_id in producto_ids}
+    for producto_id, stock in db.session.execute(
+        select(snapshots.c.producto_id, snapshots.c.stock).join(ultimos, and_(
+            snapshots.c.producto_id == ultimos.c.producto_id, snapshots.c.corte == ultimos.c.corte))
+    ):
+        resultado[producto_id] = stock
+
+    condiciones = [movimientos.c.producto_id.in_(producto_ids),
+                   or_(ultimos.c.corte.is_(None), movimientos.c.creado_en > ultimos.c.corte)]
+    if momento is not None:
+        condiciones.append(movimientos.c.creado_en <= momento)
+    for producto_id, delta in db.session.execute(
+        select(movimientos.c.producto_id, func.sum(movimientos.c.cantidad))
+        .outerjoin(ultimos, movimientos.c.producto_id == ultimos.c.producto_id)
+        .where(*condiciones).group_by(movimientos.c.producto_id)
+    ):
+        resultado[producto_id] += int(delta or 0)
+    return resultado
+
+
+def stock_en(producto_id, momento):
+    """Stock del producto en la fecha `momento` (UTC)"""
+    return saldos([producto_id], momento)[producto_id]
+
+
+def compactar_inventario(margen_segundos, lote=500):
+    """Guarda un snapshot nuevo de los productos con movimientos desde el último corte (con commit).
+
+    Todo el corte se confirma en una transacción: el siguiente parte del último
+    corte y da por hecho que cada producto que cambió tiene su snapshot.
+    Devuelve cuántos snapshots escribió.
+    """
+    snapshots = InventarioSnapshot.__table__
+    movimientos = InventarioMovimiento.__table__
+    corte = datetime.utcnow() - timedelta(seconds=margen_segundos)
+    anterior = db.session.execute(select(func.max(snapshots.c.corte))).scalar()
+    if anterior is not None and corte <= anterior:
+        return 0
+
+    condiciones = [movimientos.c.creado_en <= corte]
+    if anterior is not None:
+        condiciones.append(movimientos.c.creado_en > anterior)
+    deltas = dict(db.session.execute(
+        select(movimientos.c.producto_id, func.sum(movimientos.c.cantidad))
+        .where(*condiciones).group_by(movimientos.c.producto_id)
+    ).all())
+
+    producto_ids = sorted(deltas)
+    escritos = 0
+    ahora = datetime.utcnow()
+    for inicio in range(0, len(producto_ids), lote):
+        ids = producto_ids[inicio:inicio + lote]
+        previos = {}
+        if anterior is not None:
+            # Acotado a `anterior`: otro proceso pudo confirmar ya un corte posterior
+            ultimos = _ultimos_snapshots(ids, anterior)
+            previos = dict(db.session.execute(
+                select(snapshots.c.producto_id, snapshots.c.stock).join(ultimos, and_(
+                    snapshots.c.producto_id == ultimos.c.producto_id, snapshots.c.corte == ultimos.c.corte))
+            ).all())
+        db.session.execute(insert(snapshots), [
+            {'producto_id': producto_id, 'stock': previos.get(producto_id, 0) + int(deltas[producto_id] or 0),
+             'corte': corte, 'creado_en': ahora}
+            for producto_id in ids
+        ])
+        escritos += len(ids)
+    db.session.commit()
+    return escritos
+
+
+def conciliar_inventario(lote=500):
+    """Productos cuyo stock no coincide con el registro de movimientos"""
+    productos = Producto.__table__
+    diferencias = []
+    ultimo_id = 0
+    while True:
+        filas = db.session.execute(
+            select(productos.c.id_producto, productos.c.nombre, productos.c.stock)
+            .where(productos.c.id_producto > ultimo_id).order_by(productos.c.id_producto).limit(lote)
+        ).all()
+        if not filas:
+            break
+        registro = saldos([fila.id_producto for fila in filas])
+        for fila in filas:
+            esperado = registro[fila.id_producto]
+            if (fila.stock or 0) != esperado:
+                diferencias.append({
+                    'producto_id': fila.id_producto,
+                    'nombre': fila.nombre,
+                    'stock': fila.stock,
+                    'stock_registro': esperado,
+                    'diferencia': (fila.stock or 0) - esperado,
+                })
+        ultimo_id = filas[-1].id_producto
+    return diferencias
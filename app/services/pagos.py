@@ -0,0 +1,185 @@
+"""Registro de pagos (`pagos`) con escritura diferida en lotes.
+
+Cada intento y resultado de pago (checkout PayPal, preference y notificaciones
+de Mercado Pago) se guarda con su payload crudo. `registrar_pago` solo agrega
+la fila a un buffer en memoria; un hilo la inserta junto con las demás en un
+solo INSERT cada PAGOS_FLUSH_SEGUNDOS, o antes si se juntan PAGOS_LOTE filas.
+Así la petición no espera una escritura extra en la BD.
+
+El registro es de auditoría: si el proceso muere sin vaciar el buffer se
+pierden como mucho las filas de ese intervalo; el estado del pedido no depende
+de él. Al salir del proceso (atexit) el buffer se vacía.
+"""
+import atexit
+import threading
+from collections import deque
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.analytics import Pago
+
+# Filas esperando en memoria como máximo; si la BD no responde se descartan las más viejas,
+# se cuentan en BufferPagos.descartadas y se avisa en el log
+PAGOS_MAX_EN_BUFFER = 10000
+
+ESTADOS_MERCADOPAGO = {
+    'approved': 'aprobado',
+    'approved_by_merchant': 'aprobado',
+    'authorized': 'aprobado',
+    'rejected': 'rechazado',
+    'cancelled': 'rechazado',
+    'refunded': 'reembolsado',
+    'charged_back': 'reembolsado',
+}
+
+
+def estado_mercadopago(status):
+    """Estado del registro para un status de pago de Mercado Pago"""
+    return ESTADOS_MERCADOPAGO.get((status or '').lower(), 'pendiente')
+
+
+def _monto(valor):
+    try:
+        return Decimal(str(valor)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError, ValueError):
+        return Decimal('0.00')
+
+
+class BufferPagos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filas = deque()
+        self._aviso = threading.Event()
+        self._detener = threading.Event()
+        self._hilo = None
+        self._app = None
+        self.lote = 200
+        self.intervalo = 2.0
+        self.descartadas = 0
+
+    def iniciar(self, app):
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._app = app
+            self.lote = app.config['PAGOS_LOTE']
+            self.intervalo = app.config['PAGOS_FLUSH_SEGUNDOS']
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._trabajar, name='pagos-write-behind', daemon=True)
+            self._hilo.start()
+        atexit.register(self.detener)
+
+    def agregar(self, fila):
+        with self._lock:
+            self._filas.append(fila)
+            descartadas = self._recortar()
+            lleno = len(self._filas) >= self.lote
+        if descartadas:
+            self._avisar_descarte(descartadas)
+        if lleno:
+            self._aviso.set()
+
+    def _recortar(self):
+        """Descarta las filas más viejas por encima de PAGOS_MAX_EN_BUFFER (con el lock tomado)"""
+        descartadas = 0
+        while len(self._filas) > PAGOS_MAX_EN_BUFFER:
+            self._filas.popleft()
+            descartadas += 1
+        self.descartadas += descartadas
+        return descartadas
+
+    def _avisar_descarte(self, descartadas):
+        print(f"⚠️ Buffer de pagos lleno: {descartadas} filas descartadas "
+              f"({self.descartadas} en total desde el arranque)")
+
+    def pendientes(self):
+        with self._lock:
+            return len(self._filas)
+
+    def vaciar(self):
+        """Inserta todo lo pendiente (requiere app context); devuelve las filas escritas"""
+        escritas = 0
+        while True:
+            with self._lock:
+                filas = [self._filas.popleft() for _ in range(min(self.lote, len(self._filas)))]
+            if not filas:
+                return escritas
+            escritas += self._insertar(filas)
+
+    def _insertar(self, filas):
+        try:
+            db.session.execute(insert(Pago.__table__), filas)
+            db.session.commit()
+            return len(filas)
+        except IntegrityError:
+            # Alguna fila apunta a un pedido que ya no existe: insertar una a una y descartar esas
+            db.session.rollback()
+            escritas = 0
+            for fila in filas:
+                try:
+                    db.session.execute(insert(Pago.__table__), [fila])
+                    db.session.commit()
+                    escritas += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    print(f"⚠️ Pago descartado, pedido {fila.get('pedido_id')} inexistente")
+            return escritas
+        except Exception:
+            # BD no disponible: devolver las filas al buffer para el siguiente intento
+            db.session.rollback()
+            with self._lock:
+                self._filas.extendleft(reversed(filas))
+                descartadas = self._recortar()
+            if descartadas:
+                self._avisar_descarte(descartadas)
+            raise
+
+    def detener(self, timeout=5):
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+        if hilo is None:
+            return
+        self._detener.set()
+        self._aviso.set()
+        hilo.join(timeout)
+
+    def _trabajar(self):
+        app = self._app
+        while True:
+            self._aviso.wait(self.intervalo)
+            self._aviso.clear()
+            detener = self._detener.is_set()
+            with app.app_context():
+                try:
+                    escritas = self.vaciar()
+                    if escritas >= self.lote:
+                        print(f"💾 Pagos registrados en lote: {escritas}")
+                except Exception as e:
+                    print(f"⚠️ Error guardando pagos ({self.pendientes()} en espera): {e}")
+                finally:
+                    db.session.remove()
+            if detener:
+                return
+
+
+buffer_pagos = BufferPagos()
+
+
+def registrar_pago(pedido_id, proveedor, estado, monto, referencia=None, moneda=None, payload=None):
+    """Agrega un intento o resultado de pago al registro (escritura diferida)"""
+    if not pedido_id:
+        return
+    buffer_pagos.agregar({
+        'pedido_id': int(pedido_id),
+        'proveedor': proveedor,
+        'estado': estado,
+        'monto': _monto(monto),
+        'moneda': moneda or 'USD',
+        'referencia': str(referencia)[:255] if referencia else None,
+        'payload': payload,
+        'creado_en': datetime.utcnow(),
+    })
@@ -0,0 +1,83 @@
+"""Preferences de Mercado Pago reutilizadas por pedido.
+
+Pulsar otra vez el botón de pago para el mismo pedido y los mismos items
+devuelve la preference guardada (y su init_point) sin llamar a la API. La clave
+es (pedido_id, huella), donde la huella es el sha256 de los datos que se
+enviarían a Mercado Pago: si cambia un item, una cantidad o las back_urls, se
+crea una preference nueva. Las filas vencen a las MERCADOPAGO_PREFERENCIA_TTL_HORAS
+y un job del scheduler las borra en lotes.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.preferencia import PreferenciaMercadoPago
+from app.services.db_util import insert_dialecto
+
+
+def huella_preferencia(datos):
+    canonico = json.dumps(datos, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonico.encode()).hexdigest()
+
+
+def preferencia_guardada(pedido_id, huella):
+    """Respuesta guardada y vigente para el pedido y la huella, o None"""
+    return db.session.execute(
+        select(PreferenciaMercadoPago.respuesta).where(
+            PreferenciaMercadoPago.pedido_id == pedido_id,
+            PreferenciaMercadoPago.huella == huella,
+            PreferenciaMercadoPago.expira_en > datetime.utcnow()
+        )
+    ).scalar_one_or_none()
+
+
+def guardar_preferencia(pedido_id, huella, respuesta, ttl_horas):
+    """Guarda la preference creada; si otra petición guardó una antes, devuelve esa.
+
+    Dos clics simultáneos pueden crear dos preferences en Mercado Pago, pero ambos
+    clientes reciben la misma (la primera que se guardó).
+    """
+    tabla = PreferenciaMercadoPago.__table__
+    ahora = datetime.utcnow()
+    vigente = tabla.c.expira_en > ahora
+    sentencia = insert_dialecto(tabla).values(
+        pedido_id=pedido_id, huella=huella, preference_id=str(respuesta.get('id') or '') or None,
+        respuesta=respuesta, fecha_creacion=ahora, expira_en=ahora + timedelta(hours=ttl_horas)
+    )
+    # Una fila vencida se reemplaza; una vigente se conserva
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=['pedido_id', 'huella'],
+        set_={'preference_id': sentencia.excluded.preference_id, 'respuesta': sentencia.excluded.respuesta,
+              'fecha_creacion': ahora, 'expira_en': sentencia.excluded.expira_en},
+        where=~vigente
+    )
+    try:
+        db.session.execute(sentencia)
+        db.session.commit()
+    except IntegrityError:
+        # El pedido no existe: la preference sirve igual, solo no se guarda
+        db.session.rollback()
+        return respuesta
+    return preferencia_guardada(pedido_id, huella) or respuesta
+
+
+def limpiar_preferencias(lote=1000, max_lotes=50):
+    """Borra en lotes las preferences vencidas; devuelve cuántas borró"""
+    tabla = PreferenciaMercadoPago.__table__
+    ahora = datetime.utcnow()
+    borradas = 0
+    for _ in range(max_lotes):
+        ids = db.session.execute(
+            select(tabla.c.id).where(tabla.c.expira_en <= ahora).order_by(tabla.c.id).limit(lote)
+        ).scalars().all()
+        if not ids:
+            break
+        borradas += db.session.execute(delete(tabla).where(tabla.c.id.in_(ids))).rowcount
+        db.session.commit()
+        if len(ids) < lote:
+            break
+    return borradas
@@ -0,0 +1,38 @@
+"""Primera página de las vistas de categoría renderizada en el servidor.
+
+/juegos, /consolas, etc. incluyen ya el HTML de los primeros productos y el
+cursor de la página siguiente, así no esperan a un fetch de /api/productos
+después de cargar. El fragmento se guarda como derivado del snapshot del
+catálogo, es decir por (categoría, versión del catálogo): mientras el catálogo
+no cambie cada vista solo concatena un string ya renderizado.
+"""
+from flask import current_app, render_template
+from markupsafe import Markup
+
+from app.services.catalogo import ORDEN_DEFAULT, listar_productos, normalizar_limite
+from app.services.cache_catalogo import catalogo_cache
+
+
+def _renderizar(pagina, categoria, version):
+    return {
+        'html': Markup(render_template('partials/productos.html', productos=pagina['productos'])),
+        'datos': {
+            'categoria': categoria,
+            'orden': pagina['orden'],
+            'next_cursor': pagina['next_cursor'],
+            'version': version
+        }
+    }
+
+
+def primera_pagina(categoria):
+    """{'html': fragmento de productos, 'datos': cursor y metadatos para el JS}"""
+    limite = normalizar_limite(None)
+    if not current_app.config.get('CATALOGO_CACHE_ENABLED', True):
+        return _renderizar(listar_productos(categoria=categoria, limite=limite), categoria, None)
+
+    snapshot = catalogo_cache.obtener()
+    return snapshot.derivado(
+        f'vitrina:{categoria}:{limite}',
+        lambda s: _renderizar(s.listar(ORDEN_DEFAULT, limite, categoria=categoria), categoria, s.version)
+    )
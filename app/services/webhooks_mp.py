@@ -0,0 +1,293 @@
+"""Cola durable para los webhooks de Mercado Pago.
+
+El endpoint solo guarda la notificación en `webhook_trabajos` y responde 200: la
+consulta a la API de Mercado Pago y la actualización de pedido, stock y carrito
+las hace un pool de hilos fuera de la petición. Así una API lenta no deja
+ocupados los workers de gunicorn y un fallo no pierde la notificación.
+
+- Deduplicación: hay una fila por payment id. Las notificaciones repetidas
+  incrementan `recibidas` en la misma fila; si llegan mientras se procesa, el
+  trabajo se repite al terminar (el estado del pago pudo cambiar entre medias).
+- Reintentos: un fallo reprograma el trabajo con backoff exponencial
+  (MP_WEBHOOK_BACKOFF_BASE_SEGUNDOS * 2^(intentos-1), tope
+  MP_WEBHOOK_BACKOFF_MAX_SEGUNDOS); tras MP_WEBHOOK_MAX_INTENTOS queda 'fallido'.
+- Varios procesos: cada worker reclama un trabajo con un UPDATE condicional que
+  además fija un plazo (`proximo_intento`); si el proceso muere, el trabajo se
+  vuelve a reclamar al vencer el plazo.
+"""
+import random
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, delete, select, update
+
+from app import db
+from app.models.webhook import WebhookTrabajo
+from app.services.db_util import insert_dialecto
+from app.services.mercadopago_cliente import get_mp_client
+from app.services.pagos import estado_mercadopago, registrar_pago
+
+PROVEEDOR = 'mercadopago'
+ESTADOS_APROBADO = ('approved', 'approved_by_merchant')
+
+
+class ErrorTransitorio(Exception):
+    """No se pudo consultar el pago; el trabajo se reintenta"""
+
+
+def extraer_payment_id(data, args=None):
+    """payment id de la notificación, o None si no es de un pago"""
+    data = data if isinstance(data, dict) else {}
+    args = args or {}
+    tipo = data.get('type') or data.get('topic') or args.get('type') or args.get('topic')
+    if tipo and tipo != 'payment':
+        return None
+    payment_id = None
+    # Algunos webhooks vienen como {"data": {"id": ...}, "type": "payment"}
+    if isinstance(data.get('data'), dict):
+        payment_id = data['data'].get('id')
+    # Otros formatos usan 'id' directamente o lo mandan en la query string
+    payment_id = payment_id or data.get('id') or args.get('data.id') or args.get('id')
+    return str(payment_id) if payment_id else None
+
+
+def encolar_pago(payment_id, payload=None):
+    """Guarda (o funde con la existente) la notificación del pago y hace commit"""
+    tabla = WebhookTrabajo.__table__
+    ahora = datetime.utcnow()
+    sentencia = insert_dialecto(tabla).values(
+        proveedor=PROVEEDOR, referencia=str(payment_id), estado='pendiente', intentos=0, recibidas=1,
+        proximo_intento=ahora, payload=payload, fecha_creacion=ahora, fecha_actualizacion=ahora
+    )
+    en_proceso = tabla.c.estado == 'procesando'
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=['proveedor', 'referencia'],
+        set_={
+            'recibidas': tabla.c.recibidas + 1,
+            'payload': sentencia.excluded.payload,
+            'fecha_actualizacion': ahora,
+            # Si un worker lo tiene, `recibidas` distinto hace que se repita al terminar
+            'estado': case((en_proceso, tabla.c.estado), else_='pendiente'),
+            'intentos': case((en_proceso, tabla.c.intentos), else_=0),
+            'proximo_intento': case((en_proceso, tabla.c.proximo_intento), else_=ahora),
+        }
+    )
+    db.session.execute(sentencia)
+    db.session.commit()
+
+
+def reclamar_trabajo():
+    """Toma el siguiente trabajo vencido; devuelve (id, payment_id, recibidas, intentos) o None"""
+    tabla = WebhookTrabajo.__table__
+    ahora = datetime.utcnow()
+    plazo = ahora + timedelta(seconds=current_app.config['MP_WEBHOOK_BLOQUEO_SEGUNDOS'])
+    disponible = (tabla.c.estado.in_(('pendiente', 'procesando')), tabla.c.proximo_intento <= ahora)
+    siguiente = select(tabla.c.id).where(*disponible).order_by(tabla.c.proximo_intento)\
+        .limit(1).with_for_update(skip_locked=True).scalar_subquery()
+    fila = db.session.execute(
+        update(tabla).where(tabla.c.id == siguiente, *disponible).values(
+            estado='procesando', proximo_intento=plazo, intentos=tabla.c.intentos + 1, fecha_actualizacion=ahora
+        ).returning(tabla.c.id, tabla.c.referencia, tabla.c.recibidas, tabla.c.intentos)
+    ).first()
+    db.session.commit()
+    return tuple(fila) if fila else None
+
+
+def _terminar(trabajo_id, recibidas):
+    tabla = WebhookTrabajo.__table__
+    ahora = datetime.utcnow()
+    terminado = db.session.execute(
+        update(tabla).where(tabla.c.id == trabajo_id, tabla.c.estado == 'procesando',
+                            tabla.c.recibidas == recibidas)
+        .values(estado='completado', ultimo_error=None, fecha_actualizacion=ahora)
+    ).rowcount
+    if not terminado:
+        # Llegó otra notificación del mismo pago mientras se procesaba: repetir
+        db.session.execute(
+            update(tabla).where(tabla.c.id == trabajo_id, tabla.c.estado == 'procesando')
+            .values(estado='pendiente', intentos=0, proximo_intento=ahora, fecha_actualizacion=ahora)
+        )
+    db.session.commit()
+
+
+def _reprogramar(trabajo_id, intentos, error):
+    config = current_app.config
+    tabla = WebhookTrabajo.__table__
+    ahora = datetime.utcnow()
+    if intentos >= config['MP_WEBHOOK_MAX_INTENTOS']:
+        valores = {'estado': 'fallido'}
+    else:
+        espera = min(config['MP_WEBHOOK_BACKOFF_BASE_SEGUNDOS'] * 2 ** (intentos - 1),
+                     config['MP_WEBHOOK_BACKOFF_MAX_SEGUNDOS'])
+        espera *= random.uniform(0.9, 1.1)  # evita que los reintentos de un corte lleguen todos juntos
+        valores = {'estado': 'pendiente', 'proximo_intento': ahora + timedelta(seconds=espera)}
+    db.session.execute(
+        update(tabla).where(tabla.c.id == trabajo_id, tabla.c.estado == 'procesando')
+        .values(ultimo_error=str(error)[:500], fecha_actualizacion=ahora, **valores)
+    )
+    db.session.commit()
+
+
+def procesar_siguiente():
+    """Reclama y procesa un trabajo; False si no había ninguno listo"""
+    trabajo = reclamar_trabajo()
+    if trabajo is None:
+        return False
+    trabajo_id, payment_id, recibidas, intentos = trabajo
+    try:
+        procesar_pago(payment_id)
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Webhook MP {payment_id} falló (intento {intentos}): {e}")
+        _reprogramar(trabajo_id, intentos, e)
+    else:
+        _terminar(trabajo_id, recibidas)
+    return True
+
+
+def procesar_pendientes(maximo=None):
+    """Procesa en este hilo los trabajos listos (scripts y pruebas); devuelve cuántos"""
+    procesados = 0
+    while (maximo is None or procesados < maximo) and procesar_siguiente():
+        procesados += 1
+    return procesados
+
+
+def procesar_pago(payment_id):
+    """Consulta el pago y, si está aprobado, completa el pedido asociado (con commit)"""
+    from app.models.pedido import Pedido
+    from app.models.models import Carrito
+    from app.services.inventario import descontar_stock, StockInsuficiente
+
+    # Consultar la API de Mercado Pago para validar el pago
+    try:
+        payment_resp = get_mp_client().payment().get(payment_id)
+    except Exception as e:
+        raise ErrorTransitorio(f"Error consultando API de Mercado Pago: {e}") from e
+    if not isinstance(payment_resp, dict) or payment_resp.get('status') != 200 or not payment_resp.get('response'):
+        estado_http = payment_resp.get('status') if isinstance(payment_resp, dict) else None
+        raise ErrorTransitorio(f"Respuesta inesperada de Mercado Pago (status={estado_http})")
+
+    payment_data = payment_resp['response']
+    status = payment_data.get('status') or payment_data.get('collection_status')
+    print(f"MP Payment {payment_id} status: {status}")
+
+    # Pedido del pago: external_reference es su id (búsqueda por clave primaria)
+    pedido = None
+    external_ref = payment_data.get('external_reference') or (
+        payment_data.get('order', {}) or {}).get('external_reference')
+    if external_ref:
+        try:
+            # external_reference fue seteado como el id del pedido (string)
+            pedido = db.session.get(Pedido, int(external_ref))
+        except (TypeError, ValueError):
+            pedido = None
+
+    if not pedido:
+        print(f"No se encontró pedido para el pago {payment_id} (external_reference={external_ref})")
+        return
+    registrar_pago(pedido.id_pedido, 'mercadopago', estado_mercadopago(status),
+                   payment_data.get('transaction_amount') or pedido.total, referencia=payment_id,
+                   moneda=payment_data.get('currency_id'), payload=payment_data)
+
+    if not status or status.lower() not in ESTADOS_APROBADO or pedido.estado == 'completado':
+        return
+
+    # Guardar id_transaccion_mercadopago si no existe
+    if not pedido.id_transaccion_mercadopago:
+        pedido.id_transaccion_mercadopago = str(payment_id)
+
+    # Reducir stock de los productos del pedido consumiendo su reserva (UPDATE condicional, sin sobreventa)
+    try:
+        cantidades = {}
+        for item in pedido.items:
+            cantidades[item.producto_id] = cantidades.get(item.producto_id, 0) + (item.cantidad or 0)
+        # El pago ya está aprobado: se descuenta aunque el admin haya desactivado el producto
+        descontar_stock(cantidades, solo_activos=False, pedido_id=pedido.id_pedido)
+    except StockInsuficiente as e:
+        # Pagado pero sin stock: queda pendiente para que el admin lo resuelva (reembolso)
+        db.session.rollback()
+        print(f"⚠️ Pedido {pedido.id_pedido} pagado sin stock suficiente, queda pendiente: {e}")
+        return
+
+    # Limpiar carrito activo del usuario (si existe)
+    carrito = Carrito.query.filter_by(usuario_id=pedido.usuario_id, activo=True).first()
+    if carrito:
+        for ci in list(carrito.items):
+            db.session.delete(ci)
+        carrito.activo = False
+
+    pedido.estado = 'completado'
+    db.session.commit()
+    print(f"Pedido {pedido.id_pedido} marcado como completado por webhook MP y stock actualizado")
+
+
+def limpiar_trabajos(retencion_dias, lote=1000, max_lotes=50):
+    """Borra en lotes los trabajos completados o fallidos más viejos que la retención"""
+    tabla = WebhookTrabajo.__table__
+    limite = datetime.utcnow() - timedelta(days=retencion_dias)
+    borrados = 0
+    for _ in range(max_lotes):
+        ids = db.session.execute(
+            select(tabla.c.id).where(tabla.c.estado.in_(('completado', 'fallido')),
+                                     tabla.c.fecha_actualizacion < limite)
+            .order_by(tabla.c.id).limit(lote)
+        ).scalars().all()
+        if not ids:
+            break
+        borrados += db.session.execute(delete(tabla).where(tabla.c.id.in_(ids))).rowcount
+        db.session.commit()
+        if len(ids) < lote:
+            break
+    return borrados
+
+
+class PoolWebhooks:
+    """Hilos que vacían la cola; `despertar()` evita esperar al siguiente sondeo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hilos = []
+        self._aviso = threading.Event()
+        self._detener = threading.Event()
+
+    def iniciar(self, app, hilos):
+        with self._lock:
+            if self._hilos:
+                return
+            self._detener.clear()
+            for i in range(hilos):
+                hilo = threading.Thread(target=self._trabajar, args=(app,), name=f'webhooks-mp-{i}', daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def despertar(self):
+        self._aviso.set()
+
+    def detener(self, timeout=5):
+        with self._lock:
+            hilos, self._hilos = self._hilos, []
+        self._detener.set()
+        self._aviso.set()
+        for hilo in hilos:
+            hilo.join(timeout)
+
+    def _trabajar(self, app):
+        sondeo = app.config['MP_WEBHOOK_SONDEO_SEGUNDOS']
+        while not self._detener.is_set():
+            with app.app_context():
+                try:
+                    hubo_trabajo = procesar_siguiente()
+                except Exception as e:
+                    db.session.rollback()
+                    hubo_trabajo = False
+                    print(f"⚠️ Error en el pool de webhooks MP: {e}")
+                finally:
+                    db.session.remove()
+            if not hubo_trabajo:
+                self._aviso.wait(sondeo)
+                self._aviso.clear()
+
+
+pool_webhooks = PoolWebhooks()
@@ -498,7 +498,7 @@ async guardarProducto() {
     }
 
     async eliminarProducto(id) {
-        if (!confirm('¿Estás seguro de que quieres eliminar este producto? Esta acción no se puede deshacer.')) {
+        if (!confirm('¿Eliminar este producto?\n\nSi tiene movimientos de inventario o pedidos (casi todos los productos con stock) NO se eliminará: solo se desactivará y dejará de mostrarse en la tienda.')) {
             return;
         }
 
@@ -509,8 +509,12 @@ async guardarProducto() {
 
             const data = await response.json();
 
-            if (data.success) {
-                this.mostrarNotificacion('✅ Producto eliminado correctamente', 'success');
+            if (data.success && data.desactivado) {
+                this.mostrarNotificacion(`⚠️ ${data.message}`, 'warning');
+                await this.cargarProductos();
+                this.notificarActualizacionProductos();
+            } else if (data.success) {
+                this.mostrarNotificacion(`✅ ${data.message}`, 'success');
                 await this.cargarProductos();
                 this.notificarActualizacionProductos();
             } else {
@@ -3,6 +3,7 @@ class CarritoDinamico {
     constructor() {
         this.carritoData = null;
         this.pedidoPendienteId = null;
+        this.claveIdempotencia = null;
         this.paypalButtons = null;
         this.paypalSDKCargado = false;
         this.init();
@@ -175,34 +176,24 @@ class CarritoDinamico {
         });
     }
 
-    async actualizarCantidad(itemId, nuevaCantidad) {
-        try {
-            const response = await fetch(`/api/carrito/actualizar/${itemId}`, {
-                method: 'PUT',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    cantidad: nuevaCantidad
-                })
-            });
-
-            const data = await response.json();
+    actualizarCantidad(itemId, nuevaCantidad) {
+        const item = this.carritoData.items.find(i => i.id == itemId);
+        if (!item) return;
+        if (nuevaCantidad > item.stock) {
+            this.mostrarNotificacion('Stock insuficiente', 'error');
+            return;
+        }
 
-            if (data.success) {
-                await this.cargarCarrito();
-                this.actualizarVistaCarrito();
-                
-                if (window.carritoSimple) {
-                    window.carritoSimple.actualizarContadorCarrito();
-                }
-            } else {
-                this.mostrarNotificacion(data.error, 'error');
-            }
-        } catch (error) {
-            console.error('Error:', error);
-            this.mostrarNotificacion('Error de conexión', 'error');
+        // Vista optimista; los clics rápidos se juntan en un solo lote
+        if (nuevaCantidad <= 0) {
+            this.quitarItemLocal(itemId);
+        } else {
+            item.cantidad = nuevaCantidad;
+            item.total = item.precio_unitario * nuevaCantidad;
+            this.recalcularTotalesLocales();
         }
+        this.actualizarVistaCarrito();
+        this.encolarOperacion(itemId, { accion: 'fijar', item_id: parseInt(itemId), cantidad: nuevaCantidad });
     }
 
     async eliminarItem(itemId) {
@@ -210,29 +201,72 @@ class CarritoDinamico {
             return;
         }
 
+        this.quitarItemLocal(itemId);
+        this.actualizarVistaCarrito();
+        this.encolarOperacion(itemId, { accion: 'eliminar', item_id: parseInt(itemId) });
+        if (await this.enviarOperaciones()) {
+            this.mostrarNotificacion('Producto eliminado del carrito', 'success');
+        }
+    }
+
+    quitarItemLocal(itemId) {
+        this.carritoData.items = this.carritoData.items.filter(i => i.id != itemId);
+        this.recalcularTotalesLocales();
+    }
+
+    recalcularTotalesLocales() {
+        const total = this.carritoData.items.reduce((suma, i) => suma + i.precio_unitario * i.cantidad, 0);
+        this.carritoData.subtotal = total;
+        this.carritoData.total = total;
+        this.carritoData.count = this.carritoData.items.length;
+    }
+
+    encolarOperacion(itemId, operacion) {
+        // Solo cuenta la última operación por item: 5 clics en "+" viajan como un solo "fijar"
+        this.operacionesPendientes = this.operacionesPendientes || new Map();
+        this.operacionesPendientes.set(String(itemId), operacion);
+        clearTimeout(this.temporizadorLote);
+        this.temporizadorLote = setTimeout(() => this.enviarOperaciones(), 300);
+    }
+
+    async enviarOperaciones() {
+        clearTimeout(this.temporizadorLote);
+        if (!this.operacionesPendientes || this.operacionesPendientes.size === 0) return true;
+
+        const operaciones = Array.from(this.operacionesPendientes.values());
+        this.operacionesPendientes.clear();
+
         try {
-            const response = await fetch(`/api/carrito/eliminar/${itemId}`, {
-                method: 'DELETE'
+            const response = await fetch('/api/carrito/lote', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ operaciones })
             });
 
             const data = await response.json();
 
             if (data.success) {
-                await this.cargarCarrito();
-                this.actualizarVistaCarrito();
-                
-                if (window.carritoSimple) {
-                    window.carritoSimple.actualizarContadorCarrito();
+                // Si el usuario siguió editando mientras viajaba el lote, se conserva su vista
+                if (this.operacionesPendientes.size === 0) {
+                    this.carritoData = data.carrito;
+                    this.actualizarVistaCarrito();
                 }
-                
-                this.mostrarNotificacion('Producto eliminado del carrito', 'success');
-            } else {
-                this.mostrarNotificacion(data.error, 'error');
+                this.actualizarContadorCarrito(data.carrito.count);
+                return true;
             }
+
+            this.mostrarNotificacion(data.error, 'error');
         } catch (error) {
             console.error('Error:', error);
             this.mostrarNotificacion('Error de conexión', 'error');
         }
+
+        // El lote no se aplicó: volver al estado real del servidor
+        await this.cargarCarrito();
+        this.actualizarVistaCarrito();
+        return false;
     }
 
     async agregarAlCarrito(productoId) {
@@ -296,7 +330,24 @@ class CarritoDinamico {
         }
     }
 
-    procederAlPago() {
+    async procederAlPago() {
+        await this.enviarOperaciones();
+
+        // Totales al momento de pagar (pudieron cambiar en otra pestaña): una sola consulta agregada
+        try {
+            const response = await fetch('/api/carrito/resumen');
+            const data = await response.json();
+            if (data.success) {
+                // Si cambió, se recargan las líneas para que el resumen coincida con el total
+                if (data.count !== this.carritoData.count || data.total !== this.carritoData.total) {
+                    await this.cargarCarrito();
+                    this.actualizarVistaCarrito();
+                }
+            }
+        } catch (error) {
+            console.error('Error obteniendo resumen del carrito:', error);
+        }
+
         if (this.carritoData.count === 0) {
             this.mostrarNotificacion('Tu carrito está vacío', 'error');
             return;
@@ -305,11 +356,21 @@ class CarritoDinamico {
     }
 
     mostrarSeccionPago() {
+        // Una clave por intento de pago: si el botón se pulsa dos veces (o la red
+        // reintenta), el servidor devuelve el mismo pedido en vez de crear otro
+        this.claveIdempotencia = this.generarClaveIdempotencia();
         const container = document.getElementById('carrito-container');
         container.innerHTML = this.crearSeccionPagoHTML();
         this.initEventListenersPago();
     }
 
+    generarClaveIdempotencia() {
+        if (window.crypto && typeof window.crypto.randomUUID === 'function') {
+            return window.crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+    }
+
     crearSeccionPagoHTML() {
         return `
             <div class="pago-contenedor">
@@ -400,7 +461,10 @@ class CarritoDinamico {
         // 1) Crear pedido pendiente en el servidor (igual que PayPal flow)
         const crearResp = await fetch('/api/pedidos/crear-mercadopago', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' }
+            headers: {
+                'Content-Type': 'application/json',
+                'Idempotency-Key': this.claveIdempotencia || this.generarClaveIdempotencia()
+            }
         });
 
         if (!crearResp.ok) {
@@ -626,16 +690,28 @@ class CarritoDinamico {
                     
                     try {
                         // ✅ ENFOQUE CORREGIDO: No usar actions.order.capture() directamente
-                        // En su lugar, obtener los detalles de la orden y procesar en el backend
-                        console.log('📋 Obteniendo detalles de la orden...');
-                        
-                        // Simular procesamiento exitoso (para testing)
-                        console.log('🎉 Pago procesado exitosamente (Sandbox)');
+                        // En su lugar, registrar el pedido en el backend con la orden aprobada.
+                        // La misma clave que el resto del intento: un doble onApprove o un
+                        // reintento de red devuelve el pedido ya creado
+                        const resp = await fetch('/api/pedidos/procesar', {
+                            method: 'POST',
+                            headers: {
+                                'Content-Type': 'application/json',
+                                'Idempotency-Key': this.claveIdempotencia || this.generarClaveIdempotencia()
+                            },
+                            body: JSON.stringify({
+                                metodo_pago: 'paypal',
+                                detalles_paypal: { id: data.orderID }
+                            })
+                        });
+                        const resultado = await resp.json();
+                        if (!resp.ok || !resultado.success) {
+                            throw new Error(resultado.error || 'No se pudo registrar el pedido');
+                        }
+                        console.log('🎉 Pedido registrado:', resultado.pedido_id);
                         
-                        // Redirigir directamente a página de éxito
-                        setTimeout(() => {
-                            window.location.href = `/pago-exitoso?pedido_id=${this.pedidoPendienteId}&paypal_order_id=${data.orderID}`;
-                        }, 2000);
+                        // Redirigir a página de éxito
+                        window.location.href = `/pago-exitoso?pedido_id=${resultado.pedido_id}&paypal_order_id=${data.orderID}`;
                         
                     } catch (error) {
                         console.error('❌ Error en onApprove:', error);
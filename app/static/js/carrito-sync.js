@@ -16,8 +16,53 @@ class CarritoSync {
             setTimeout(() => this.forceBadgePosition(), 500);
         }
         
-        // Actualizar cada 30 segundos por si hay cambios en otras pestañas
-        setInterval(() => this.actualizarContadorGlobal(), 30000);
+        // Los cambios de otras pestañas llegan por el canal de eventos (SSE);
+        // solo si no está disponible se vuelve a consultar cada 30 segundos
+        this.conectarEventos();
+    }
+
+    conectarEventos() {
+        if (!window.EventSource) {
+            this.iniciarPolling();
+            return;
+        }
+
+        const eventos = new EventSource('/api/eventos');
+
+        // Al conectar (y en cada reconexión) se relee el contador por si hubo cambios sin conexión
+        eventos.addEventListener('open', () => this.actualizarContadorGlobal());
+
+        eventos.addEventListener('carrito', (event) => {
+            const data = JSON.parse(event.data);
+            this.actualizarBadges(data.count);
+        });
+
+        eventos.addEventListener('favoritos', (event) => {
+            document.dispatchEvent(new CustomEvent('favoritosActualizado', {
+                detail: JSON.parse(event.data)
+            }));
+        });
+
+        eventos.addEventListener('pedido', (event) => {
+            document.dispatchEvent(new CustomEvent('pedidoActualizado', {
+                detail: JSON.parse(event.data)
+            }));
+        });
+
+        // Usuario sin sesión: no hay nada que escuchar
+        eventos.addEventListener('fin', () => eventos.close());
+
+        eventos.addEventListener('error', () => {
+            // CLOSED: el servidor rechazó la conexión (p. ej. 503), el navegador no reintenta
+            if (eventos.readyState === EventSource.CLOSED) {
+                this.iniciarPolling();
+            }
+        });
+    }
+
+    iniciarPolling() {
+        if (this.polling) return;
+        this.polling = setInterval(() => this.actualizarContadorGlobal(), 30000);
     }
 
     async actualizarContadorGlobal() {
@@ -31,6 +31,19 @@ class FavoritosManager {
     }
 
     setupEventListeners() {
+        // Cambios hechos en otras pestañas, recibidos por el canal de eventos (carrito-sync.js)
+        document.addEventListener('favoritosActualizado', (e) => {
+            const { agregados = [], eliminados = [] } = e.detail || {};
+            agregados.forEach(id => {
+                this.favoritos.add(id);
+                this.updateFavoritoButtons(id, true);
+            });
+            eliminados.forEach(id => {
+                this.favoritos.delete(id);
+                this.updateFavoritoButtons(id, false);
+            });
+        });
+
         // Evento para botones de favorito en TODA la página
         document.addEventListener('click', (e) => {
             const favoritoBtn = e.target.closest('.favorito-btn');
@@ -337,12 +350,14 @@ async agregarAlCarritoDesdeFavoritos(productId, button) {
 
     marcarFavoritosExistentes() {
         if (!this.isAuthenticated) return;
-        
-        fetch('/api/favoritos')
+
+        // Solo los ids, en una petición para toda la página
+        fetch('/api/favoritos/ids')
             .then(response => response.json())
             .then(data => {
                 if (data.success) {
-                    this.marcarFavoritosEnPagina(data.favoritos);
+                    this.favoritos = new Set(data.ids);
+                    this.marcarFavoritosEnPagina(data.ids.map(id => ({ producto: { id } })));
                 }
             })
             .catch(error => {
@@ -2,20 +2,47 @@ const ProductosController = {
     // Inicializar el controlador
     init: function () {
         console.log('🎮 Inicializando ProductosController...');
-        this.cargarProductos();
+        const iniciales = document.getElementById('productos-iniciales');
+        if (iniciales) {
+            this.usarProductosIniciales(JSON.parse(iniciales.textContent));
+        } else {
+            this.cargarProductos();
+        }
         this.agregarEventListenersGlobales(); // Esta función debe existir
     },
 
-    // Cargar productos desde la API
-    cargarProductos: function () {
+    // La primera página ya viene renderizada por el servidor: solo conectar botones y cursor
+    usarProductosIniciales: function (datos) {
+        console.log('⚡ Primera página renderizada en el servidor');
+        this.agregarEventListeners();
+        this.actualizarBotonCargarMas(datos.next_cursor);
+
+        setTimeout(() => {
+            if (window.favoritosManager) {
+                window.favoritosManager.marcarFavoritosExistentes();
+            }
+        }, 500);
+    },
+
+    // Cursor de la siguiente página (null si ya no hay más productos)
+    nextCursor: null,
+
+    // Cargar productos desde la API. Con cursor se agrega la siguiente página a la lista actual
+    cargarProductos: function (cursor) {
         console.log('📥 Iniciando carga de productos...');
 
-        // Mostrar loading
-        this.mostrarLoading();
+        // Mostrar loading solo en la primera página
+        if (!cursor) {
+            this.mostrarLoading();
+        }
 
         // Determinar la categoría actual desde la URL
         const categoria = this.obtenerCategoriaActual();
-        const url = categoria ? `/api/productos?categoria=${encodeURIComponent(categoria)}` : '/api/productos';
+        const params = new URLSearchParams();
+        if (categoria) params.set('categoria', categoria);
+        if (cursor) params.set('cursor', cursor);
+        const query = params.toString();
+        const url = query ? `/api/productos?${query}` : '/api/productos';
 
         console.log(`📡 Solicitando productos desde: ${url}`);
 
@@ -59,12 +86,14 @@ const ProductosController = {
 
                 console.log(`🎯 ${productos.length} productos listos para mostrar`);
 
-                if (productos.length === 0) {
+                if (productos.length === 0 && !cursor) {
                     this.mostrarMensaje('No hay productos disponibles en esta categoría');
+                    this.actualizarBotonCargarMas(null);
                     return;
                 }
 
-                this.mostrarProductos(productos);
+                this.mostrarProductos(productos, Boolean(cursor));
+                this.actualizarBotonCargarMas(data.next_cursor);
             })
             .catch(error => {
                 console.error('❌ Error en cargarProductos:', error);
@@ -87,7 +116,33 @@ const ProductosController = {
         return null;
     },
 
-    mostrarProductos: function (productos) {
+    // Mostrar u ocultar el botón "Cargar más" según exista página siguiente
+    actualizarBotonCargarMas: function (nextCursor) {
+        this.nextCursor = nextCursor || null;
+        const container = document.getElementById('productos-container');
+        if (!container) return;
+
+        let boton = document.getElementById('btn-cargar-mas');
+        if (!this.nextCursor) {
+            if (boton) boton.remove();
+            return;
+        }
+
+        if (!boton) {
+            boton = document.createElement('button');
+            boton.id = 'btn-cargar-mas';
+            boton.className = 'btn-reintentar';
+            boton.innerHTML = '<i class="fa-solid fa-chevron-down"></i> Cargar más';
+            boton.addEventListener('click', () => {
+                boton.disabled = true;
+                this.cargarProductos(this.nextCursor);
+            });
+            container.insertAdjacentElement('afterend', boton);
+        }
+        boton.disabled = false;
+    },
+
+    mostrarProductos: function (productos, agregar = false) {
         try {
             console.log('🎨 Mostrando productos...');
             const container = document.getElementById('productos-container');
@@ -97,7 +152,7 @@ const ProductosController = {
                 return;
             }
 
-            if (productos.length === 0) {
+            if (productos.length === 0 && !agregar) {
                 container.innerHTML = `
                     <div class="no-products">
                         <i class="fa-solid fa-box-open"></i>
@@ -109,15 +164,14 @@ const ProductosController = {
             }
 
             // Generar HTML para cada producto
-            container.innerHTML = productos.map(producto => `
+            const html = productos.map(producto => `
                 <div class="producto" data-id="${producto.id}">
                     <button class="favorito-btn" 
                             data-product-id="${producto.id}">
                         <i class="fa-regular fa-heart"></i>
                     </button>
                     
-                    <img src="${producto.imagen}" alt="${producto.nombre}" 
-                         onerror="this.src='/static/img/placeholder.jpg'">
+                    ${this.htmlImagen(producto)}
                     <h3>${producto.nombre}</h3>
                     <p class="categoria">${producto.categoria}</p>
                     <p class="descripcion">${producto.descripcion}</p>
@@ -135,6 +189,12 @@ const ProductosController = {
                 </div>
             `).join('');
 
+            if (agregar) {
+                container.insertAdjacentHTML('beforeend', html);
+            } else {
+                container.innerHTML = html;
+            }
+
             console.log('✅ Productos renderizados correctamente');
             this.agregarEventListeners();
 
@@ -151,12 +211,30 @@ const ProductosController = {
         }
     },
 
+    // Imagen del producto: <picture> con srcset WebP si ya existen los derivados
+    htmlImagen: function (producto) {
+        const error = `onerror="this.src='/static/img/placeholder.jpg'"`;
+        if (!producto.srcset || !producto.imagenes || !producto.imagenes.card) {
+            return `<img src="${producto.imagen}" alt="${producto.nombre}" ${error}>`;
+        }
+        const sizes = '(max-width: 600px) 50vw, 400px';
+        return `
+                    <picture>
+                        <source type="image/webp" srcset="${producto.srcset.webp}" sizes="${sizes}">
+                        <img src="${producto.imagenes.card.respaldo}" srcset="${producto.srcset.respaldo}"
+                             sizes="${sizes}" alt="${producto.nombre}" loading="lazy"
+                             onerror="this.onerror=null; this.previousElementSibling.remove(); this.removeAttribute('srcset'); this.src='/static/img/placeholder.jpg'">
+                    </picture>`;
+    },
+
     // Agregar event listeners a los botones
     agregarEventListeners: function () {
-        const botones = document.querySelectorAll('.btn-agregar-carrito');
+        // Solo botones nuevos, para no duplicar listeners al cargar más páginas
+        const botones = document.querySelectorAll('.btn-agregar-carrito:not([data-listener])');
         console.log(`🔘 Agregando listeners a ${botones.length} botones`);
 
         botones.forEach(boton => {
+            boton.setAttribute('data-listener', 'true');
             boton.addEventListener('click', (e) => {
                 e.preventDefault();
                 const productoId = boton.getAttribute('data-id');
@@ -184,6 +262,8 @@ const ProductosController = {
                     this.buscarProductos(buscarInput.value);
                 }
             });
+
+            this.configurarAutocompletado(buscarInput);
         }
         
         // Filtros de categoría si existen
@@ -199,6 +279,39 @@ const ProductosController = {
         }
     },
 
+    // Sugerencias mientras se escribe (datalist nativo, con espera de 150ms entre teclas)
+    configurarAutocompletado: function (input) {
+        const lista = document.createElement('datalist');
+        lista.id = 'sugerencias-productos';
+        input.setAttribute('list', lista.id);
+        input.setAttribute('autocomplete', 'off');
+        input.insertAdjacentElement('afterend', lista);
+
+        let temporizador = null;
+        input.addEventListener('input', () => {
+            clearTimeout(temporizador);
+            const termino = input.value.trim();
+            if (!termino) {
+                lista.innerHTML = '';
+                return;
+            }
+            temporizador = setTimeout(() => {
+                fetch(`/api/productos/autocomplete?q=${encodeURIComponent(termino)}`)
+                    .then(response => response.ok ? response.json() : null)
+                    .then(data => {
+                        if (!data || !data.success) return;
+                        lista.innerHTML = '';
+                        data.sugerencias.forEach(sugerencia => {
+                            const opcion = document.createElement('option');
+                            opcion.value = sugerencia.nombre;
+                            lista.appendChild(opcion);
+                        });
+                    })
+                    .catch(error => console.error('❌ Error en autocompletado:', error));
+            }, 150);
+        });
+    },
+
     // Función de búsqueda
     buscarProductos: function(termino) {
         if (!termino || termino.trim() === '') {
@@ -208,10 +321,32 @@ const ProductosController = {
         
         console.log(`🔍 Buscando: ${termino}`);
         this.mostrarLoading();
-        
-        // Aquí puedes implementar la búsqueda si tu API la soporta
-        // Por ahora recargamos todos y filtramos en el cliente
-        this.cargarProductos();
+
+        // Búsqueda en el servidor por relevancia (ignora acentos y mayúsculas)
+        const params = new URLSearchParams({ q: termino.trim(), limite: 50 });
+        fetch(`/api/productos/buscar?${params.toString()}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Error HTTP: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(data => {
+                this.actualizarBotonCargarMas(null);
+                if (!data.success || !Array.isArray(data.productos)) {
+                    this.mostrarError(data.error || 'Error al buscar productos');
+                    return;
+                }
+                if (data.productos.length === 0) {
+                    this.mostrarMensaje(`No se encontraron productos para "${termino}"`);
+                    return;
+                }
+                this.mostrarProductos(data.productos);
+            })
+            .catch(error => {
+                console.error('❌ Error buscando productos:', error);
+                this.mostrarError('Error al buscar productos');
+            });
     },
 
     // Filtrar productos por categoría
@@ -229,6 +364,7 @@ const ProductosController = {
             .then(data => {
                 if (data.success && Array.isArray(data.productos)) {
                     this.mostrarProductos(data.productos);
+                    this.actualizarBotonCargarMas(null);
                 } else {
                     this.mostrarError('Error al filtrar productos');
                 }
@@ -243,99 +379,66 @@ const ProductosController = {
     agregarAlCarrito: function (productoId, button) {
         console.log(`🛒 Intentando agregar producto ${productoId} al carrito`);
         
-        // Verificar autenticación de manera más robusta
-        this.verificarAutenticacion()
-            .then(autenticado => {
-                if (!autenticado) {
-                    this.mostrarNotificacion('Inicia sesión para poder agregar productos al carrito', 'error');
-                    return;
-                }
+        // Sin sesión también se puede: el servidor guarda el carrito de invitado en una cookie firmada
+        if (button && button.disabled) {
+            console.log('⏳ Botón ya en proceso, ignorando click');
+            return;
+        }
 
-                if (button && button.disabled) {
-                    console.log('⏳ Botón ya en proceso, ignorando click');
-                    return;
-                }
+        console.log(`✅ Procediendo con producto ${productoId}`);
 
-                console.log(`✅ Usuario autenticado, procediendo con producto ${productoId}`);
+        let originalText = '';
+        if (button) {
+            originalText = button.innerHTML;
+            button.disabled = true;
+            button.innerHTML = '<i class="fa-solid fa-spinner fa-spin"></i> AGREGANDO...';
+        }
 
-                let originalText = '';
-                if (button) {
-                    originalText = button.innerHTML;
+        fetch('/api/carrito/agregar', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                producto_id: parseInt(productoId),
+                cantidad: 1
+            })
+        })
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            console.log('📨 Respuesta del servidor:', data);
+            
+            if (button) {
+                button.disabled = false;
+                const tieneStock = data.success && !data.error?.includes('Stock insuficiente');
+                if (tieneStock) {
+                    button.innerHTML = '<i class="fa-solid fa-cart-shopping"></i> AGREGAR AL CARRITO';
+                } else {
+                    button.innerHTML = 'SIN STOCK';
                     button.disabled = true;
-                    button.innerHTML = '<i class="fa-solid fa-spinner fa-spin"></i> AGREGANDO...';
                 }
-
-                fetch('/api/carrito/agregar', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        producto_id: parseInt(productoId),
-                        cantidad: 1
-                    })
-                })
-                .then(response => {
-                    if (!response.ok) {
-                        throw new Error(`HTTP error! status: ${response.status}`);
-                    }
-                    return response.json();
-                })
-                .then(data => {
-                    console.log('📨 Respuesta del servidor:', data);
-                    
-                    if (button) {
-                        button.disabled = false;
-                        const tieneStock = data.success && !data.error?.includes('Stock insuficiente');
-                        if (tieneStock) {
-                            button.innerHTML = '<i class="fa-solid fa-cart-shopping"></i> AGREGAR AL CARRITO';
-                        } else {
-                            button.innerHTML = 'SIN STOCK';
-                            button.disabled = true;
-                        }
-                    }
-                    
-                    if (data.success) {
-                        this.mostrarNotificacion(data.message || 'Producto agregado al carrito');
-                        this.actualizarContadorCarrito(data.carrito_count);
-                    } else {
-                        this.mostrarNotificacion(data.error || 'Error al agregar al carrito', 'error');
-                    }
-                })
-                .catch(error => {
-                    console.error('❌ Error agregando al carrito:', error);
-                    this.mostrarNotificacion('Error de conexión al servidor', 'error');
-                    
-                    if (button) {
-                        button.disabled = false;
-                        button.innerHTML = '<i class="fa-solid fa-cart-shopping"></i> AGREGAR AL CARRITO';
-                    }
-                });
-            })
-            .catch(error => {
-                console.error('❌ Error verificando autenticación:', error);
-                this.mostrarNotificacion('Error al verificar autenticación', 'error');
-            });
-    },
-
-    // Verificar autenticación de manera más robusta
-    verificarAutenticacion: function() {
-        return new Promise((resolve) => {
-            // Primero verificar si hay sesión en localStorage/sessionStorage
-            if (localStorage.getItem('user_id') || sessionStorage.getItem('user_id')) {
-                resolve(true);
-                return;
             }
             
-            // Si no, hacer una llamada a la API para verificar
-            fetch('/api/user-info')
-                .then(response => response.json())
-                .then(data => {
-                    resolve(data.logged_in || false);
-                })
-                .catch(() => {
-                    resolve(false);
-                });
+            if (data.success) {
+                this.mostrarNotificacion(data.message || 'Producto agregado al carrito');
+                this.actualizarContadorCarrito(data.carrito_count);
+            } else {
+                this.mostrarNotificacion(data.error || 'Error al agregar al carrito', 'error');
+            }
+        })
+        .catch(error => {
+            console.error('❌ Error agregando al carrito:', error);
+            this.mostrarNotificacion('Error de conexión al servidor', 'error');
+            
+            if (button) {
+                button.disabled = false;
+                button.innerHTML = '<i class="fa-solid fa-cart-shopping"></i> AGREGAR AL CARRITO';
+            }
         });
     },
 
@@ -0,0 +1,101 @@
+"""Fixtures compartidos: una app sobre una base SQLite temporal por sesión de pytest.
+
+Las variables de entorno se fijan antes de importar `app` porque la configuración
+se lee al importar. Cada prueba crea sus propios usuarios y productos con nombres
+únicos, así que comparten la base sin interferir.
+"""
+import itertools
+import os
+import tempfile
+
+import pytest
+
+_ARCHIVO_BD = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+os.environ['DATABASE_URL'] = f'sqlite:///{_ARCHIVO_BD}'
+os.environ['MP_WEBHOOK_WORKERS'] = '0'
+os.environ['CARRITO_LIMPIEZA_ENABLED'] = '0'
+os.environ['RESERVA_LIMPIEZA_ENABLED'] = '0'
+os.environ['INVENTARIO_SNAPSHOT_ENABLED'] = '0'
+
+_secuencia = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app, db
+    from app.models.role import Role
+
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        for id_rol, nombre in ((1, 'admin'), (2, 'cliente')):
+            if db.session.get(Role, id_rol) is None:
+                db.session.add(Role(id_rol=id_rol, nombre=nombre))
+        db.session.commit()
+    yield app
+    from app.services.pagos import buffer_pagos
+    buffer_pagos.detener()
+    os.remove(_ARCHIVO_BD)
+
+
+@pytest.fixture
+def ctx(app):
+    from app import db
+    with app.app_context():
+        yield
+        db.session.remove()
+
+
+@pytest.fixture
+def crear_producto(app):
+    """crear_producto(stock, precio=10) -> id_producto"""
+    from app import db
+    from app.models.models import Categoria, Producto
+
+    def crear(stock, precio=10):
+        with app.app_context():
+            producto = Producto(nombre=f'Producto prueba {next(_secuencia)}', precio=precio, stock=stock,
+                                categoria_id=Categoria.query.first().id_categoria)
+            db.session.add(producto)
+            db.session.commit()
+            return producto.id_producto
+    return crear
+
+
+@pytest.fixture
+def crear_usuario(app):
+    """crear_usuario(carrito={producto_id: cantidad}, rol=2) -> id_usuario con carrito activo"""
+    from app import db
+    from app.models.models import Carrito, CarritoItem, Producto
+    from app.models.usuario import Usuario
+
+    def crear(carrito=None, rol=2):
+        n = next(_secuencia)
+        with app.app_context():
+            usuario = Usuario(nombre=f'Usuario {n}', correo=f'usuario{n}@ejemplo.com',
+                              nombre_usuario=f'usuario{n}', password='x', rol_id=rol)
+            db.session.add(usuario)
+            db.session.flush()
+            if carrito:
+                registro = Carrito(usuario_id=usuario.id_usuario, activo=True)
+                db.session.add(registro)
+                db.session.flush()
+                for producto_id, cantidad in carrito.items():
+                    db.session.add(CarritoItem(carrito_id=registro.id_carrito, producto_id=producto_id,
+                                               cantidad=cantidad,
+                                               precio_unitario=db.session.get(Producto, producto_id).precio))
+            db.session.commit()
+            return usuario.id_usuario
+    return crear
+
+
+@pytest.fixture
+def cliente(app):
+    """cliente(usuario_id, rol=2) -> test client con la sesión iniciada"""
+    def crear(usuario_id, rol=2):
+        c = app.test_client()
+        with c.session_transaction() as sesion:
+            sesion['user_id'] = usuario_id
+            sesion['user_role'] = rol
+        return c
+    return crear
@@ -0,0 +1,91 @@
+import pytest
+
+from app import db
+from app.models.models import Categoria, Producto
+from app.services.busqueda import buscar_ids
+from app.services.catalogo import listar_productos
+from app.services.facetas import calcular_facetas
+
+
+def _ids_en_stock(limite=100):
+    ids, cursor = [], None
+    while True:
+        pagina = listar_productos(limite=limite, cursor=cursor, solo_con_stock=True)
+        ids += [p['id'] for p in pagina['productos']]
+        cursor = pagina['next_cursor']
+        if not cursor:
+            return ids
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_producto_reservado_no_cuenta_como_disponible(app, crear_producto, crear_usuario, cliente, cache):
+    app.config['CATALOGO_CACHE_ENABLED'] = cache
+    try:
+        producto_id = crear_producto(stock=1)
+        with app.app_context():
+            antes = calcular_facetas()['disponibilidad']
+            assert producto_id in _ids_en_stock()
+
+        # Otro comprador aparta la única unidad con un checkout de Mercado Pago
+        usuario_id = crear_usuario(carrito={producto_id: 1})
+        assert cliente(usuario_id).post('/api/pedidos/crear-mercadopago').status_code == 200
+
+        with app.app_context():
+            despues = calcular_facetas()['disponibilidad']
+            assert producto_id not in _ids_en_stock()
+            assert despues['en_stock'] == antes['en_stock'] - 1
+            assert despues['sin_stock'] == antes['sin_stock'] + 1
+    finally:
+        app.config['CATALOGO_CACHE_ENABLED'] = True
+
+
+def test_busqueda_con_stock_descuenta_reservas(app, crear_producto, crear_usuario, cliente):
+    producto_id = crear_producto(stock=1)
+    with app.app_context():
+        nombre = db.session.get(Producto, producto_id).nombre
+        assert producto_id in buscar_ids(nombre, solo_con_stock=True)[0]
+
+    usuario_id = crear_usuario(carrito={producto_id: 1})
+    assert cliente(usuario_id).post('/api/pedidos/crear-mercadopago').status_code == 200
+
+    with app.app_context():
+        assert producto_id not in buscar_ids(nombre, solo_con_stock=True)[0]
+        assert producto_id in buscar_ids(nombre)[0]
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_categorias_admin_con_y_sin_cache(app, crear_usuario, cliente, cache):
+    app.config['CATALOGO_CACHE_ENABLED'] = cache
+    try:
+        nombre = f'Categoría prueba {cache}'
+        with app.app_context():
+            db.session.add(Categoria(nombre=nombre))
+            db.session.commit()
+
+        respuesta = cliente(crear_usuario(rol=1), rol=1).get('/api/categorias')
+        assert respuesta.status_code == 200
+        assert nombre in [c['nombre'] for c in respuesta.json['categorias']]
+    finally:
+        app.config['CATALOGO_CACHE_ENABLED'] = True
+
+
+@pytest.mark.parametrize('cache', [True, False])
+def test_paginacion_recientes_con_fechas_nulas(app, crear_producto, cache):
+    app.config['CATALOGO_CACHE_ENABLED'] = cache
+    try:
+        sin_fecha = [crear_producto(stock=1) for _ in range(3)]
+        with app.app_context():
+            for producto_id in sin_fecha:
+                db.session.get(Producto, producto_id).fecha_creacion = None
+            db.session.commit()
+
+            # Páginas de 1 para que el cursor caiga sobre productos sin fecha
+            ids = _ids_en_stock(limite=1)
+            assert len(ids) == len(set(ids))
+            assert ids[-len(sin_fecha):] == sorted(sin_fecha, reverse=True)
+
+            for producto_id in sin_fecha:
+                db.session.get(Producto, producto_id).activo = False
+            db.session.commit()
+    finally:
+        app.config['CATALOGO_CACHE_ENABLED'] = True
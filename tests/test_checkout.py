@@ -0,0 +1,39 @@
+from app import db
+from app.models.models import Producto
+from app.models.pedido import Pedido
+from app.models.reserva import ReservaStock
+
+
+def test_paypal_tras_mercadopago_abandonado_no_choca_con_su_propia_reserva(app, crear_producto, crear_usuario,
+                                                                            cliente):
+    producto_id = crear_producto(stock=1)
+    usuario_id = crear_usuario(carrito={producto_id: 1})
+    c = cliente(usuario_id)
+
+    # Abre el checkout de Mercado Pago (reserva la última unidad) y lo abandona
+    respuesta = c.post('/api/pedidos/crear-mercadopago')
+    assert respuesta.status_code == 200
+    pendiente_id = respuesta.json['pedido_id']
+
+    respuesta = c.post('/api/pedidos/procesar',
+                       json={'metodo_pago': 'paypal', 'detalles_paypal': {'id': 'PAYPAL-1'}})
+    assert respuesta.status_code == 200, respuesta.json
+
+    with app.app_context():
+        assert db.session.get(Producto, producto_id).stock == 0
+        assert db.session.get(Pedido, pendiente_id).estado == 'cancelado'
+        assert ReservaStock.query.filter_by(pedido_id=pendiente_id).count() == 0
+
+
+def test_reserva_de_otro_usuario_sigue_bloqueando_paypal(app, crear_producto, crear_usuario, cliente):
+    producto_id = crear_producto(stock=1)
+    con_reserva = crear_usuario(carrito={producto_id: 1})
+    comprador = crear_usuario(carrito={producto_id: 1})
+
+    assert cliente(con_reserva).post('/api/pedidos/crear-mercadopago').status_code == 200
+    respuesta = cliente(comprador).post('/api/pedidos/procesar',
+                                        json={'metodo_pago': 'paypal', 'detalles_paypal': {'id': 'PAYPAL-2'}})
+    assert respuesta.status_code == 400
+
+    with app.app_context():
+        assert db.session.get(Producto, producto_id).stock == 1
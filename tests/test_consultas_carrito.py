@@ -0,0 +1,55 @@
+"""Leer el carrito cuesta un número fijo de consultas, sin importar cuántos items tenga (sin N+1)."""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+from app.services.carrito import cargar_carrito, resumen_carrito, totales_carrito
+
+TAMANOS = (1, 5, 50)
+
+
+@contextmanager
+def contar_consultas():
+    contador = [0]
+
+    def contar(*_):
+        contador[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', contar)
+    try:
+        yield contador
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', contar)
+
+
+@pytest.fixture
+def usuarios_por_tamano(crear_producto, crear_usuario):
+    """{n: usuario_id con n items en el carrito} para cada tamaño de TAMANOS"""
+    productos = [crear_producto(stock=100, precio=100 + i) for i in range(max(TAMANOS))]
+    return {n: crear_usuario(carrito={producto_id: 1 for producto_id in productos[:n]}) for n in TAMANOS}
+
+
+def test_carga_y_totales_del_carrito(app, usuarios_por_tamano):
+    for n, usuario_id in usuarios_por_tamano.items():
+        with app.app_context():
+            with contar_consultas() as consultas:
+                resumen = resumen_carrito(cargar_carrito(usuario_id))
+            assert len(resumen['items']) == n
+            assert consultas[0] == 2, f'{n} items'  # carrito + items con sus productos
+
+            with contar_consultas() as consultas:
+                assert totales_carrito(usuario_id)['count'] == n
+            assert consultas[0] == 1, f'{n} items'
+
+
+def test_endpoint_detalles_del_carrito(app, cliente, usuarios_por_tamano):
+    for n, usuario_id in usuarios_por_tamano.items():
+        c = cliente(usuario_id)
+        with app.app_context():
+            with contar_consultas() as consultas:
+                respuesta = c.get('/api/carrito/detalles')
+        assert respuesta.status_code == 200
+        assert len(respuesta.json['carrito']['items']) == n
+        assert consultas[0] == 2, f'{n} items'
@@ -0,0 +1,28 @@
+from app.services.idempotencia import bloqueo_segundos
+
+
+def test_bloqueo_nunca_menor_que_la_peor_llamada_a_mercadopago(app, ctx):
+    config = app.config
+    original = config['IDEMPOTENCIA_BLOQUEO_SEGUNDOS']
+    config['IDEMPOTENCIA_BLOQUEO_SEGUNDOS'] = 1
+    try:
+        peor_llamada = ((config['MERCADOPAGO_TIMEOUT_CONEXION'] + config['MERCADOPAGO_TIMEOUT_LECTURA'])
+                        * (config['MERCADOPAGO_REINTENTOS'] + 1))
+        assert bloqueo_segundos() > peor_llamada
+    finally:
+        config['IDEMPOTENCIA_BLOQUEO_SEGUNDOS'] = original
+
+
+def test_paypal_repetido_con_la_misma_clave_devuelve_el_mismo_pedido(app, crear_producto, crear_usuario,
+                                                                      cliente):
+    producto_id = crear_producto(stock=2)
+    c = cliente(crear_usuario(carrito={producto_id: 1}))
+    peticion = dict(json={'metodo_pago': 'paypal', 'detalles_paypal': {'id': 'PAYPAL-3'}},
+                    headers={'Idempotency-Key': 'intento-paypal-1'})
+
+    primera = c.post('/api/pedidos/procesar', **peticion)
+    segunda = c.post('/api/pedidos/procesar', **peticion)
+    assert primera.status_code == 200, primera.json
+    assert segunda.status_code == 200
+    assert segunda.headers.get('Idempotent-Replayed') == 'true'
+    assert segunda.json['pedido_id'] == primera.json['pedido_id']
@@ -0,0 +1,37 @@
+import pytest
+from sqlalchemy import delete, insert
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models.analytics import InventarioMovimiento
+from app.services.movimientos import sembrar_saldos_iniciales
+
+movimientos = InventarioMovimiento.__table__
+
+
+def _saldos_iniciales(producto_id):
+    return InventarioMovimiento.query.filter_by(producto_id=producto_id, motivo='saldo inicial').count()
+
+
+def test_saldo_inicial_se_siembra_una_sola_vez(app, ctx, crear_producto):
+    producto_id = crear_producto(stock=4)
+    # Simula un producto anterior al registro de movimientos
+    db.session.execute(delete(movimientos).where(movimientos.c.producto_id == producto_id))
+    db.session.commit()
+
+    sembrar_saldos_iniciales()
+    sembrar_saldos_iniciales()
+    assert _saldos_iniciales(producto_id) == 1
+
+
+def test_indice_unico_rechaza_un_segundo_saldo_inicial(app, ctx, crear_producto):
+    producto_id = crear_producto(stock=2)
+    fila = {'producto_id': producto_id, 'tipo': 'ajuste', 'cantidad': 2, 'motivo': 'saldo inicial'}
+    db.session.execute(insert(movimientos), fila)
+    db.session.commit()
+
+    # Lo que haría un segundo worker que pasó el NOT EXISTS antes del commit del primero
+    with pytest.raises(IntegrityError):
+        db.session.execute(insert(movimientos), fila)
+    db.session.rollback()
+    assert _saldos_iniciales(producto_id) == 1
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models.analytics import Pago
+from app.models.pedido import Pedido
+from app.services import pagos
+from app.services.pagos import BufferPagos
+
+
+@pytest.fixture
+def pedido_id(ctx, crear_usuario):
+    pedido = Pedido(usuario_id=crear_usuario(), total=10)
+    db.session.add(pedido)
+    db.session.commit()
+    return pedido.id_pedido
+
+
+def _fila(pedido_id, referencia):
+    return {'pedido_id': pedido_id, 'proveedor': 'paypal', 'estado': 'aprobado', 'monto': 10,
+            'moneda': 'USD', 'referencia': referencia, 'payload': None, 'creado_en': datetime.utcnow()}
+
+
+def test_vaciar_inserta_en_lotes(pedido_id):
+    buffer = BufferPagos()
+    buffer.lote = 3
+    for i in range(7):
+        buffer.agregar(_fila(pedido_id, f'lote-{i}'))
+
+    inserts = []
+
+    def contar(conn, cursor, sentencia, parametros, contexto, executemany):
+        if sentencia.startswith('INSERT INTO pagos'):
+            inserts.append(sentencia)
+
+    event.listen(db.engine, 'before_cursor_execute', contar)
+    try:
+        assert buffer.vaciar() == 7
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', contar)
+    assert len(inserts) == 3
+    assert buffer.pendientes() == 0
+    assert Pago.query.filter_by(pedido_id=pedido_id).count() == 7
+
+
+def test_bd_caida_devuelve_las_filas_al_buffer(pedido_id, monkeypatch):
+    buffer = BufferPagos()
+    filas = [_fila(pedido_id, f'caida-{i}') for i in range(3)]
+    for fila in filas:
+        buffer.agregar(fila)
+
+    def falla(*args, **kwargs):
+        raise OperationalError('INSERT', {}, Exception('sin conexión'))
+
+    monkeypatch.setattr(db.session, 'execute', falla)
+    with pytest.raises(OperationalError):
+        buffer.vaciar()
+    monkeypatch.undo()
+
+    assert buffer.pendientes() == 3
+    assert list(buffer._filas) == filas  # mismo orden para el siguiente intento
+    assert buffer.vaciar() == 3
+
+
+def test_buffer_lleno_descarta_las_mas_viejas_y_las_cuenta(pedido_id, monkeypatch):
+    monkeypatch.setattr(pagos, 'PAGOS_MAX_EN_BUFFER', 3)
+    buffer = BufferPagos()
+    for i in range(5):
+        buffer.agregar(_fila(pedido_id, f'lleno-{i}'))
+
+    assert buffer.descartadas == 2
+    assert [fila['referencia'] for fila in buffer._filas] == ['lleno-2', 'lleno-3', 'lleno-4']